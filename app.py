@@ -4,18 +4,34 @@ DICOM Fabricator Flask Web Application
 Copyright (c) 2025 Christopher Gentle <chris@flatmapit.com>
 """
 
-from flask import Flask, render_template, request, jsonify, send_file, send_from_directory, make_response, session, redirect, url_for, flash
+from flask import Flask, Request, Response, stream_with_context, render_template, request, jsonify, send_file, send_from_directory, make_response, session, redirect, url_for, flash
 from flask_cors import CORS
+from flask.json.provider import DefaultJSONProvider
 import os
 import sys
+import platform
 import json
-import base64
+import hashlib
+import logging
+import codecs
 import csv
+import re
 from pathlib import Path
 from datetime import datetime, timedelta
 import io
 import threading
 import time
+import tempfile
+import shlex
+import shutil
+import subprocess
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from operator import attrgetter, itemgetter
+from types import MappingProxyType
+from dataclasses import dataclass, field
+from functools import lru_cache
 
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
 
@@ -25,11 +41,64 @@ from src.pacs_config import PacsConfigManager
 from auth import auth_manager, login_required, permission_required, any_permission_required, get_current_user, login_user, logout_user, is_authenticated, User, RoleManager
 from enterprise_auth import get_enterprise_auth_manager
 from group_mapper import get_group_mapper
+from dicom_index import DicomIndex, iter_dicom_files, keyword_tags, tag_values
+from pacs_client import (
+    PYNETDICOM_AVAILABLE, AssociationError, PacsRequestError, association_pool, c_echo, c_find, c_move,
+    value_text
+)
 import pydicom
+from pydicom.dataset import Dataset
 from PIL import Image
 import numpy as np
+import requests
+try:
+    import orjson
+except ImportError:
+    orjson = None  # Responses fall back to the standard library encoder
+
+# Multipart uploads larger than this are written straight to a temporary file
+UPLOAD_SPOOL_THRESHOLD = 64 * 1024  # 64KB
+
+class StreamingRequest(Request):
+    """Request class that streams large form uploads to disk instead of RAM"""
+    
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if total_content_length is None or total_content_length > UPLOAD_SPOOL_THRESHOLD:
+            # Removed automatically when the upload is closed
+            return tempfile.TemporaryFile('wb+')
+        return io.BytesIO()
+
+class OrjsonProvider(DefaultJSONProvider):
+    """JSON provider that encodes with orjson.
+    
+    Only dumps() is overridden, so jsonify() responses keep the default
+    provider's formatting - sorted keys, compact unless in debug mode, dates
+    formatted by the default handler. Values orjson can't encode (e.g.
+    integers beyond 64 bits) go through the default provider.
+    """
+    
+    # json.dumps arguments the orjson path can honour; calls with any other
+    # argument go to the standard library encoder
+    ORJSON_DUMPS_ARGS = frozenset({'indent', 'separators', 'sort_keys', 'default', 'ensure_ascii'})
+    
+    def dumps(self, obj, **kwargs):
+        if (not kwargs.keys() <= self.ORJSON_DUMPS_ARGS or kwargs.get('indent') not in (None, 2)
+                or kwargs.get('separators') not in (None, (',', ':'))):
+            return super().dumps(obj, **kwargs)
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if kwargs.get('sort_keys', self.sort_keys):
+            option |= orjson.OPT_SORT_KEYS
+        if kwargs.get('indent'):
+            option |= orjson.OPT_INDENT_2
+        try:
+            return orjson.dumps(obj, default=kwargs.get('default', self.default), option=option).decode()
+        except TypeError:
+            return super().dumps(obj, **kwargs)
 
 app = Flask(__name__)
+app.request_class = StreamingRequest
+if orjson is not None:
+    app.json = OrjsonProvider(app)
 CORS(app)
 
 # Add security headers to prevent frame embedding
@@ -48,6 +117,17 @@ app.config['PERMANENT_SESSION_LIFETIME'] = 3600  # 1 hour
 UPLOAD_FOLDER = 'dicom_output'
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+app.config['SERIES_SCAN_WORKERS'] = int(os.environ.get('SERIES_SCAN_WORKERS', 16))  # Threads reading series UIDs before a PACS send
+
+# Diagnostic output of the request handlers, written as "DEBUG: ..." lines.
+# Debug records are only formatted when enabled with LOG_LEVEL=DEBUG, which
+# keeps them out of the per-line parsers and slow stdout writes by default
+logger = logging.getLogger(__name__)
+log_handler = logging.StreamHandler(sys.stdout)
+log_handler.setFormatter(logging.Formatter('%(levelname)s: %(message)s'))
+logger.addHandler(log_handler)
+logger.setLevel(os.environ.get('LOG_LEVEL', 'INFO').upper())
+logger.propagate = False
 
 patient_registry = PatientRegistry()
 fabricator = DICOMFabricator(patient_registry)
@@ -60,20 +140,127 @@ group_mapper = get_group_mapper()
 if not os.path.exists(UPLOAD_FOLDER):
     os.makedirs(UPLOAD_FOLDER)
 
+# Rendered PNG previews of DICOM images, keyed by source file path, mtime and size
+PREVIEW_FOLDER = 'previews'
+PREVIEW_RENDER_VERSION = 2  # Bump when rendering changes so cached previews are redrawn
+if not os.path.exists(PREVIEW_FOLDER):
+    os.makedirs(PREVIEW_FOLDER)
+
+# Cached previews not served for this long are removed. Previews of deleted
+# or regenerated files are never served again, so this is what clears them
+PREVIEW_MAX_AGE = 7 * 24 * 3600  # seconds
+PREVIEW_SWEEP_INTERVAL = 3600  # seconds
+
+def sweep_preview_cache():
+    """Delete cached previews last served more than PREVIEW_MAX_AGE ago"""
+    expired_before = time.time() - PREVIEW_MAX_AGE
+    with os.scandir(PREVIEW_FOLDER) as it:
+        for dir_entry in it:
+            try:
+                if dir_entry.stat().st_mtime < expired_before:
+                    os.unlink(dir_entry.path)
+            except OSError:
+                pass  # Removed by another request meanwhile
+
+def sweep_preview_cache_loop():
+    """Background thread body running sweep_preview_cache periodically"""
+    while True:
+        try:
+            sweep_preview_cache()
+        except Exception as e:
+            print(f"Error sweeping preview cache: {e}")
+        time.sleep(PREVIEW_SWEEP_INTERVAL)
+
+threading.Thread(target=sweep_preview_cache_loop, daemon=True).start()
+
+# Study generation runs on a background worker so requests don't block on it.
+# A single worker keeps patient registry updates serialised.
+generation_executor = ThreadPoolExecutor(max_workers=1)
+generation_jobs = {}  # job id -> (Future, submitting user id)
+
+# Seconds a finished async job is kept for its client to collect. Results a
+# client never polls for (closed tab, failed poll) are dropped after this
+JOB_RESULT_TTL = 600
+job_finished_at = {}  # job id -> monotonic time its Future completed
+jobs_lock = threading.Lock()
+
+def track_job(jobs, job_id, entry, future):
+    """Register an async job, noting when it finishes so it can be pruned"""
+    prune_finished_jobs(jobs)
+    with jobs_lock:
+        jobs[job_id] = entry
+    future.add_done_callback(lambda _: job_finished(jobs, job_id))
+
+def job_finished(jobs, job_id):
+    """Done callback of a tracked job's Future, starting its result TTL"""
+    with jobs_lock:
+        if job_id in jobs:  # Not already handed out
+            job_finished_at[job_id] = time.monotonic()
+
+def prune_finished_jobs(jobs):
+    """Drop jobs that finished more than JOB_RESULT_TTL seconds ago"""
+    expired_before = time.monotonic() - JOB_RESULT_TTL
+    with jobs_lock:
+        for job_id in [job_id for job_id in jobs if job_finished_at.get(job_id, expired_before) < expired_before]:
+            del jobs[job_id]
+            del job_finished_at[job_id]
+
+def discard_job(jobs, job_id):
+    """Forget a job once its result has been handed out"""
+    with jobs_lock:
+        jobs.pop(job_id, None)
+        job_finished_at.pop(job_id, None)
+
+# Network probes (C-ECHO) that a request runs side by side rather than one after another
+pacs_probe_executor = ThreadPoolExecutor(max_workers=4)
+
+# C-MOVEs requested in async mode. Each mostly waits on the source PACS, so
+# several run at once
+c_move_executor = ThreadPoolExecutor(max_workers=4)
+c_move_jobs = {}  # job id -> (Future, progress counts, submitting user id)
+
+# Seconds after a completed request over a pooled association during which
+# routing checks take the PACS as reachable instead of sending a C-ECHO
+ROUTING_CHECK_TTL = 60
+
+# Header index of generated DICOM files, kept fresh by a background thread
+dicom_index = DicomIndex(UPLOAD_FOLDER, manifest_path='data/dicom_index.json')
+dicom_index.start()
+
+# /api/pacs/status results are reused for a few seconds so pages polling it
+# don't send a C-ECHO per request
+PACS_STATUS_TTL = 5  # seconds
+pacs_status_cache = {}  # (aet, aec, host, port) -> (expires, response payload)
+
+# Successful /api/pacs/query responses are reused for a short time, since
+# pages re-issue the same query on refresh or when reopening a view. Entries
+# for a PACS are dropped when a study is stored or moved to it
+PACS_QUERY_TTL = 30  # seconds
+PACS_QUERY_CACHE_SIZE = 256
+pacs_query_cache = {}  # (pacs config id, query parameters) -> (expires, response payload)
+pacs_query_cache_lock = threading.Lock()
+
+@dataclass
+class UserActivity:
+    """Last user activity, measured on the monotonic clock so wall-clock jumps don't affect it"""
+    last_seen: float = field(default_factory=time.monotonic)
+    
+    def seconds_since(self) -> float:
+        return time.monotonic() - self.last_seen
+
 # Global variables for activity tracking
-last_user_activity = time.time()
+user_activity = UserActivity()
 user_activity_check_interval = 600  # 10 minutes
 active_testing_interval = 900  # 15 minutes when user is active
 inactive_testing_interval = 600  # 10 minutes when user is inactive
 
 def update_user_activity():
     """Update the last user activity timestamp"""
-    global last_user_activity
-    last_user_activity = time.time()
+    user_activity.last_seen = time.monotonic()
 
 def is_user_active():
     """Check if user has been active in the last 10 minutes"""
-    return (time.time() - last_user_activity) < user_activity_check_interval
+    return user_activity.seconds_since() < user_activity_check_interval
 
 def require_admin():
     """Check if current user has admin role"""
@@ -105,30 +292,40 @@ def require_environment_access(environment: str, access_type: str = 'read'):
 
 def auto_test_pacs_connections():
     """Automatically test all PACS connections based on user activity"""
+    # These never change while the app runs, so look them up once
+    # rather than on every pass through the loop
+    activity = user_activity
+    manager = pacs_manager
+    check_interval = user_activity_check_interval
+    active_interval = active_testing_interval
+    inactive_interval = inactive_testing_interval
+    sleep = time.sleep
+    stamp = time.strftime
+    
+    next_interval = inactive_interval
     while True:
         try:
-            current_time = time.time()
-            time_since_activity = current_time - last_user_activity
+            time_since_activity = activity.seconds_since()
             
-            # Determine if user is active
-            user_active = is_user_active()
+            # Determine if user is active (same check as is_user_active)
+            user_active = time_since_activity < check_interval
             
             if user_active:
-                print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] User active - Auto-testing PACS connections...")
-                next_interval = active_testing_interval
+                print(f"[{stamp('%Y-%m-%d %H:%M:%S')}] User active - Auto-testing PACS connections...")
+                next_interval = active_interval
             else:
-                print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] User inactive ({time_since_activity/60:.1f} min) - Skipping PACS test")
-                next_interval = inactive_testing_interval
+                print(f"[{stamp('%Y-%m-%d %H:%M:%S')}] User inactive ({time_since_activity/60:.1f} min) - Skipping PACS test")
+                next_interval = inactive_interval
             
             # Only test if user is active
             if user_active:
                 # Get all active PACS configurations
-                configs = pacs_manager.list_configs(active_only=True)
+                configs = manager.list_configs(active_only=True)
                 
                 for config in configs:
                     try:
                         print(f"  Testing {config.name} ({config.aec}@{config.host}:{config.port})...")
-                        result = pacs_manager.test_connection(config.id)
+                        result = manager.test_connection(config.id)
                         
                         if result['success']:
                             print(f"    ✓ {config.name}: Connection successful")
@@ -138,77 +335,71 @@ def auto_test_pacs_connections():
                     except Exception as e:
                         print(f"    ✗ {config.name}: Error during testing - {str(e)}")
                 
-                print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Auto-testing completed")
+                print(f"[{stamp('%Y-%m-%d %H:%M:%S')}] Auto-testing completed")
             
         except Exception as e:
-            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Error in auto-testing: {str(e)}")
+            print(f"[{stamp('%Y-%m-%d %H:%M:%S')}] Error in auto-testing: {str(e)}")
         
         # Wait for next interval
-        time.sleep(next_interval)
+        sleep(next_interval)
 
 # Start automatic PACS testing in background thread
 pacs_testing_thread = threading.Thread(target=auto_test_pacs_connections, daemon=True)
 pacs_testing_thread.start()
 
+# Endpoints that count as user activity for the PACS auto-testing thread
+ACTIVITY_ENDPOINTS = frozenset({
+    'index', 'patients_page', 'generator_page', 'pacs_page', 'query_pacs_page', 'users_page',
+    'list_pacs_configs', 'get_store_enabled_pacs', 'get_pacs_stats', 'query_pacs'
+})
+
+@app.before_request
+def track_user_activity():
+    """Record user activity once per request instead of in every view"""
+    if request.endpoint in ACTIVITY_ENDPOINTS and is_authenticated():
+        update_user_activity()
+
+@app.context_processor
+def inject_auth_context():
+    """Make auth state available to every template without passing it explicitly"""
+    return {
+        'auth_enabled': auth_manager.is_auth_enabled(),
+        'current_user': get_current_user()
+    }
+
 @app.route('/')
 @login_required
 def index():
-    # Update user activity
-    update_user_activity()
-    return render_template('query_pacs.html', 
-                         auth_enabled=auth_manager.is_auth_enabled(),
-                         current_user=get_current_user())
+    return render_template('query_pacs.html')
 
 @app.route('/patients')
 @login_required
 def patients_page():
-    # Update user activity
-    update_user_activity()
-    return render_template('patients.html',
-                         auth_enabled=auth_manager.is_auth_enabled(),
-                         current_user=get_current_user())
+    return render_template('patients.html')
 
 @app.route('/generator')
 @login_required
 def generator_page():
-    # Update user activity
-    update_user_activity()
-    return render_template('generator.html',
-                         auth_enabled=auth_manager.is_auth_enabled(),
-                         current_user=get_current_user())
-
+    return render_template('generator.html')
 
 @app.route('/pacs')
 @login_required
 def pacs_page():
-    # Update user activity
-    update_user_activity()
-    return render_template('pacs.html',
-                         auth_enabled=auth_manager.is_auth_enabled(),
-                         current_user=get_current_user())
+    return render_template('pacs.html')
 
 @app.route('/query-pacs')
 @login_required
 def query_pacs_page():
-    # Update user activity
-    update_user_activity()
-    return render_template('query_pacs.html',
-                         auth_enabled=auth_manager.is_auth_enabled(),
-                         current_user=get_current_user())
+    return render_template('query_pacs.html')
 
 @app.route('/users')
 @login_required
 def users_page():
-    # Update user activity
-    update_user_activity()
-    
     # Check admin access
     if not require_admin():
         flash('Admin access required to view user management', 'error')
         return redirect(url_for('index'))
-    return render_template('users.html',
-                         auth_enabled=auth_manager.is_auth_enabled(),
-                         current_user=get_current_user())
+    return render_template('users.html')
 
 # Authentication routes
 @app.route('/login', methods=['GET', 'POST'])
@@ -216,7 +407,6 @@ def login():
     """Login page and authentication"""
     if request.method == 'GET':
         return render_template('login.html',
-                             auth_enabled=auth_manager.is_auth_enabled(),
                              enterprise_auth_enabled=auth_manager.is_enterprise_auth_enabled(),
                              saml_enabled=enterprise_auth_manager.is_method_enabled('saml'),
                              ad_enabled=enterprise_auth_manager.is_method_enabled('ad'))
@@ -505,7 +695,7 @@ def export_patients_csv():
     # Create response
     response = make_response(output.getvalue())
     response.headers['Content-Type'] = 'text/csv'
-    response.headers['Content-Disposition'] = f'attachment; filename=patients_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
+    response.headers['Content-Disposition'] = f'attachment; filename=patients_{time.strftime("%Y%m%d_%H%M%S")}.csv'
     
     return response
 
@@ -521,7 +711,6 @@ def create_patient():
     
     # Create patient record directly
     from src.patient_config import PatientRecord
-    from datetime import datetime
     
     patient = PatientRecord(
         patient_id=patient_id,
@@ -606,7 +795,7 @@ def batch_delete_patients():
     """Delete multiple patients at once"""
     try:
         patient_ids = request.json.get('patient_ids', [])
-        print(f"DEBUG: Received batch delete request for IDs: {patient_ids}")
+        logger.debug("Received batch delete request for IDs: %s", patient_ids)
         
         if not patient_ids:
             return jsonify({'error': 'No patient IDs provided'}), 400
@@ -620,20 +809,20 @@ def batch_delete_patients():
                 if patient_id in patient_registry.patients:
                     del patient_registry.patients[patient_id]
                     deleted_count += 1
-                    print(f"DEBUG: Deleted patient {patient_id}")
+                    logger.debug("Deleted patient %s", patient_id)
                 else:
                     not_found_count += 1
-                    print(f"DEBUG: Patient {patient_id} not found")
+                    logger.debug("Patient %s not found", patient_id)
             except Exception as e:
                 errors.append(f"Error deleting patient {patient_id}: {str(e)}")
-                print(f"DEBUG: Error deleting patient {patient_id}: {str(e)}")
+                logger.debug("Error deleting patient %s: %s", patient_id, e)
         
         if deleted_count > 0:
             try:
                 patient_registry.save_registry()
-                print("DEBUG: Successfully saved patient registry")
+                logger.debug("Successfully saved patient registry")
             except Exception as e:
-                print(f"DEBUG: Error saving registry: {str(e)}")
+                logger.debug("Error saving registry: %s", e)
                 return jsonify({'error': f'Error saving changes: {str(e)}'}), 500
         
         result = {
@@ -646,12 +835,12 @@ def batch_delete_patients():
         if errors:
             result['errors'] = errors
         
-        print(f"DEBUG: Returning result: {result}")
+        logger.debug("Returning result: %s", result)
         return jsonify(result)
         
     except Exception as e:
         error_msg = f'Unexpected error in batch delete: {str(e)}'
-        print(f"DEBUG: {error_msg}")
+        logger.debug("%s", error_msg)
         return jsonify({'error': error_msg}), 500
 
 @app.route('/api/patients/search', methods=['POST'])
@@ -721,7 +910,7 @@ def generate_dicom():
         else:
             patient_name_param = None
         
-        result = fabricator.create_dx_dicom_study(
+        study_kwargs = dict(
             patient_name=patient_name_param,
             patient_id=patient_id if patient_id else None,
             accession=accession if accession else None,
@@ -731,173 +920,289 @@ def generate_dicom():
             output_dir=str(output_dir)
         )
         
-        return jsonify({
-            'success': True,
-            'study': result,
-            'message': f'Generated study with {len(result["series"])} series ({sum(len(s["files"]) for s in result["series"])} total images)'
-        })
+        # Async mode: queue the work and let the client poll /api/generate/<job_id>
+        if data.get('async'):
+            job_id = str(uuid.uuid4())
+            future = generation_executor.submit(generate_study, study_kwargs)
+            track_job(generation_jobs, job_id, (future, session.get('user_id')), future)
+            return jsonify({'success': True, 'status': 'pending', 'job_id': job_id}), 202
+        
+        return jsonify(generate_study(study_kwargs))
         
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/generate/<job_id>', methods=['GET'])
+@login_required
+def get_generation_job(job_id):
+    """Get the status or result of a queued generation job"""
+    prune_finished_jobs(generation_jobs)
+    job = generation_jobs.get(job_id)
+    # Jobs are only visible to the user who submitted them
+    if job is None or job[1] != session.get('user_id'):
+        return jsonify({'success': False, 'error': 'Generation job not found'}), 404
+    
+    future, _ = job
+    if not future.done():
+        return jsonify({'success': True, 'status': 'pending', 'job_id': job_id})
+    
+    # Finished jobs are handed out once
+    discard_job(generation_jobs, job_id)
+    try:
+        return jsonify({**future.result(), 'status': 'completed'})
+    except Exception as e:
+        return jsonify({'success': False, 'status': 'failed', 'error': str(e)}), 500
+
+def generate_study(study_kwargs):
+    """Generate a study with the fabricator and build the API response payload"""
+    result = fabricator.create_dx_dicom_study(**study_kwargs)
+    dicom_index.invalidate()
+    
+    return {
+        'success': True,
+        'study': result,
+        'message': f'Generated study with {len(result["series"])} series ({sum(len(s["files"]) for s in result["series"])} total images)'
+    }
+
 @app.route('/api/dicom/list', methods=['GET'])
 def list_dicom_files():
     """List all DICOM files (including those in series subdirectories)"""
-    output_dir = Path(app.config['UPLOAD_FOLDER'])
     files = []
     
-    if output_dir.exists():
-        # Search recursively for all DICOM files
-        for dcm_file in output_dir.rglob('*.dcm'):
-            try:
-                ds = pydicom.dcmread(str(dcm_file))
-                # Get creation time from file stats
-                creation_time = datetime.fromtimestamp(dcm_file.stat().st_ctime)
-                created_compact = creation_time.strftime('%Y%m%d%H%M%S')
-                
-                # Get relative path for display
-                relative_path = dcm_file.relative_to(output_dir)
-                display_filename = str(relative_path) if relative_path.parent != Path('.') else dcm_file.name
-                
-                files.append({
-                    'filename': dcm_file.name,
-                    'filepath': str(relative_path),
-                    'full_path': str(dcm_file),
-                    'display_name': display_filename,
-                    'patient_name': str(getattr(ds, 'PatientName', 'Unknown')),
-                    'patient_id': str(getattr(ds, 'PatientID', 'Unknown')),
-                    'study_date': str(getattr(ds, 'StudyDate', 'Unknown')),
-                    'study_description': str(getattr(ds, 'StudyDescription', 'Unknown')),
-                    'series_description': str(getattr(ds, 'SeriesDescription', 'Unknown')),
-                    'series_number': str(getattr(ds, 'SeriesNumber', 'Unknown')),
-                    'instance_number': str(getattr(ds, 'InstanceNumber', 'Unknown')),
-                    'modality': str(getattr(ds, 'Modality', 'Unknown')),
-                    'accession_number': str(getattr(ds, 'AccessionNumber', 'Unknown')),
-                    'study_instance_uid': str(getattr(ds, 'StudyInstanceUID', 'Unknown')),
-                    'size': dcm_file.stat().st_size,
-                    'created': created_compact,
-                    'created_iso': creation_time.isoformat(),
-                    'modified': datetime.fromtimestamp(dcm_file.stat().st_mtime).isoformat()
-                })
-            except Exception as e:
-                files.append({
-                    'filename': dcm_file.name,
-                    'filepath': str(dcm_file.relative_to(output_dir)) if dcm_file.is_relative_to(output_dir) else str(dcm_file),
-                    'error': str(e)
-                })
+    for entry in dicom_index.entries():
+        dcm_file = entry.path
+        relative_path = entry.relative_path
+        
+        if entry.error:
+            files.append({
+                'filename': dcm_file.name,
+                'filepath': str(relative_path),
+                'error': entry.error
+            })
+            continue
+        
+        tags = entry.tags
+        
+        # Get relative path for display
+        display_filename = str(relative_path) if relative_path.parent != Path('.') else dcm_file.name
+        
+        files.append({
+            'filename': dcm_file.name,
+            'filepath': str(relative_path),
+            'full_path': str(dcm_file),
+            'display_name': display_filename,
+            'patient_name': tags.get('PatientName', 'Unknown'),
+            'patient_id': tags.get('PatientID', 'Unknown'),
+            'study_date': tags.get('StudyDate', 'Unknown'),
+            'study_description': tags.get('StudyDescription', 'Unknown'),
+            'series_description': tags.get('SeriesDescription', 'Unknown'),
+            'series_number': tags.get('SeriesNumber', 'Unknown'),
+            'instance_number': tags.get('InstanceNumber', 'Unknown'),
+            'modality': tags.get('Modality', 'Unknown'),
+            'accession_number': tags.get('AccessionNumber', 'Unknown'),
+            'study_instance_uid': tags.get('StudyInstanceUID', 'Unknown'),
+            'size': entry.st_size,
+            'created': entry.created_compact,
+            'created_iso': entry.created_iso,
+            'modified': entry.modified_iso
+        })
     
     return jsonify(files)
 
-@app.route('/api/dicom/tree', methods=['GET'])
-def list_dicom_tree():
-    """List DICOM files organized as hierarchical tree structure"""
-    output_dir = Path(app.config['UPLOAD_FOLDER'])
-    studies = {}
+def iter_dicom_tree_records(entries):
+    """Yield flat study/series/image records for the given DICOM index entries.
     
-    if output_dir.exists():
-        # Search recursively for all DICOM files
-        for dcm_file in output_dir.rglob('*.dcm'):
-            try:
-                ds = pydicom.dcmread(str(dcm_file))
-                
-                # Get key identifiers
-                study_uid = str(getattr(ds, 'StudyInstanceUID', 'Unknown'))
-                series_uid = str(getattr(ds, 'SeriesInstanceUID', 'Unknown'))
-                instance_uid = str(getattr(ds, 'SOPInstanceUID', 'Unknown'))
-                
-                # Get relative path for display
-                relative_path = dcm_file.relative_to(output_dir)
-                creation_time = datetime.fromtimestamp(dcm_file.stat().st_ctime)
-                
-                # Create study entry if not exists
-                if study_uid not in studies:
-                    studies[study_uid] = {
-                        'id': study_uid,
-                        'type': 'study',
-                        'label': f"{getattr(ds, 'PatientName', 'Unknown Patient')} - {getattr(ds, 'StudyDescription', 'Unknown Study')}",
-                        'patient_name': str(getattr(ds, 'PatientName', 'Unknown')),
-                        'patient_id': str(getattr(ds, 'PatientID', 'Unknown')),
-                        'study_date': str(getattr(ds, 'StudyDate', 'Unknown')),
-                        'study_time': str(getattr(ds, 'StudyTime', 'Unknown')),
-                        'study_description': str(getattr(ds, 'StudyDescription', 'Unknown')),
-                        'modality': str(getattr(ds, 'Modality', 'Unknown')),
-                        'created_iso': creation_time.isoformat(),
-                        'series': {},
-                        'searchable': f"{getattr(ds, 'PatientName', '')} {getattr(ds, 'PatientID', '')} {getattr(ds, 'StudyDescription', '')} {getattr(ds, 'StudyDate', '')}".lower()
-                    }
-                
-                # Create series entry if not exists
-                if series_uid not in studies[study_uid]['series']:
-                    studies[study_uid]['series'][series_uid] = {
-                        'id': series_uid,
-                        'type': 'series',
-                        'label': f"Series {getattr(ds, 'SeriesNumber', '?')}: {getattr(ds, 'SeriesDescription', 'Unknown Series')}",
-                        'series_number': str(getattr(ds, 'SeriesNumber', 'Unknown')),
-                        'series_description': str(getattr(ds, 'SeriesDescription', 'Unknown')),
-                        'modality': str(getattr(ds, 'Modality', 'Unknown')),
-                        'images': {},
-                        'searchable': f"{getattr(ds, 'SeriesDescription', '')} {getattr(ds, 'SeriesNumber', '')} {getattr(ds, 'Modality', '')}".lower()
-                    }
-                
-                # Add image entry
-                studies[study_uid]['series'][series_uid]['images'][instance_uid] = {
-                    'id': instance_uid,
-                    'type': 'image',
-                    'label': f"Image {getattr(ds, 'InstanceNumber', '?')} ({dcm_file.name})",
-                    'filename': dcm_file.name,
-                    'filepath': str(relative_path),
-                    'full_path': str(dcm_file),
-                    'instance_number': str(getattr(ds, 'InstanceNumber', 'Unknown')),
-                    'size': dcm_file.stat().st_size,
-                    'created_iso': creation_time.isoformat(),
-                    'searchable': f"{dcm_file.name} {getattr(ds, 'InstanceNumber', '')}".lower()
-                }
-                
-            except Exception as e:
-                # Handle files that can't be read as DICOM
-                relative_path = dcm_file.relative_to(output_dir) if dcm_file.is_relative_to(output_dir) else dcm_file
-                creation_time = datetime.fromtimestamp(dcm_file.stat().st_ctime)
-                error_uid = f"error_{dcm_file.name}"
-                
-                if error_uid not in studies:
-                    studies[error_uid] = {
+    Each study and series is emitted once, the first time it is seen, followed by
+    one record per image. Records reference their parents by id so a client can
+    assemble the tree without the server holding the whole hierarchy in memory.
+    """
+    seen_studies = set()
+    seen_series = set()
+    
+    for entry in entries:
+        dcm_file = entry.path
+        relative_path = entry.relative_path
+        
+        if entry.error:
+            # Handle files that can't be read as DICOM
+            error_uid = f"error_{dcm_file.name}"
+            error_series_uid = f"error_series_{dcm_file.parent.name}"
+            
+            if error_uid not in seen_studies:
+                seen_studies.add(error_uid)
+                yield {
+                    'type': 'study',
+                    'id': error_uid,
+                    'label': "Error Files",
+                    'data': {
                         'id': error_uid,
                         'type': 'study',
-                        'label': f"Error Files",
+                        'label': "Error Files",
                         'patient_name': 'Error',
                         'patient_id': 'Error',
                         'study_description': 'Files that could not be read',
-                        'created_iso': creation_time.isoformat(),
-                        'series': {},
+                        'created_iso': entry.created_iso,
                         'searchable': 'error files'
                     }
-                
-                error_series_uid = f"error_series_{dcm_file.parent.name}"
-                if error_series_uid not in studies[error_uid]['series']:
-                    studies[error_uid]['series'][error_series_uid] = {
+                }
+            
+            if (error_uid, error_series_uid) not in seen_series:
+                seen_series.add((error_uid, error_series_uid))
+                yield {
+                    'type': 'series',
+                    'id': error_series_uid,
+                    'study_id': error_uid,
+                    'label': "Error Files",
+                    'data': {
                         'id': error_series_uid,
                         'type': 'series',
-                        'label': f"Error Files",
-                        'series_description': f"Error reading files",
-                        'images': {},
+                        'label': "Error Files",
+                        'series_description': "Error reading files",
                         'searchable': 'error'
                     }
-                
-                studies[error_uid]['series'][error_series_uid]['images'][dcm_file.name] = {
+                }
+            
+            yield {
+                'type': 'image',
+                'id': dcm_file.name,
+                'study_id': error_uid,
+                'series_id': error_series_uid,
+                'label': f"{dcm_file.name} (Error)",
+                'data': {
                     'id': dcm_file.name,
                     'type': 'image',
                     'label': f"{dcm_file.name} (Error)",
                     'filename': dcm_file.name,
                     'filepath': str(relative_path),
-                    'error': str(e),
-                    'size': dcm_file.stat().st_size,
-                    'created_iso': creation_time.isoformat(),
+                    'error': entry.error,
+                    'size': entry.st_size,
+                    'created_iso': entry.created_iso,
                     'searchable': f"{dcm_file.name} error".lower()
                 }
+            }
+            continue
+        
+        tags = entry.tags
+        
+        # Get key identifiers
+        study_uid = tags.get('StudyInstanceUID', 'Unknown')
+        series_uid = tags.get('SeriesInstanceUID', 'Unknown')
+        instance_uid = tags.get('SOPInstanceUID', 'Unknown')
+        
+        if study_uid not in seen_studies:
+            seen_studies.add(study_uid)
+            label = f"{tags.get('PatientName', 'Unknown Patient')} - {tags.get('StudyDescription', 'Unknown Study')}"
+            yield {
+                'type': 'study',
+                'id': study_uid,
+                'label': label,
+                'data': {
+                    'id': study_uid,
+                    'type': 'study',
+                    'label': label,
+                    'patient_name': tags.get('PatientName', 'Unknown'),
+                    'patient_id': tags.get('PatientID', 'Unknown'),
+                    'study_date': tags.get('StudyDate', 'Unknown'),
+                    'study_time': tags.get('StudyTime', 'Unknown'),
+                    'study_description': tags.get('StudyDescription', 'Unknown'),
+                    'modality': tags.get('Modality', 'Unknown'),
+                    'created_iso': entry.created_iso,
+                    'searchable': f"{tags.get('PatientName', '')} {tags.get('PatientID', '')} {tags.get('StudyDescription', '')} {tags.get('StudyDate', '')}".lower()
+                }
+            }
+        
+        if (study_uid, series_uid) not in seen_series:
+            seen_series.add((study_uid, series_uid))
+            label = f"Series {tags.get('SeriesNumber', '?')}: {tags.get('SeriesDescription', 'Unknown Series')}"
+            yield {
+                'type': 'series',
+                'id': series_uid,
+                'study_id': study_uid,
+                'label': label,
+                'data': {
+                    'id': series_uid,
+                    'type': 'series',
+                    'label': label,
+                    'series_number': tags.get('SeriesNumber', 'Unknown'),
+                    'series_description': tags.get('SeriesDescription', 'Unknown'),
+                    'modality': tags.get('Modality', 'Unknown'),
+                    'searchable': f"{tags.get('SeriesDescription', '')} {tags.get('SeriesNumber', '')} {tags.get('Modality', '')}".lower()
+                }
+            }
+        
+        label = f"Image {tags.get('InstanceNumber', '?')} ({dcm_file.name})"
+        yield {
+            'type': 'image',
+            'id': instance_uid,
+            'study_id': study_uid,
+            'series_id': series_uid,
+            'label': label,
+            'data': {
+                'id': instance_uid,
+                'type': 'image',
+                'label': label,
+                'filename': dcm_file.name,
+                'filepath': str(relative_path),
+                'full_path': str(dcm_file),
+                'instance_number': tags.get('InstanceNumber', 'Unknown'),
+                'size': entry.st_size,
+                'created_iso': entry.created_iso,
+                'searchable': f"{dcm_file.name} {tags.get('InstanceNumber', '')}".lower()
+            }
+        }
+
+def tree_sort_number(value, default=999):
+    """Integer used to order series and images in the tree; non-numeric values sort last"""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+def series_sort_key(series):
+    return tree_sort_number(series.get('series_number', 999))
+
+def image_sort_key(image):
+    return tree_sort_number(image.get('instance_number', 999))
+
+@app.route('/api/dicom/tree', methods=['GET'])
+def list_dicom_tree():
+    """List DICOM files organized as hierarchical tree structure.
+    
+    With ?format=ndjson the flat records from iter_dicom_tree_records are streamed
+    one JSON object per line, followed by a final 'stats' record, and the client
+    assembles the tree itself.
+    """
+    if request.args.get('format') == 'ndjson':
+        def generate():
+            stats = {'total_studies': 0, 'total_series': 0, 'total_images': 0, 'error_files': 0}
+            for record in iter_dicom_tree_records(dicom_index.entries()):
+                if record['type'] == 'study':
+                    if record['id'].startswith('error_'):
+                        stats['error_files'] += 1
+                    else:
+                        stats['total_studies'] += 1
+                elif record['type'] == 'series':
+                    if not record['study_id'].startswith('error_'):
+                        stats['total_series'] += 1
+                else:
+                    stats['total_images'] += 1
+                yield json.dumps(record) + '\n'
+            yield json.dumps({'type': 'stats', 'stats': stats}) + '\n'
+        
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    
+    studies = {}
+    for record in iter_dicom_tree_records(dicom_index.entries()):
+        if record['type'] == 'study':
+            studies[record['id']] = {**record['data'], 'series': {}}
+        elif record['type'] == 'series':
+            studies[record['study_id']]['series'][record['id']] = {**record['data'], 'images': {}}
+        else:
+            studies[record['study_id']]['series'][record['series_id']]['images'][record['id']] = record['data']
     
     # Convert to hierarchical list format for tosijs tree
     tree_data = []
-    for study in sorted(studies.values(), key=lambda x: x.get('created_iso', ''), reverse=True):
+    for study in sorted(studies.values(), key=itemgetter('created_iso'), reverse=True):
         study_node = {
             'id': study['id'],
             'type': 'study',
@@ -906,7 +1211,7 @@ def list_dicom_tree():
             'children': []
         }
         
-        for series in sorted(study['series'].values(), key=lambda x: int(x.get('series_number', 999))):
+        for series in sorted(study['series'].values(), key=series_sort_key):
             series_node = {
                 'id': series['id'],
                 'type': 'series',
@@ -915,7 +1220,7 @@ def list_dicom_tree():
                 'children': []
             }
             
-            for image in sorted(series['images'].values(), key=lambda x: int(x.get('instance_number', 999))):
+            for image in sorted(series['images'].values(), key=image_sort_key):
                 image_node = {
                     'id': image['id'],
                     'type': 'image',
@@ -939,12 +1244,28 @@ def list_dicom_tree():
         }
     })
 
+class CsvLineBuffer:
+    """Write-only file stand-in that hands each CSV line straight back to the caller"""
+    
+    def write(self, value):
+        return value
+
+# Columns of the local DICOM files CSV export. Declared up front so rows for
+# unreadable files share the same header as the regular rows.
+DICOM_CSV_FIELDS = (
+    'filename', 'filepath', 'full_path', 'display_name', 'patient_name', 'patient_id',
+    'study_date', 'study_description', 'series_description', 'series_number',
+    'instance_number', 'modality', 'accession_number', 'study_instance_uid',
+    'size', 'created', 'created_iso', 'modified', 'error'
+)
+
 @app.route('/api/dicom/export/csv', methods=['GET', 'POST'])
 def export_dicom_csv():
-    """Export DICOM files list or PACS query results to CSV"""
-    import csv
-    from io import StringIO
+    """Export DICOM files list or PACS query results to CSV.
     
+    Rows are streamed to the client as they are produced instead of being
+    built up in memory first.
+    """
     if request.method == 'POST':
         # Handle PACS query results export
         data = request.json
@@ -952,96 +1273,139 @@ def export_dicom_csv():
         
         if not results:
             return jsonify({'error': 'No results to export'}), 400
-            
-        # Create CSV content
-        output = StringIO()
         
-        # Determine columns from first result
-        if results:
-            fieldnames = list(results[0].keys())
-            writer = csv.DictWriter(output, fieldnames=fieldnames, lineterminator='\n')
-            writer.writeheader()
-            writer.writerows(results)
+        # Columns are the keys of every result, in first-seen order - results
+        # only carry the attributes the PACS returned, so rows can differ.
+        # Collected up front since the header is sent before any row.
+        fieldnames = list(dict.fromkeys(key for row in results for key in row))
         
-        csv_content = output.getvalue()
-        output.close()
+        def generate_results():
+            writer = csv.DictWriter(CsvLineBuffer(), fieldnames=fieldnames, restval='', lineterminator='\n')
+            yield writer.writeheader()
+            for row in results:
+                yield writer.writerow(row)
         
         # Return CSV as downloadable file
-        response = make_response(csv_content)
-        response.headers['Content-Type'] = 'text/csv'
-        response.headers['Content-Disposition'] = 'attachment; filename=pacs_query_results.csv'
-        return response
+        return Response(
+            stream_with_context(generate_results()),
+            mimetype='text/csv',
+            headers={'Content-Disposition': 'attachment; filename=pacs_query_results.csv'}
+        )
     
-    else:
-        # Handle local DICOM files export (GET request)
-        output_dir = Path(app.config['UPLOAD_FOLDER'])
-        files = []
-        
-        if output_dir.exists():
-            # Search recursively for all DICOM files
-            for dcm_file in output_dir.rglob('*.dcm'):
-                try:
-                    ds = pydicom.dcmread(str(dcm_file))
-                    creation_time = datetime.fromtimestamp(dcm_file.stat().st_ctime)
-                    created_compact = creation_time.strftime('%Y%m%d%H%M%S')
-                    
-                    # Get relative path for display
-                    relative_path = dcm_file.relative_to(output_dir)
-                    display_filename = str(relative_path) if relative_path.parent != Path('.') else dcm_file.name
-                    
-                    files.append({
-                        'filename': dcm_file.name,
-                        'filepath': str(relative_path),
-                        'full_path': str(dcm_file),
-                        'display_name': display_filename,
-                        'patient_name': str(getattr(ds, 'PatientName', 'Unknown')),
-                        'patient_id': str(getattr(ds, 'PatientID', 'Unknown')),
-                        'study_date': str(getattr(ds, 'StudyDate', 'Unknown')),
-                        'study_description': str(getattr(ds, 'StudyDescription', 'Unknown')),
-                        'series_description': str(getattr(ds, 'SeriesDescription', 'Unknown')),
-                        'series_number': str(getattr(ds, 'SeriesNumber', 'Unknown')),
-                        'instance_number': str(getattr(ds, 'InstanceNumber', 'Unknown')),
-                        'modality': str(getattr(ds, 'Modality', 'Unknown')),
-                        'accession_number': str(getattr(ds, 'AccessionNumber', 'Unknown')),
-                        'study_instance_uid': str(getattr(ds, 'StudyInstanceUID', 'Unknown')),
-                        'size': dcm_file.stat().st_size,
-                        'created': created_compact,
-                        'created_iso': creation_time.isoformat(),
-                        'modified': datetime.fromtimestamp(dcm_file.stat().st_mtime).isoformat()
-                    })
-                except Exception as e:
-                    files.append({
-                        'created': '',
-                        'filename': dcm_file.name,
-                        'filepath': str(dcm_file.relative_to(output_dir)) if dcm_file.is_relative_to(output_dir) else str(dcm_file),
-                        'display_name': dcm_file.name,
-                        'patient_name': 'ERROR',
-                        'patient_id': 'ERROR',
-                        'study_date': 'ERROR',
-                        'study_description': 'ERROR',
-                        'series_description': 'ERROR',
-                        'series_number': 'ERROR',
-                        'instance_number': 'ERROR',
-                        'modality': 'ERROR',
-                        'size_kb': 0,
-                    'created_iso': '',
-                    'modified_iso': '',
-                    'error': str(e)
-                })
+    # Handle local DICOM files export (GET request)
+    def generate_files():
+        writer = csv.writer(CsvLineBuffer(), lineterminator='\n')
+        yield writer.writerow(DICOM_CSV_FIELDS)
+        
+        # Rows are built as tuples in DICOM_CSV_FIELDS order
+        for entry in dicom_index.entries():
+            dcm_file = entry.path
+            relative_path = entry.relative_path
+            
+            if entry.error:
+                row = (
+                    dcm_file.name, str(relative_path), '', dcm_file.name,
+                    'ERROR', 'ERROR', 'ERROR', 'ERROR', 'ERROR', 'ERROR', 'ERROR', 'ERROR',
+                    '', '', 0, '', '', '', entry.error
+                )
+            else:
+                tags = entry.tags
+                
+                # Get relative path for display
+                display_filename = str(relative_path) if relative_path.parent != Path('.') else dcm_file.name
+                
+                row = (
+                    dcm_file.name,
+                    str(relative_path),
+                    str(dcm_file),
+                    display_filename,
+                    tags.get('PatientName', 'Unknown'),
+                    tags.get('PatientID', 'Unknown'),
+                    tags.get('StudyDate', 'Unknown'),
+                    tags.get('StudyDescription', 'Unknown'),
+                    tags.get('SeriesDescription', 'Unknown'),
+                    tags.get('SeriesNumber', 'Unknown'),
+                    tags.get('InstanceNumber', 'Unknown'),
+                    tags.get('Modality', 'Unknown'),
+                    tags.get('AccessionNumber', 'Unknown'),
+                    tags.get('StudyInstanceUID', 'Unknown'),
+                    entry.st_size,
+                    entry.created_compact,
+                    entry.created_iso,
+                    entry.modified_iso,
+                    ''
+                )
+            yield writer.writerow(row)
     
-        # Create CSV content  
-        output = StringIO()
-        if files:
-            writer = csv.DictWriter(output, fieldnames=files[0].keys(), lineterminator='\n')
-            writer.writeheader()
-            writer.writerows(files)
+    return Response(
+        stream_with_context(generate_files()),
+        mimetype='text/csv',
+        headers={'Content-Disposition': f'attachment; filename=dicom_files_{time.strftime("%Y%m%d_%H%M%S")}.csv'}
+    )
+
+def preview_cache_path(filepath):
+    """Location of the cached PNG preview for a DICOM file.
     
-    # Create response
-    response = make_response(output.getvalue())
-    response.headers['Content-Type'] = 'text/csv'
-    response.headers['Content-Disposition'] = f'attachment; filename=dicom_files_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
+    The name includes the file's mtime and size, so a rewritten file gets a
+    fresh preview.
+    """
+    stat_result = filepath.stat()
+    cache_key = hashlib.blake2b(
+        f"{PREVIEW_RENDER_VERSION}|{filepath.resolve()}|{stat_result.st_mtime_ns}|{stat_result.st_size}".encode(),
+        digest_size=16
+    ).hexdigest()
+    return Path(PREVIEW_FOLDER) / f"{cache_key}.png"
+
+def get_preview_path(filepath):
+    """Path of the PNG preview of a DICOM image, rendering it on first use.
     
-    return response
+    Returns None if the file has no pixel data.
+    """
+    cache_path = preview_cache_path(filepath)
+    try:
+        os.utime(cache_path)  # Mark as recently served, so the sweep keeps it
+        return cache_path
+    except FileNotFoundError:
+        pass
+    
+    ds = pydicom.dcmread(str(filepath))
+    if 'PixelData' not in ds:
+        return None
+    pixel_array = ds.pixel_array
+    
+    # Normalize to 8-bit, scaling a single float32 copy in place. 8-bit data
+    # is used as-is, without scanning it for its range
+    if pixel_array.dtype != np.uint8:
+        low = pixel_array.min()
+        value_range = float(pixel_array.max()) - float(low)
+        scaled = np.subtract(pixel_array, low, dtype=np.float32)
+        scaled *= 255.0 / value_range if value_range else 0.0
+        pixel_array = scaled.astype(np.uint8)
+    
+    # MONOCHROME1 stores low values as white - flip it so it displays like MONOCHROME2
+    if ds.get('PhotometricInterpretation') == 'MONOCHROME1':
+        pixel_array = np.invert(pixel_array, out=pixel_array if pixel_array.flags.writeable else None)
+    
+    # Convert to PIL Image
+    img = Image.fromarray(pixel_array)
+    
+    # Fast PNG compression - encoding dominates the request time, and previews
+    # are only sent to the local browser. Written under a temporary name so
+    # concurrent viewers never read a partial file
+    tmp_path = cache_path.with_suffix(f'.{uuid.uuid4().hex}.tmp')
+    img.save(tmp_path, format="PNG", compress_level=1)
+    os.replace(tmp_path, cache_path)
+    return cache_path
+
+# Attributes returned as metadata by the viewer endpoint
+VIEW_METADATA_FIELDS = (
+    'PatientName', 'PatientID', 'PatientBirthDate', 'PatientSex',
+    'StudyDate', 'StudyTime', 'StudyDescription', 'SeriesDescription',
+    'SeriesNumber', 'InstanceNumber', 'AccessionNumber', 'Modality',
+    'StudyInstanceUID', 'SeriesInstanceUID', 'SOPInstanceUID',
+    'InstitutionName', 'Manufacturer'
+)
+VIEW_METADATA_TAGS = keyword_tags(VIEW_METADATA_FIELDS)
 
 @app.route('/api/dicom/view/<path:filename>', methods=['GET'])
 def view_dicom(filename):
@@ -1051,67 +1415,63 @@ def view_dicom(filename):
     # First try direct path
     filepath = output_dir / filename
     
-    # If not found, search recursively for the filename
+    # If not found, look the filename up in the DICOM index
     if not filepath.exists():
         # Extract just the filename from the path for searching
         from pathlib import Path as PathLib
         base_filename = PathLib(filename).name
-        found_files = list(output_dir.rglob(base_filename))
-        if found_files:
-            filepath = found_files[0]  # Use the first match
-        else:
+        filepath = dicom_index.find(base_filename)
+        if filepath is None:
             return jsonify({'error': 'File not found'}), 404
     
     try:
-        ds = pydicom.dcmread(str(filepath))
+        ds = pydicom.dcmread(str(filepath), stop_before_pixels=True)
         
         # Extract metadata
-        metadata = {
-            'PatientName': str(getattr(ds, 'PatientName', 'Unknown')),
-            'PatientID': str(getattr(ds, 'PatientID', 'Unknown')),
-            'PatientBirthDate': str(getattr(ds, 'PatientBirthDate', 'Unknown')),
-            'PatientSex': str(getattr(ds, 'PatientSex', 'Unknown')),
-            'StudyDate': str(getattr(ds, 'StudyDate', 'Unknown')),
-            'StudyTime': str(getattr(ds, 'StudyTime', 'Unknown')),
-            'StudyDescription': str(getattr(ds, 'StudyDescription', 'Unknown')),
-            'SeriesDescription': str(getattr(ds, 'SeriesDescription', 'Unknown')),
-            'SeriesNumber': str(getattr(ds, 'SeriesNumber', 'Unknown')),
-            'InstanceNumber': str(getattr(ds, 'InstanceNumber', 'Unknown')),
-            'AccessionNumber': str(getattr(ds, 'AccessionNumber', 'Unknown')),
-            'Modality': str(getattr(ds, 'Modality', 'Unknown')),
-            'StudyInstanceUID': str(getattr(ds, 'StudyInstanceUID', 'Unknown')),
-            'SeriesInstanceUID': str(getattr(ds, 'SeriesInstanceUID', 'Unknown')),
-            'SOPInstanceUID': str(getattr(ds, 'SOPInstanceUID', 'Unknown')),
-            'InstitutionName': str(getattr(ds, 'InstitutionName', 'Unknown')),
-            'Manufacturer': str(getattr(ds, 'Manufacturer', 'Unknown'))
-        }
+        metadata = tag_values(ds, VIEW_METADATA_TAGS, default='Unknown')
         
-        # Convert pixel data to base64 image
-        image_data = None
-        if hasattr(ds, 'pixel_array'):
-            pixel_array = ds.pixel_array
-            
-            # Normalize to 8-bit
-            if pixel_array.dtype != np.uint8:
-                pixel_array = ((pixel_array - pixel_array.min()) / 
-                              (pixel_array.max() - pixel_array.min()) * 255).astype(np.uint8)
-            
-            # Convert to PIL Image
-            img = Image.fromarray(pixel_array)
-            
-            # Convert to base64
-            buffered = io.BytesIO()
-            img.save(buffered, format="PNG")
-            image_data = base64.b64encode(buffered.getvalue()).decode('utf-8')
+        # The image itself is served by preview_dicom; the version parameter
+        # changes whenever the file does, so browsers can cache it indefinitely
+        image_url = None
+        if 'Rows' in ds:
+            image_url = url_for(
+                'preview_dicom',
+                filename=filepath.relative_to(output_dir).as_posix(),
+                v=preview_cache_path(filepath).stem
+            )
         
         return jsonify({
             'metadata': metadata,
-            'image': f'data:image/png;base64,{image_data}' if image_data else None
+            'image': image_url
         })
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/dicom/preview/<path:filename>', methods=['GET'])
+def preview_dicom(filename):
+    """Serve the PNG preview of a DICOM image"""
+    output_dir = Path(app.config['UPLOAD_FOLDER'])
+    
+    # First try direct path
+    filepath = output_dir / filename
+    
+    # If not found, look the filename up in the DICOM index
+    if not filepath.exists():
+        filepath = dicom_index.find(Path(filename).name)
+        if filepath is None:
+            return jsonify({'error': 'File not found'}), 404
+    
+    try:
+        preview_path = get_preview_path(filepath)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    
+    if preview_path is None:
+        return jsonify({'error': 'File has no pixel data'}), 404
+    
+    return send_file(preview_path.absolute(), mimetype='image/png', max_age=31536000, conditional=True)
+
 @app.route('/api/dicom/download/<filename>', methods=['GET'])
 def download_dicom(filename):
     """Download DICOM file"""
@@ -1120,12 +1480,10 @@ def download_dicom(filename):
     # First try direct path
     filepath = output_dir / filename
     
-    # If not found, search recursively for the filename
+    # If not found, look the filename up in the DICOM index
     if not filepath.exists():
-        found_files = list(output_dir.rglob(filename))
-        if found_files:
-            filepath = found_files[0]  # Use the first match
-        else:
+        filepath = dicom_index.find(filename)
+        if filepath is None:
             return jsonify({'error': 'File not found'}), 404
     
     # Send file from its actual directory
@@ -1133,6 +1491,9 @@ def download_dicom(filename):
     filename_only = filepath.name
     return send_from_directory(str(directory), filename_only, as_attachment=True)
 
+# Value representations shown as a size summary in the headers view
+BINARY_VRS = frozenset({'OB', 'OD', 'OF', 'OL', 'OV', 'OW', 'UN'})
+
 @app.route('/api/dicom/headers/<path:filename>', methods=['GET'])
 def get_dicom_headers(filename):
     """Get DICOM file headers in formatted text"""
@@ -1141,19 +1502,18 @@ def get_dicom_headers(filename):
     # First try direct path
     filepath = output_dir / filename
     
-    # If not found, search recursively for the filename
+    # If not found, look the filename up in the DICOM index
     if not filepath.exists():
         # Extract just the filename from the path for searching
         from pathlib import Path as PathLib
         base_filename = PathLib(filename).name
-        found_files = list(output_dir.rglob(base_filename))
-        if found_files:
-            filepath = found_files[0]  # Use the first match
-        else:
+        filepath = dicom_index.find(base_filename)
+        if filepath is None:
             return jsonify({'error': 'File not found'}), 404
     
     try:
-        ds = pydicom.dcmread(str(filepath))
+        # Pixel data is never displayed, so don't read it
+        ds = pydicom.dcmread(str(filepath), stop_before_pixels=True)
         
         # Build a dictionary of DICOM tags with standard names
         headers = {}
@@ -1218,6 +1578,9 @@ def get_dicom_headers(filename):
             try:
                 if elem.VR == 'SQ':  # Sequence
                     value = f"[Sequence with {len(elem.value)} item(s)]"
+                elif elem.VR in BINARY_VRS:
+                    # Summarise bulk binary values rather than building a text copy of them
+                    value = f"[Binary data, {len(elem.value or b'')} bytes]"
                 elif hasattr(elem, 'value') and elem.value is not None:
                     value = str(elem.value)
                 else:
@@ -1234,7 +1597,7 @@ def get_dicom_headers(filename):
             }
         
         # Sort headers by tag ID (group, then element)
-        sorted_headers = dict(sorted(headers.items(), key=lambda x: (x[1]['group'], x[1]['element'])))
+        sorted_headers = {tag: headers[tag] for tag in sorted(headers, key=lambda tag: (headers[tag]['group'], headers[tag]['element']))}
         
         return jsonify({
             'success': True,
@@ -1253,16 +1616,16 @@ def delete_dicom(filename):
     # First try direct path
     filepath = output_dir / filename
     
-    # If not found, search recursively for the filename
+    # If not found, look the filename up in the DICOM index
     if not filepath.exists():
-        found_files = list(output_dir.rglob(filename))
-        if found_files:
-            filepath = found_files[0]  # Use the first match
-        else:
+        filepath = dicom_index.find(filename)
+        if filepath is None:
             return jsonify({'error': 'File not found'}), 404
     
     if filepath.exists():
+        preview_cache_path(filepath).unlink(missing_ok=True)
         filepath.unlink()
+        dicom_index.invalidate()
         return jsonify({'message': 'File deleted successfully'})
     
     return jsonify({'error': 'File not found'}), 404
@@ -1270,8 +1633,6 @@ def delete_dicom(filename):
 @app.route('/api/dicom/studies/delete', methods=['DELETE'])
 def delete_studies():
     """Delete multiple DICOM studies and their associated files"""
-    import shutil
-    
     data = request.get_json()
     if not data or 'study_uids' not in data:
         return jsonify({'error': 'No study UIDs provided'}), 400
@@ -1279,63 +1640,58 @@ def delete_studies():
     study_uids = data['study_uids']
     if not isinstance(study_uids, list) or len(study_uids) == 0:
         return jsonify({'error': 'Invalid study UIDs format'}), 400
+    study_uids = list(dict.fromkeys(study_uids))  # Each UID once, in request order
     
     output_dir = Path(app.config['UPLOAD_FOLDER'])
     deleted_count = 0
     errors = []
     
     # Get all studies first to find the folders to delete
-    # We need to recreate the logic from list_dicom_studies since it's a route function
     studies = {}
-    if output_dir.exists():
-        # Search recursively for all DICOM files
-        for dcm_file in output_dir.rglob('*.dcm'):
-            try:
-                ds = pydicom.dcmread(str(dcm_file))
-                study_uid = str(getattr(ds, 'StudyInstanceUID', 'Unknown'))
-                
-                if study_uid not in studies:
-                    from datetime import datetime
-                    creation_time = datetime.fromtimestamp(dcm_file.stat().st_ctime)
-                    
-                    # Determine study folder (for newer generated studies)
-                    study_folder = None
-                    file_parts = dcm_file.relative_to(output_dir).parts
-                    if len(file_parts) > 1:  # File is in a subdirectory
-                        study_folder = file_parts[0]
-                    
-                    studies[study_uid] = {
-                        'study_uid': study_uid,
-                        'study_folder': study_folder,
-                        'created': creation_time.strftime('%Y-%m-%d %H:%M:%S'),
-                        'created_iso': creation_time.isoformat()
-                    }
-            except Exception as e:
-                # Skip files that can't be read as DICOM
-                continue
+    for entry in dicom_index.entries():
+        if entry.error:
+            # Skip files that can't be read as DICOM
+            continue
+        
+        study_uid = entry.tags.get('StudyInstanceUID', 'Unknown')
+        if study_uid not in studies:
+            # Determine study folder (for newer generated studies)
+            study_folder = None
+            file_parts = entry.relative_path.parts
+            if len(file_parts) > 1:  # File is in a subdirectory
+                study_folder = file_parts[0]
+            
+            studies[study_uid] = {
+                'study_uid': study_uid,
+                'study_folder': study_folder,
+                'files': []
+            }
+        studies[study_uid]['files'].append(entry.path)
     
     studies_by_uid = studies
+    folders_to_delete = {}  # study folder path -> study UID
     
     for study_uid in study_uids:
         try:
             if study_uid in studies_by_uid:
                 study = studies_by_uid[study_uid]
                 if 'study_folder' in study and study['study_folder']:
-                    # Delete the entire study folder
+                    # Delete the entire study folder (removed below, concurrently)
                     study_path = output_dir / study['study_folder']
-                    if study_path.exists() and study_path.is_dir():
-                        shutil.rmtree(study_path)
-                        deleted_count += 1
+                    if study_path in folders_to_delete:
+                        pass  # Another UID's files share the folder
+                    elif study_path.is_dir():
+                        folders_to_delete[study_path] = study_uid
                     else:
                         errors.append(f"Study folder not found: {study['study_folder']}")
                 else:
-                    # Fallback: try to find and delete individual files
-                    # This handles older generated studies without folder structure
-                    found_files = list(output_dir.rglob(f"*{study_uid}*"))
+                    # Fallback: delete the study's individual files, as recorded
+                    # in the index. This handles older generated studies without
+                    # folder structure
+                    found_files = [file_path for file_path in study['files'] if file_path.is_file()]
                     if found_files:
                         for file_path in found_files:
-                            if file_path.is_file():
-                                file_path.unlink()
+                            file_path.unlink()
                         deleted_count += 1
                     else:
                         errors.append(f"No files found for study: {study_uid}")
@@ -1344,6 +1700,25 @@ def delete_studies():
         except Exception as e:
             errors.append(f"Error deleting study {study_uid}: {str(e)}")
     
+    def remove_study_folder(study_path):
+        try:
+            shutil.rmtree(study_path)
+            return None
+        except Exception as e:
+            return f"Error deleting study {folders_to_delete[study_path]}: {str(e)}"
+    
+    if folders_to_delete:
+        # rmtree is dominated by unlink syscalls, so a few threads overlap them
+        with ThreadPoolExecutor(max_workers=min(8, len(folders_to_delete))) as executor:
+            for error in executor.map(remove_study_folder, folders_to_delete):
+                if error:
+                    errors.append(error)
+                else:
+                    deleted_count += 1
+    
+    if deleted_count:
+        dicom_index.invalidate()
+    
     response = {
         'success': deleted_count > 0,
         'deleted_count': deleted_count,
@@ -1358,23 +1733,51 @@ def delete_studies():
     
     return jsonify(response)
 
+# Arguments shown when a command is logged - anything after this is summarised
+COMMAND_LOG_MAX_ARGS = 64
+
+def format_command(cmd, max_args=COMMAND_LOG_MAX_ARGS):
+    """Shell-quoted command line for logs and command_output responses.
+    
+    Arguments are quoted so the string can be pasted into a shell; very long
+    argument lists are cut off after max_args.
+    """
+    command = shlex.join(cmd[:max_args])
+    extra = len(cmd) - max_args
+    if extra > 0:
+        command += f' ... [+{extra} more arguments]'
+    return command
+
+# Characters of stdout / stderr included when a command result is logged
+COMMAND_LOG_OUTPUT_CHARS = 1000
+
+def log_command_result(label, result, max_chars=COMMAND_LOG_OUTPUT_CHARS):
+    """Log the exit code and the start of the output of a finished command.
+    
+    Failed commands are logged as warnings, so their output is seen without
+    debug logging. Successful ones only at debug level, and the output is
+    neither sliced nor formatted unless that is enabled.
+    """
+    level = logging.WARNING if result.returncode != 0 else logging.DEBUG
+    if not logger.isEnabledFor(level):
+        return
+    logger.log(level, "%s exit code: %s", label, result.returncode)
+    logger.log(level, "%s stdout: %s...", label, result.stdout[:max_chars])
+    logger.log(level, "%s stderr: %s...", label, result.stderr[:max_chars])
+
 @app.route('/api/dicom/launch/<filename>', methods=['POST'])
 def launch_dicom_viewer(filename):
     """Launch external DICOM viewer with the specified file"""
-    import subprocess
-    import platform
     
     output_dir = Path(app.config['UPLOAD_FOLDER'])
     
     # First try direct path
     filepath = output_dir / filename
     
-    # If not found, search recursively for the filename
+    # If not found, look the filename up in the DICOM index
     if not filepath.exists():
-        found_files = list(output_dir.rglob(filename))
-        if found_files:
-            filepath = found_files[0]  # Use the first match
-        else:
+        filepath = dicom_index.find(filename)
+        if filepath is None:
             return jsonify({'error': 'File not found'}), 404
     
     try:
@@ -1407,6 +1810,9 @@ def launch_dicom_viewer(filename):
         
         # Try each viewer until one works
         for viewer_cmd in viewers:
+            # Skip viewers that aren't installed without spawning a process
+            if viewer_cmd[0] != 'start' and shutil.which(viewer_cmd[0]) is None:
+                continue
             try:
                 if system == 'Windows' and viewer_cmd[0] == 'start':
                     subprocess.run(viewer_cmd, shell=True, check=True)
@@ -1416,7 +1822,7 @@ def launch_dicom_viewer(filename):
                 return jsonify({
                     'success': True,
                     'message': f'Launched DICOM viewer for {filename}',
-                    'viewer': ' '.join(viewer_cmd)
+                    'viewer': format_command(viewer_cmd)
                 })
             except (subprocess.CalledProcessError, FileNotFoundError):
                 continue
@@ -1434,10 +1840,31 @@ def launch_dicom_viewer(filename):
             'error': f'Error launching DICOM viewer: {str(e)}'
         }), 500
 
+def echo_pacs(ae_title, called_ae_title, host, port, timeout, max_age=None):
+    """Send a C-ECHO to a PACS - in-process with pynetdicom, over a pooled
+    association, or with DCMTK echoscu when pynetdicom isn't installed.
+    
+    With max_age, the echo is skipped if a request over a pooled association
+    between the same AEs completed within that many seconds.
+    Returns (success, command, exit_code, stderr).
+    """
+    if PYNETDICOM_AVAILABLE:
+        command = f"C-ECHO {ae_title} -> {called_ae_title}@{host}:{port}"
+        if max_age and association_pool.recently_succeeded(ae_title, called_ae_title, host, port, max_age):
+            return True, f"{command} (skipped - association healthy within {max_age}s)", 0, ''
+        try:
+            c_echo(ae_title, called_ae_title, host, port)
+        except PacsRequestError as e:
+            return False, command, 1, str(e)
+        return True, command, 0, ''
+    
+    cmd = ['echoscu', '-aet', ae_title, '-aec', called_ae_title, host, str(port)]
+    result = subprocess.run(cmd, capture_output=True, text=True, timeout=timeout)
+    return result.returncode == 0, format_command(cmd), result.returncode, result.stderr
+
 @app.route('/api/pacs/status', methods=['GET'])
 def pacs_status():
     """Check PACS server status using default configuration"""
-    import subprocess
     
     # Get default PACS configuration
     default_config = pacs_manager.get_default_config()
@@ -1448,17 +1875,18 @@ def pacs_status():
             'details': {}
         })
     
+    cache_key = (default_config.aet_echo, default_config.aec, default_config.host, default_config.port)
+    cached = pacs_status_cache.get(cache_key)
+    if cached and cached[0] > time.monotonic():
+        return jsonify(cached[1])
+    
     try:
-        # Try to connect to PACS using echoscu with default config
-        result = subprocess.run(
-            ['echoscu', '-aet', default_config.aet_echo, '-aec', default_config.aec, 
-             default_config.host, str(default_config.port)],
-            capture_output=True,
-            timeout=5
-        )
+        # Try to connect to PACS with a C-ECHO using the default config
+        is_online, _, _, _ = echo_pacs(default_config.aet_echo, default_config.aec,
+                                       default_config.host, default_config.port, timeout=5)
         
-        if result.returncode == 0:
-            return jsonify({
+        if is_online:
+            payload = {
                 'status': 'online',
                 'message': f'PACS server "{default_config.name}" is running',
                 'details': {
@@ -1468,12 +1896,14 @@ def pacs_status():
                     'port': default_config.port,
                     'our_aet': default_config.aet_echo
                 }
-            })
+            }
         else:
-            return jsonify({
+            payload = {
                 'status': 'offline',
                 'message': 'PACS server is not responding'
-            })
+            }
+        pacs_status_cache[cache_key] = (time.monotonic() + PACS_STATUS_TTL, payload)
+        return jsonify(payload)
     except Exception as e:
         return jsonify({
             'status': 'unknown',
@@ -1484,60 +1914,56 @@ def pacs_status():
 @app.route('/api/dicom/studies', methods=['GET'])
 def list_dicom_studies():
     """List DICOM studies (grouped by StudyInstanceUID)"""
-    output_dir = Path(app.config['UPLOAD_FOLDER'])
     studies = {}
     
-    if output_dir.exists():
-        # Search recursively for all DICOM files
-        for dcm_file in output_dir.rglob('*.dcm'):
-            try:
-                ds = pydicom.dcmread(str(dcm_file))
-                study_uid = str(getattr(ds, 'StudyInstanceUID', 'Unknown'))
-                
-                if study_uid not in studies:
-                    creation_time = datetime.fromtimestamp(dcm_file.stat().st_ctime)
-                    studies[study_uid] = {
-                        'study_uid': study_uid,
-                        'patient_name': str(getattr(ds, 'PatientName', 'Unknown')),
-                        'patient_id': str(getattr(ds, 'PatientID', 'Unknown')),
-                        'study_date': str(getattr(ds, 'StudyDate', 'Unknown')),
-                        'study_time': str(getattr(ds, 'StudyTime', 'Unknown')),
-                        'study_description': str(getattr(ds, 'StudyDescription', 'Unknown')),
-                        'accession_number': str(getattr(ds, 'AccessionNumber', 'Unknown')),
-                        'modality': str(getattr(ds, 'Modality', 'Unknown')),
-                        'created': creation_time.strftime('%Y%m%d%H%M%S'),
-                        'created_iso': creation_time.isoformat(),
-                        'series': {},
-                        'total_files': 0,
-                        'total_size': 0,
-                        'study_folder': None
-                    }
-                
-                # Add series information
-                series_uid = str(getattr(ds, 'SeriesInstanceUID', 'Unknown'))
-                series_number = str(getattr(ds, 'SeriesNumber', 'Unknown'))
-                
-                if series_uid not in studies[study_uid]['series']:
-                    studies[study_uid]['series'][series_uid] = {
-                        'series_uid': series_uid,
-                        'series_number': series_number,
-                        'series_description': str(getattr(ds, 'SeriesDescription', 'Unknown')),
-                        'modality': str(getattr(ds, 'Modality', 'Unknown')),
-                        'files': 0
-                    }
-                
-                studies[study_uid]['series'][series_uid]['files'] += 1
-                studies[study_uid]['total_files'] += 1
-                studies[study_uid]['total_size'] += dcm_file.stat().st_size
-                
-                # Determine study folder (parent directory structure)
-                relative_path = dcm_file.relative_to(output_dir)
-                if len(relative_path.parts) > 1:
-                    studies[study_uid]['study_folder'] = str(relative_path.parts[0])
-                    
-            except Exception as e:
-                print(f"Error reading DICOM file {dcm_file}: {e}")
-                continue
+    for entry in dicom_index.entries():
+        if entry.error:
+            print(f"Error reading DICOM file {entry.path}: {entry.error}")
+            continue
+        
+        tags = entry.tags
+        study_uid = tags.get('StudyInstanceUID', 'Unknown')
+        
+        if study_uid not in studies:
+            studies[study_uid] = {
+                'study_uid': study_uid,
+                'patient_name': tags.get('PatientName', 'Unknown'),
+                'patient_id': tags.get('PatientID', 'Unknown'),
+                'study_date': tags.get('StudyDate', 'Unknown'),
+                'study_time': tags.get('StudyTime', 'Unknown'),
+                'study_description': tags.get('StudyDescription', 'Unknown'),
+                'accession_number': tags.get('AccessionNumber', 'Unknown'),
+                'modality': tags.get('Modality', 'Unknown'),
+                'created': entry.created_compact,
+                'created_iso': entry.created_iso,
+                'series': {},
+                'total_files': 0,
+                'total_size': 0,
+                'study_folder': None
+            }
+        
+        # Add series information
+        series_uid = tags.get('SeriesInstanceUID', 'Unknown')
+        
+        if series_uid not in studies[study_uid]['series']:
+            studies[study_uid]['series'][series_uid] = {
+                'series_uid': series_uid,
+                'series_number': tags.get('SeriesNumber', 'Unknown'),
+                'series_description': tags.get('SeriesDescription', 'Unknown'),
+                'modality': tags.get('Modality', 'Unknown'),
+                'files': 0
+            }
+        
+        studies[study_uid]['series'][series_uid]['files'] += 1
+        studies[study_uid]['total_files'] += 1
+        studies[study_uid]['total_size'] += entry.st_size
+        
+        # Determine study folder (parent directory structure) from the first
+        # file that lives in one - every file of a generated study shares it
+        if studies[study_uid]['study_folder'] is None:
+            rel_parts = entry.relative_path.parts
+            if len(rel_parts) > 1:
+                studies[study_uid]['study_folder'] = rel_parts[0]
     
     # Convert to list and sort by creation date (newest first)
     studies_list = list(studies.values())
@@ -1545,37 +1971,65 @@ def list_dicom_studies():
     
     return jsonify(studies_list)
 
-@app.route('/api/pacs/query-study', methods=['POST'])
-def query_study_on_pacs():
-    """Query if a study exists on PACS by StudyInstanceUID"""
-    import subprocess
-    
-    data = request.json
-    study_uid = data.get('study_uid')
-    pacs_config_id = data.get('pacs_config_id')
-    
-    if not study_uid:
-        return jsonify({
-            'success': False,
-            'error': 'StudyInstanceUID is required'
-        }), 400
+# Elements of a study-level findscu response: tag -> (study_info key, VR, value
+# when none is given). The StudyInstanceUID only marks the study as found
+STUDY_QUERY_FIELDS = {
+    '(0010,0010)': ('patient_name', 'PN', 'Unknown'),
+    '(0008,0020)': ('study_date', 'DA', 'Unknown'),
+    '(0008,1030)': ('study_description', 'LO', 'Unknown'),
+    '(0020,1206)': ('series_count', 'IS', '0'),
+    '(0020,1208)': ('instance_count', 'IS', '0'),
+    '(0020,000d)': (None, 'UI', None),
+}
+
+def bracket_value(line, default):
+    """Text between the first '[' and the following ']' of a findscu line, or default if there is none"""
+    _, bracket, rest = line.partition('[')
+    if not bracket:
+        return default
+    return rest.partition(']')[0]
+
+def resolve_pacs_config(pacs_config_id):
+    """PACS configuration a request asked for, or the default one if no ID was given.
     
-    # Get PACS configuration
+    Returns (config, None), or (None, error response) when there is no such
+    configuration.
+    """
     if pacs_config_id:
         pacs_config = pacs_manager.get_config(pacs_config_id)
         if not pacs_config:
-            return jsonify({
+            return None, (jsonify({
                 'success': False,
                 'error': 'PACS configuration not found'
-            }), 404
+            }), 404)
     else:
         # Use default PACS config
         pacs_config = pacs_manager.get_default_config()
         if not pacs_config:
-            return jsonify({
+            return None, (jsonify({
                 'success': False,
                 'error': 'No PACS configuration available'
-            }), 400
+            }), 400)
+    return pacs_config, None
+
+@app.route('/api/pacs/query-study', methods=['POST'])
+def query_study_on_pacs():
+    """Query if a study exists on PACS by StudyInstanceUID"""
+    
+    data = request.json
+    study_uid = data.get('study_uid')
+    pacs_config_id = data.get('pacs_config_id')
+    
+    if not study_uid:
+        return jsonify({
+            'success': False,
+            'error': 'StudyInstanceUID is required'
+        }), 400
+    
+    # Get PACS configuration
+    pacs_config, error_response = resolve_pacs_config(pacs_config_id)
+    if error_response:
+        return error_response
     
     try:
         # Use findscu to query for the study
@@ -1601,39 +2055,55 @@ def query_study_on_pacs():
             timeout=30
         )
         
-        print(f"DEBUG: query-study command: {' '.join(cmd)}")
-        print(f"DEBUG: query-study exit code: {result.returncode}")
-        print(f"DEBUG: query-study stdout: {result.stdout[:500]}...")
-        print(f"DEBUG: query-study stderr: {result.stderr[:500]}...")
+        # Store command for logging
+        cmd_string = format_command(cmd)
+        logger.debug("query-study command: %s", cmd_string)
+        log_command_result("query-study", result, max_chars=500)
         
         # Parse the DICOM query response (findscu outputs to stderr)
         output_to_parse = result.stderr if result.stderr else result.stdout
-        lines = output_to_parse.strip().split('\n') if output_to_parse else []
         study_info = {}
         study_found = False
+        missing_fields = None  # Tags not yet seen in the current response
         
-        print(f"DEBUG: Parsing {len(lines)} lines of output")
-        print(f"DEBUG: First few lines: {lines[:5]}")
-        
-        for line in lines:
-            if '(0010,0010)' in line and 'PN' in line:  # Patient Name
-                study_info['patient_name'] = line.split('[')[1].split(']')[0] if '[' in line else 'Unknown'
-                study_found = True
-                print(f"DEBUG: Found patient name: {study_info['patient_name']}")
-            elif '(0008,0020)' in line and 'DA' in line:  # Study Date
-                study_info['study_date'] = line.split('[')[1].split(']')[0] if '[' in line else 'Unknown'
-                study_found = True
-            elif '(0008,1030)' in line and 'LO' in line:  # Study Description
-                study_info['study_description'] = line.split('[')[1].split(']')[0] if '[' in line else 'Unknown'
-                study_found = True
-            elif '(0020,1206)' in line and 'IS' in line:  # Number of Study Related Series
-                study_info['series_count'] = line.split('[')[1].split(']')[0] if '[' in line else '0'
-                study_found = True
-            elif '(0020,1208)' in line and 'IS' in line:  # Number of Study Related Instances
-                study_info['instance_count'] = line.split('[')[1].split(']')[0] if '[' in line else '0'
-                study_found = True
-            elif '(0020,000d)' in line and 'UI' in line:  # Study Instance UID
-                study_found = True
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Parsing %s lines of output", output_to_parse.count('\n') + 1 if output_to_parse else 0)
+            logger.debug("First few lines: %s", output_to_parse.split('\n', 5)[:5])
+        
+        # Lines are read one at a time rather than split into a list up
+        # front, as the loop usually stops well before the end of the output
+        for line in io.StringIO(output_to_parse):
+            line = line.rstrip('\n')
+            if 'Find Response:' in line:
+                missing_fields = set(STUDY_QUERY_FIELDS)
+                continue
+            
+            # Element lines look like "I: (0010,0010) PN [DOE^JOHN] # ..."
+            tag_start = line.find('(')
+            if tag_start < 0:
+                continue
+            tag = line[tag_start:tag_start + 11]
+            field = STUDY_QUERY_FIELDS.get(tag)
+            if field is None:
+                continue
+            
+            key, vr, default = field
+            if vr not in line:
+                continue
+            study_found = True
+            if key:
+                study_info[key] = bracket_value(line, default)
+                if key == 'patient_name':
+                    logger.debug("Found patient name: %s", study_info['patient_name'])
+            
+            # The request identifiers echoed before the first response carry
+            # the same tags, so only a response's elements count. A query by
+            # StudyInstanceUID matches a single study - once its response has
+            # every field, the rest of the output has nothing to add
+            if missing_fields is not None:
+                missing_fields.discard(tag)
+                if not missing_fields:
+                    break
         
         if study_found:
             return jsonify({
@@ -1643,7 +2113,7 @@ def query_study_on_pacs():
                 'study_info': study_info,
                 'pacs_response': result.stdout,
                 'command_output': {
-                    'command': ' '.join(cmd),
+                    'command': cmd_string,
                     'output': result.stdout,
                     'exit_code': result.returncode
                 }
@@ -1656,7 +2126,7 @@ def query_study_on_pacs():
                 'message': 'Study not found on PACS',
                 'pacs_response': result.stdout or result.stderr,
                 'command_output': {
-                    'command': ' '.join(cmd),
+                    'command': cmd_string,
                     'output': result.stdout or result.stderr,
                     'exit_code': result.returncode
                 }
@@ -1673,12 +2143,105 @@ def query_study_on_pacs():
             'error': f'Error querying PACS: {str(e)}'
         }), 500
 
+# Header elements read from the first file of a study sent to PACS
+SEND_STUDY_INFO_KEYWORDS = ['PatientName', 'PatientID', 'StudyDescription', 'AccessionNumber', 'StudyInstanceUID']
+
+def read_series_uid(path):
+    """SeriesInstanceUID of a DICOM file, reading nothing else"""
+    return str(pydicom.dcmread(path, stop_before_pixels=True, specific_tags=['SeriesInstanceUID']).SeriesInstanceUID)
+
+def count_study_series(dcm_files):
+    """Number of distinct series among the given files, read on a thread pool"""
+    max_workers = min(app.config['SERIES_SCAN_WORKERS'], len(dcm_files))
+    if max_workers <= 1:
+        return len(set(map(read_series_uid, dcm_files)))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return len(set(executor.map(read_series_uid, dcm_files)))
+
+# Lines of storescu output kept per stream - verbose output for a large study
+# can be long, and only its end is useful in the command log
+STORESCU_OUTPUT_LINES = 4096
+
+def run_with_output_tail(cmd, timeout, max_lines=STORESCU_OUTPUT_LINES):
+    """Run cmd, keeping only the last max_lines of its stdout and stderr.
+    
+    Both streams are drained as the command runs, so memory use stays bounded
+    however much it prints. Raises subprocess.TimeoutExpired like subprocess.run.
+    """
+    with subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True) as proc:
+        tails = (deque(maxlen=max_lines), deque(maxlen=max_lines))
+        readers = [
+            threading.Thread(target=tail.extend, args=(stream,), daemon=True)
+            for tail, stream in zip(tails, (proc.stdout, proc.stderr))
+        ]
+        for reader in readers:
+            reader.start()
+        try:
+            proc.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            raise
+        finally:
+            for reader in readers:
+                reader.join()
+    return subprocess.CompletedProcess(cmd, proc.returncode, ''.join(tails[0]), ''.join(tails[1]))
+
+# Bytes read from a command's output pipe at a time when streaming it
+STREAM_CHUNK_SIZE = 64 * 1024
+
+def stream_decoder():
+    """Incremental UTF-8 decoder with the newline handling of text mode pipes"""
+    return io.IncrementalNewlineDecoder(codecs.getincrementaldecoder('utf-8')(errors='replace'), translate=True)
+
+def run_with_stderr_stream(cmd, timeout, on_stderr):
+    """Run cmd, passing its stderr to on_stderr in decoded chunks as they arrive.
+    
+    This lets a caller parse the output while the command is still running.
+    The complete stdout and stderr are returned in a CompletedProcess. Raises
+    subprocess.TimeoutExpired like subprocess.run.
+    """
+    with subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE) as proc:
+        stdout_chunks, stderr_chunks = [], []
+        
+        def read_stdout():
+            stdout_chunks.append(proc.stdout.read())
+        
+        def read_stderr():
+            decoder = stream_decoder()
+            for chunk in iter(lambda: proc.stderr.read1(STREAM_CHUNK_SIZE), b''):
+                text = decoder.decode(chunk)
+                if text:
+                    stderr_chunks.append(text)
+                    on_stderr(text)
+            text = decoder.decode(b'', final=True)
+            if text:
+                stderr_chunks.append(text)
+                on_stderr(text)
+        
+        readers = [threading.Thread(target=read_stdout, daemon=True),
+                   threading.Thread(target=read_stderr, daemon=True)]
+        for reader in readers:
+            reader.start()
+        try:
+            proc.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            raise
+        finally:
+            for reader in readers:
+                reader.join()
+    stdout = stream_decoder().decode(b''.join(stdout_chunks), final=True)
+    return subprocess.CompletedProcess(cmd, proc.returncode, stdout, ''.join(stderr_chunks))
+
 @app.route('/api/pacs/send-study', methods=['POST'])
 @login_required
 def send_study_to_pacs():
-    """Send an entire study (all series) to PACS"""
-    import subprocess
-    import glob
+    """Send an entire study (all series) to PACS.
+    
+    All files are sent by one storescu run, which opens a single association
+    and negotiates one presentation context per SOP class found - callers
+    should send a study in one request rather than series by series.
+    """
     
     data = request.json
     study_folder = data.get('study_folder')
@@ -1691,21 +2254,9 @@ def send_study_to_pacs():
         }), 400
     
     # Get PACS configuration
-    if pacs_config_id:
-        pacs_config = pacs_manager.get_config(pacs_config_id)
-        if not pacs_config:
-            return jsonify({
-                'success': False,
-                'error': 'PACS configuration not found'
-            }), 404
-    else:
-        # Use default PACS config
-        pacs_config = pacs_manager.get_default_config()
-        if not pacs_config:
-            return jsonify({
-                'success': False,
-                'error': 'No PACS configuration available'
-            }), 400
+    pacs_config, error_response = resolve_pacs_config(pacs_config_id)
+    if error_response:
+        return error_response
     
     # Check environment access for C-STORE operation
     environment = getattr(pacs_config, 'environment', 'test')
@@ -1715,11 +2266,27 @@ def send_study_to_pacs():
             'error': f'Insufficient permissions for {environment} environment write access'
         }), 403
     
-    # Convert relative path to absolute if needed
-    if not study_folder.startswith('/'):
-        study_folder = Path(app.config['UPLOAD_FOLDER']) / study_folder
+    # Studies are the top level folders of the output directory, so a series
+    # folder - relative or absolute - resolves to its study and the whole
+    # study still goes over a single association. Absolute paths outside
+    # the output directory are sent as given
+    output_dir = Path(app.config['UPLOAD_FOLDER'])
+    study_path = Path(study_folder)
+    if study_path.is_absolute():
+        try:
+            study_path = study_path.resolve().relative_to(output_dir.resolve())
+        except ValueError:
+            pass
+    if study_path.is_absolute():
+        study_folder = study_path
     else:
-        study_folder = Path(study_folder)
+        parts = Path(os.path.normpath(study_path)).parts
+        if not parts or parts[0] == '..':
+            return jsonify({
+                'success': False,
+                'error': 'Study folder must name a study in the output directory'
+            }), 400
+        study_folder = output_dir / parts[0]
     
     if not study_folder.exists():
         return jsonify({
@@ -1729,7 +2296,7 @@ def send_study_to_pacs():
     
     try:
         # Find all DICOM files in the study folder (all series)
-        dcm_files = list(study_folder.rglob('*.dcm'))
+        dcm_files = [dir_entry.path for dir_entry in iter_dicom_files(study_folder)]
         
         if not dcm_files:
             return jsonify({
@@ -1737,9 +2304,9 @@ def send_study_to_pacs():
                 'error': 'No DICOM files found in study folder'
             }), 404
         
-        # Get study info from first file for confirmation
-        import pydicom
-        first_file = pydicom.dcmread(str(dcm_files[0]))
+        # Get study info from first file for confirmation. Only the header
+        # elements needed are parsed - pixel data is never read
+        first_file = pydicom.dcmread(dcm_files[0], stop_before_pixels=True, specific_tags=SEND_STUDY_INFO_KEYWORDS)
         study_info = {
             'patient_name': str(getattr(first_file, 'PatientName', 'Unknown')),
             'patient_id': str(getattr(first_file, 'PatientID', 'Unknown')),
@@ -1747,7 +2314,7 @@ def send_study_to_pacs():
             'accession_number': str(getattr(first_file, 'AccessionNumber', 'Unknown')),
             'study_uid': str(getattr(first_file, 'StudyInstanceUID', 'Unknown')),
             'file_count': len(dcm_files),
-            'series_count': len(set(str(pydicom.dcmread(str(f)).SeriesInstanceUID) for f in dcm_files))
+            'series_count': count_study_series(dcm_files)
         }
         
         # Check if PACS supports C-STORE
@@ -1757,22 +2324,21 @@ def send_study_to_pacs():
                 'error': f'PACS {pacs_config.name} does not support C-STORE operations (no C-STORE AE configured)'
             }), 400
         
-        # Send files to PACS using storescu with dynamic config
+        # Send files to PACS using storescu with dynamic config. storescu scans
+        # the study folder itself, so large studies don't overflow the argument list
         cmd = [
             'storescu', 
             '-aet', pacs_config.aet_store,  # Our C-STORE Application Entity Title
             '-aec', pacs_config.aec,  # PACS Application Entity Title
-            pacs_config.host, str(pacs_config.port)  # PACS host and port
-        ] + [str(f) for f in dcm_files]
+            '+sd', '+r', '+sp', '*.dcm',  # Send every .dcm file under the folder
+            pacs_config.host, str(pacs_config.port),  # PACS host and port
+            str(study_folder)
+        ]
         
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            timeout=60  # 60 second timeout for large studies
-        )
+        result = run_with_output_tail(cmd, timeout=60)  # 60 second timeout for large studies
         
         if result.returncode == 0:
+            invalidate_query_cache(pacs_config.id)
             return jsonify({
                 'success': True,
                 'message': f'Successfully sent study to PACS',
@@ -1783,7 +2349,7 @@ def send_study_to_pacs():
                     'pacs_output': result.stdout
                 },
                 'command_log': {
-                    'command': ' '.join(cmd),
+                    'command': format_command(cmd),
                     'stdout': result.stdout,
                     'stderr': result.stderr,
                     'return_code': result.returncode,
@@ -1808,7 +2374,7 @@ def send_study_to_pacs():
                     'return_code': result.returncode
                 },
                 'command_log': {
-                    'command': ' '.join(cmd),
+                    'command': format_command(cmd),
                     'stdout': result.stdout,
                     'stderr': result.stderr,
                     'return_code': result.returncode,
@@ -1836,38 +2402,30 @@ def send_study_to_pacs():
         }), 500
 
 # PACS Configuration Management Endpoints
+# PacsConfiguration attributes returned by the configuration endpoints
+PACS_CONFIG_FIELDS = (
+    'id', 'name', 'description', 'host', 'port',
+    'aet_find', 'aet_store', 'aet_echo', 'aec',
+    'environment', 'is_default', 'is_active',
+    'created_date', 'modified_date',
+    'last_tested', 'test_status', 'test_message',
+    'move_routing',
+)
+pacs_config_values = attrgetter(*PACS_CONFIG_FIELDS)
+
+def pacs_config_dict(config):
+    """JSON-ready dict of a PACS configuration"""
+    return dict(zip(PACS_CONFIG_FIELDS, pacs_config_values(config)))
+
 @app.route('/api/pacs/configs', methods=['GET'])
 @login_required
 def list_pacs_configs():
     """List all PACS configurations"""
     try:
-        # Update user activity
-        update_user_activity()
         configs = pacs_manager.list_configs()
         return jsonify({
             'success': True,
-            'configs': [
-                {
-                    'id': config.id,
-                    'name': config.name,
-                    'description': config.description,
-                    'host': config.host,
-                    'port': config.port,
-                    'aet_find': config.aet_find,
-                    'aet_store': config.aet_store,
-                    'aet_echo': config.aet_echo,
-                    'aec': config.aec,
-                    'environment': config.environment,
-                    'is_default': config.is_default,
-                    'is_active': config.is_active,
-                    'created_date': config.created_date,
-                    'modified_date': config.modified_date,
-                    'last_tested': config.last_tested,
-                    'test_status': config.test_status,
-                    'test_message': config.test_message,
-                    'move_routing': config.move_routing
-                } for config in configs
-            ]
+            'configs': [pacs_config_dict(config) for config in configs]
         })
     except Exception as e:
         return jsonify({
@@ -1911,23 +2469,7 @@ def create_pacs_config():
         return jsonify({
             'success': True,
             'message': 'PACS configuration created successfully',
-            'config': {
-                'id': config.id,
-                'name': config.name,
-                'description': config.description,
-                'host': config.host,
-                'port': config.port,
-                'aet_find': config.aet_find,
-                'aet_store': config.aet_store,
-                'aet_echo': config.aet_echo,
-                'aec': config.aec,
-                'environment': config.environment,
-                'is_default': config.is_default,
-                'is_active': config.is_active,
-                'created_date': config.created_date,
-                'modified_date': config.modified_date,
-                'move_routing': config.move_routing
-            }
+            'config': pacs_config_dict(config)
         })
         
     except ValueError as e:
@@ -1954,26 +2496,7 @@ def get_pacs_config(config_id):
         
         return jsonify({
             'success': True,
-            'config': {
-                'id': config.id,
-                'name': config.name,
-                'description': config.description,
-                'host': config.host,
-                'port': config.port,
-                'aet_find': config.aet_find,
-                'aet_store': config.aet_store,
-                'aet_echo': config.aet_echo,
-                'aec': config.aec,
-                'environment': config.environment,
-                'is_default': config.is_default,
-                'is_active': config.is_active,
-                'created_date': config.created_date,
-                'modified_date': config.modified_date,
-                'last_tested': config.last_tested,
-                'test_status': config.test_status,
-                'test_message': config.test_message,
-                'move_routing': config.move_routing
-            }
+            'config': pacs_config_dict(config)
         })
     except Exception as e:
         return jsonify({
@@ -2005,22 +2528,7 @@ def update_pacs_config(config_id):
         return jsonify({
             'success': True,
             'message': 'PACS configuration updated successfully',
-            'config': {
-                'id': config.id,
-                'name': config.name,
-                'description': config.description,
-                'host': config.host,
-                'port': config.port,
-                'aet_find': config.aet_find,
-                'aet_store': config.aet_store,
-                'aet_echo': config.aet_echo,
-                'aec': config.aec,
-                'environment': config.environment,
-                'is_default': config.is_default,
-                'is_active': config.is_active,
-                'created_date': config.created_date,
-                'modified_date': config.modified_date
-            }
+            'config': pacs_config_dict(config)
         })
         
     except ValueError as e:
@@ -2090,8 +2598,6 @@ def test_pacs_config(config_id):
 def get_store_enabled_pacs():
     """Get PACS configurations that support C-STORE operations"""
     try:
-        # Update user activity
-        update_user_activity()
         store_configs = pacs_manager.get_store_enabled_configs()
         return jsonify({
             'success': True,
@@ -2150,9 +2656,6 @@ def update_pacs_routing(config_id):
 def get_pacs_stats():
     """Get PACS configuration statistics"""
     try:
-        # Update user activity
-        update_user_activity()
-        
         stats = pacs_manager.get_stats()
         return jsonify({
             'success': True,
@@ -2164,10 +2667,21 @@ def get_pacs_stats():
             'error': f'Error getting PACS statistics: {str(e)}'
         }), 500
 
+# Lines of findscu output that matter when parsing responses, matched across
+# the whole output in one pass: either an element line, optionally logged
+# with an "I: " prefix - (gggg,eeee) VR [value] # length, vm Keyword - or a
+# boundary between responses ("--..." separator or "Find Response:" header)
+FINDSCU_RECORD_RE = re.compile(
+    r'^[ \t]*(?:I: )?(?:'
+    r'\([0-9a-fA-F]{4},[0-9a-fA-F]{4}\)[ \t]+\w+[ \t]+\[(?P<value>[^\]\n]*)\]'
+    r'[ \t]*#[ \t]*\d+,[ \t]*\d+[ \t]+(?P<keyword>.+)'
+    r'|--|.*Find Response:)',
+    re.MULTILINE
+)
+
 @app.route('/api/pacs/query-series', methods=['POST'])
 def query_series_details():
     """Query for series-level details for a specific study"""
-    import subprocess
     
     data = request.json
     pacs_config_id = data.get('pacs_config_id')
@@ -2180,21 +2694,9 @@ def query_series_details():
         }), 400
     
     # Get PACS configuration
-    if pacs_config_id:
-        pacs_config = pacs_manager.get_config(pacs_config_id)
-        if not pacs_config:
-            return jsonify({
-                'success': False,
-                'error': 'PACS configuration not found'
-            }), 404
-    else:
-        # Use default PACS config
-        pacs_config = pacs_manager.get_default_config()
-        if not pacs_config:
-            return jsonify({
-                'success': False,
-                'error': 'No PACS configuration available'
-            }), 400
+    pacs_config, error_response = resolve_pacs_config(pacs_config_id)
+    if error_response:
+        return error_response
     
     try:
         # Build findscu command for series-level query
@@ -2227,37 +2729,32 @@ def query_series_details():
             series_details = []
             current_series = {}
             
-            lines = result.stderr.split('\n')
-            for line in lines:
-                line = line.strip()
-                if line.startswith('I: '):
-                    line = line[3:]
-                    
-                import re
-                tag_match = re.match(r'^\(([0-9a-fA-F]{4}),([0-9a-fA-F]{4})\)\s+(\w+)\s+\[([^\]]*)\]\s*#\s*\d+,\s*\d+\s+(.+)$', line)
+            for record in FINDSCU_RECORD_RE.finditer(result.stderr):
+                tag_name = record['keyword']
+                if tag_name is None:
+                    # Boundary between responses
+                    if current_series:
+                        series_details.append(current_series)
+                        current_series = {}
+                    continue
                 
-                if tag_match:
-                    group, element, vr, value, description = tag_match.groups()
-                    tag_name = description.strip()
-                    
-                    if tag_name == 'SeriesNumber':
-                        current_series['series_number'] = value.strip()
-                    elif tag_name == 'SeriesDescription':
-                        current_series['series_description'] = value.strip()
-                    elif tag_name == 'SeriesInstanceUID':
-                        current_series['series_uid'] = value.strip()
-                    elif tag_name == 'Modality':
-                        current_series['modality'] = value.strip()
-                    elif tag_name == 'NumberOfSeriesRelatedInstances':
-                        current_series['instance_count'] = value.strip()
-                    elif tag_name in ['PerformedProcedureStepDescription', 'RequestedProcedureDescription']:
-                        # Use whichever procedure description is available
-                        if 'procedure_code' not in current_series or not current_series['procedure_code']:
-                            current_series['procedure_code'] = value.strip()
+                tag_name = tag_name.strip()
+                value = record['value'].strip()
                 
-                elif (line.startswith('--') or 'Find Response:' in line) and current_series:
-                    series_details.append(current_series)
-                    current_series = {}
+                if tag_name == 'SeriesNumber':
+                    current_series['series_number'] = value
+                elif tag_name == 'SeriesDescription':
+                    current_series['series_description'] = value
+                elif tag_name == 'SeriesInstanceUID':
+                    current_series['series_uid'] = value
+                elif tag_name == 'Modality':
+                    current_series['modality'] = value
+                elif tag_name == 'NumberOfSeriesRelatedInstances':
+                    current_series['instance_count'] = value
+                elif tag_name in ['PerformedProcedureStepDescription', 'RequestedProcedureDescription']:
+                    # Use whichever procedure description is available
+                    if 'procedure_code' not in current_series or not current_series['procedure_code']:
+                        current_series['procedure_code'] = value
             
             # Handle last series
             if current_series:
@@ -2268,7 +2765,7 @@ def query_series_details():
                 'series_details': series_details,
                 'study_uid': study_uid,
                 'command_output': {
-                    'command': ' '.join(cmd),
+                    'command': format_command(cmd),
                     'output': result.stderr or result.stdout,
                     'exit_code': result.returncode
                 }
@@ -2278,7 +2775,7 @@ def query_series_details():
                 'success': False,
                 'error': 'Failed to query series details',
                 'command_output': {
-                    'command': ' '.join(cmd),
+                    'command': format_command(cmd),
                     'output': result.stderr or result.stdout,
                     'exit_code': result.returncode
                 }
@@ -2290,96 +2787,177 @@ def query_series_details():
             'error': f'Error querying series: {str(e)}'
         }), 500
 
-def query_pacs_via_rest(pacs_config, query_params):
-    """Query PACS server using REST API (fallback when C-FIND fails)"""
-    import requests
-    from datetime import datetime, timedelta
-    
-    # Orthanc credentials mapping
-    orthanc_credentials = {
-        'localhost:4242': ('test', 'test123'),
-        'localhost:4243': ('test2', 'test456'),
-        'localhost:4244': ('test', 'test123'),
-        'localhost:4245': ('orthanc', 'orthanc')
+# Orthanc REST credentials by DICOM host:port (from docker-compose.yml and default settings)
+ORTHANC_CREDENTIALS = {
+    'localhost:4242': ('test', 'test123'),
+    'localhost:4243': ('test2', 'test456'),
+    'localhost:4244': ('test', 'test123'),  # Assuming same credentials
+    'localhost:4245': ('orthanc', 'orthanc')   # Default Orthanc credentials
+}
+
+# Orthanc web port for each DICOM port, from docker-compose.yml
+ORTHANC_WEB_PORTS = {
+    4242: 8042,  # orthanc-test-pacs
+    4243: 8043,  # orthanc-test-pacs-2
+    4244: 8044,  # testpacs-test
+    4245: 8045   # testpacs-prod
+}
+
+# Shared HTTP session so Orthanc REST requests reuse pooled connections
+ORTHANC_REST_WORKERS = 16
+orthanc_session = requests.Session()
+orthanc_session.mount('http://', requests.adapters.HTTPAdapter(pool_connections=32, pool_maxsize=32))
+
+def orthanc_web_port(dicom_port):
+    """Orthanc REST port serving the given DICOM port"""
+    return ORTHANC_WEB_PORTS.get(dicom_port, dicom_port + 8000)
+
+# Wildcard text filters of a REST query: (query parameter, DICOM keyword)
+REST_TEXT_FILTERS = (
+    ('patient_name', 'PatientName'),
+    ('patient_id', 'PatientID'),
+    ('accession_number', 'AccessionNumber'),
+)
+
+
+def orthanc_find_query(query_params):
+    """Orthanc /tools/find Query for the search criteria in query_params.
+    
+    Mirrors matches_search_criteria: the text filters match anywhere in the
+    value (sent with CaseSensitive off), and days_ago becomes an open-ended
+    StudyDate range.
+    """
+    query = {}
+    for param, keyword in REST_TEXT_FILTERS:
+        value = query_params.get(param, '').strip()
+        if value and value != '*':
+            query[keyword] = f'*{value}*'
+    
+    study_uid = query_params.get('study_uid', '').strip()
+    if study_uid:
+        query['StudyInstanceUID'] = study_uid
+    
+    days_ago = query_params.get('days_ago', 0)
+    if days_ago and days_ago > 0:
+        cutoff_date = datetime.now() - timedelta(days=days_ago)
+        query['StudyDate'] = f"{cutoff_date.strftime('%Y%m%d')}-"
+    
+    return query
+
+
+def rest_study_tags(study_data):
+    """Patient and study level tags of an Orthanc study resource"""
+    return {**study_data.get('PatientMainDicomTags', {}), **study_data.get('MainDicomTags', {})}
+
+
+def format_rest_study(study_data):
+    """Query result for an Orthanc study resource"""
+    main_tags = rest_study_tags(study_data)
+    return {
+        'study_uid': main_tags.get('StudyInstanceUID', ''),
+        'patient_name': main_tags.get('PatientName', ''),
+        'patient_id': main_tags.get('PatientID', ''),
+        'study_date': main_tags.get('StudyDate', ''),
+        'study_time': main_tags.get('StudyTime', ''),
+        'accession_number': main_tags.get('AccessionNumber', ''),
+        'study_description': main_tags.get('StudyDescription', ''),
+        'modality': main_tags.get('Modality', ''),
+        'series_count': main_tags.get('NumberOfStudyRelatedSeries', ''),
+        'instance_count': main_tags.get('NumberOfStudyRelatedInstances', ''),
+        'series_uid': main_tags.get('SeriesInstanceUID', ''),
+        'series_number': main_tags.get('SeriesNumber', ''),
+        'series_description': main_tags.get('SeriesDescription', '')
     }
+
+
+def query_pacs_studies_individually(web_port, auth, query_params, max_results):
+    """List studies and fetch each one, for Orthanc versions without /tools/find"""
+    response = orthanc_session.get(
+        f'http://localhost:{web_port}/studies',
+        auth=auth,
+        timeout=30
+    )
+    response.raise_for_status()
+    
+    study_ids = response.json()[:max_results]
     
+    def fetch_study(study_id):
+        """Study details from Orthanc, or None if they couldn't be fetched"""
+        try:
+            study_response = orthanc_session.get(
+                f'http://localhost:{web_port}/studies/{study_id}',
+                auth=auth,
+                timeout=10
+            )
+            if study_response.status_code == 200:
+                return study_response.json()
+        except Exception as e:
+            logger.debug("Error processing study %s: %s", study_id, e)
+        return None
+    
+    # Fetch study details concurrently - each request is a separate round trip
+    if study_ids:
+        with ThreadPoolExecutor(max_workers=min(ORTHANC_REST_WORKERS, len(study_ids))) as executor:
+            study_details = list(executor.map(fetch_study, study_ids))
+    else:
+        study_details = []
+    
+    criteria = compile_search_criteria(query_params)
+    studies = []
+    for study_id, study_data in zip(study_ids, study_details):
+        try:
+            if study_data is not None and matches_search_criteria(rest_study_tags(study_data), criteria):
+                studies.append(format_rest_study(study_data))
+        except Exception as e:
+            logger.debug("Error processing study %s: %s", study_id, e)
+    
+    return studies
+
+
+def query_pacs_via_rest(pacs_config, query_params):
+    """Query PACS server using REST API (fallback when C-FIND fails)"""
     source_key = f"{pacs_config.host}:{pacs_config.port}"
     
-    if source_key not in orthanc_credentials:
+    if source_key not in ORTHANC_CREDENTIALS:
         return {
             'success': False,
             'error': f'No REST API credentials available for {pacs_config.name}',
             'results': []
         }
     
-    username, password = orthanc_credentials[source_key]
-    web_port_mapping = {
-        4242: 8042,  # orthanc-test-pacs
-        4243: 8043,  # orthanc-test-pacs-2
-        4244: 8044,  # testpacs-test
-        4245: 8045   # testpacs-prod
-    }
-    web_port = web_port_mapping.get(pacs_config.port, pacs_config.port + 8000)
+    username, password = ORTHANC_CREDENTIALS[source_key]
+    web_port = orthanc_web_port(pacs_config.port)
     
     try:
-        # Get all studies from Orthanc
-        response = requests.get(
-            f'http://localhost:{web_port}/studies',
+        max_results = query_params.get('max_results', 100)
+        
+        # Let Orthanc filter the studies server-side and return their tags
+        # in a single round trip
+        response = orthanc_session.post(
+            f'http://localhost:{web_port}/tools/find',
+            json={
+                'Level': 'Study',
+                'Query': orthanc_find_query(query_params),
+                'CaseSensitive': False,  # matches_search_criteria ignores case too
+                'Expand': True,
+                'Limit': max_results
+            },
             auth=(username, password),
             timeout=30
         )
         
-        if response.status_code != 200:
+        if response.status_code == 200:
+            studies = [format_rest_study(study_data) for study_data in response.json()]
+        elif response.status_code == 404:
+            # Orthanc without /tools/find - fetch each study and filter here
+            studies = query_pacs_studies_individually(web_port, (username, password), query_params, max_results)
+        else:
             return {
                 'success': False,
                 'error': f'REST API request failed: HTTP {response.status_code}',
                 'results': []
             }
         
-        study_ids = response.json()
-        studies = []
-        
-        # Process each study
-        for study_id in study_ids[:query_params.get('max_results', 100)]:
-            try:
-                # Get study details
-                study_response = requests.get(
-                    f'http://localhost:{web_port}/studies/{study_id}',
-                    auth=(username, password),
-                    timeout=10
-                )
-                
-                if study_response.status_code == 200:
-                    study_data = study_response.json()
-                    main_tags = study_data.get('MainDicomTags', {})
-                    
-                    # Apply search filters
-                    if not matches_search_criteria(main_tags, query_params):
-                        continue
-                    
-                    # Format study result
-                    study_result = {
-                        'study_uid': main_tags.get('StudyInstanceUID', ''),
-                        'patient_name': main_tags.get('PatientName', ''),
-                        'patient_id': main_tags.get('PatientID', ''),
-                        'study_date': main_tags.get('StudyDate', ''),
-                        'study_time': main_tags.get('StudyTime', ''),
-                        'accession_number': main_tags.get('AccessionNumber', ''),
-                        'study_description': main_tags.get('StudyDescription', ''),
-                        'modality': main_tags.get('Modality', ''),
-                        'series_count': main_tags.get('NumberOfStudyRelatedSeries', ''),
-                        'instance_count': main_tags.get('NumberOfStudyRelatedInstances', ''),
-                        'series_uid': main_tags.get('SeriesInstanceUID', ''),
-                        'series_number': main_tags.get('SeriesNumber', ''),
-                        'series_description': main_tags.get('SeriesDescription', '')
-                    }
-                    
-                    studies.append(study_result)
-                    
-            except Exception as e:
-                print(f"DEBUG: Error processing study {study_id}: {str(e)}")
-                continue
-        
         return {
             'success': True,
             'results': studies,
@@ -2399,62 +2977,136 @@ def query_pacs_via_rest(pacs_config, query_params):
             'results': []
         }
 
-def matches_search_criteria(main_tags, query_params):
-    """Check if study matches search criteria"""
-    import re
-    
-    # Patient Name filter
-    patient_name = query_params.get('patient_name', '').strip()
-    if patient_name and patient_name != '*':
-        study_patient_name = main_tags.get('PatientName', '')
-        if not re.search(patient_name.replace('*', '.*'), study_patient_name, re.IGNORECASE):
-            return False
+def compile_search_criteria(query_params):
+    """Prepare query_params for matches_search_criteria.
     
-    # Patient ID filter
-    patient_id = query_params.get('patient_id', '').strip()
-    if patient_id and patient_id != '*':
-        study_patient_id = main_tags.get('PatientID', '')
-        if not re.search(patient_id.replace('*', '.*'), study_patient_id, re.IGNORECASE):
-            return False
+    The wildcard filters are compiled to regular expressions once per query
+    rather than once per study.
+    """
+    patterns = {}
+    for param, keyword in REST_TEXT_FILTERS:
+        value = query_params.get(param, '').strip()
+        if value and value != '*':
+            patterns[keyword] = re.compile(value.replace('*', '.*'), re.IGNORECASE)
     
-    # Accession Number filter
-    accession = query_params.get('accession_number', '').strip()
-    if accession and accession != '*':
-        study_accession = main_tags.get('AccessionNumber', '')
-        if not re.search(accession.replace('*', '.*'), study_accession, re.IGNORECASE):
+    days_ago = query_params.get('days_ago', 0)
+    return {
+        'patterns': patterns,
+        'study_uid': query_params.get('study_uid', '').strip(),
+        # StudyDate is a fixed YYYYMMDD string, so the cutoff is compared as an integer
+        'cutoff_date': int((datetime.now() - timedelta(days=days_ago)).strftime('%Y%m%d')) if days_ago and days_ago > 0 else None
+    }
+
+def matches_search_criteria(main_tags, criteria):
+    """Check if study matches search criteria from compile_search_criteria()"""
+    # Patient name, patient ID and accession number filters
+    for keyword, pattern in criteria['patterns'].items():
+        if not pattern.search(main_tags.get(keyword, '')):
             return False
     
     # Study UID filter
-    study_uid = query_params.get('study_uid', '').strip()
+    study_uid = criteria['study_uid']
     if study_uid:
         study_study_uid = main_tags.get('StudyInstanceUID', '')
         if study_uid != study_study_uid:
             return False
     
     # Date range filter
-    days_ago = query_params.get('days_ago', 0)
-    if days_ago and days_ago > 0:
+    cutoff_date = criteria['cutoff_date']
+    if cutoff_date:
         study_date = main_tags.get('StudyDate', '')
-        if study_date:
-            try:
-                study_datetime = datetime.strptime(study_date, '%Y%m%d')
-                cutoff_date = datetime.now() - timedelta(days=days_ago)
-                if study_datetime < cutoff_date:
-                    return False
-            except ValueError:
-                pass  # Skip date filtering if date format is invalid
+        # Skip date filtering if date format is invalid
+        if len(study_date) == 8 and study_date.isdigit() and int(study_date) < cutoff_date:
+            return False
     
     return True
 
+# Request fields sent to findscu as search keys: (request field, DICOM keyword,
+# whether a value without wildcards is wrapped in * for a contains match)
+QUERY_SEARCH_FIELDS = (
+    ('patient_name', 'PatientName', True),
+    ('patient_id', 'PatientID', True),
+    ('accession_number', 'AccessionNumber', True),
+    ('study_uid', 'StudyInstanceUID', False),
+    ('series_uid', 'SeriesInstanceUID', False),
+)
+
+# Attributes every PACS query asks to be returned, in addition to the search keys.
+# Include more fields to match the local DICOM table display
+QUERY_RETURN_KEYS = (
+    'PatientName',
+    'PatientID', 
+    'StudyDate',
+    'StudyTime',
+    'StudyDescription',
+    'AccessionNumber',
+    'StudyInstanceUID',
+    'Modality',
+    'SeriesInstanceUID',
+    'SeriesNumber',
+    'SeriesDescription'
+)
+
+# Study counts the PACS computes for every match rather than reading them from
+# its index - slow on some PACS (Orthanc counts each study's series and
+# instances), so they are only requested with include_counts
+QUERY_COUNT_KEYS = (
+    'NumberOfStudyRelatedSeries',
+    'NumberOfStudyRelatedInstances'
+)
+
+# Query response attributes copied into a study result: DICOM keyword -> result key.
+# Read-only, as it is shared by every query request
+QUERY_RESULT_FIELDS = MappingProxyType({
+    'PatientName': 'patient_name',
+    'PatientID': 'patient_id',
+    'PatientBirthDate': 'patient_birth_date',
+    'PatientSex': 'patient_sex',
+    'StudyDate': 'study_date',
+    'StudyTime': 'study_time',
+    'StudyDescription': 'study_description',
+    'AccessionNumber': 'accession_number',
+    'StudyInstanceUID': 'study_uid',
+    'SeriesInstanceUID': 'series_uid',
+    'SeriesNumber': 'series_number',
+    'SeriesDescription': 'series_description',
+    'Modality': 'modality',
+    'NumberOfStudyRelatedSeries': 'series_count',
+    'NumberOfStudyRelatedInstances': 'instance_count',
+    'ReferringPhysicianName': 'referring_physician',
+    'InstitutionName': 'institution_name'
+})
+
+def cached_query_response(cache_key):
+    """Cached /api/pacs/query payload for cache_key, or None if absent or expired"""
+    with pacs_query_cache_lock:
+        cached = pacs_query_cache.get(cache_key)
+    if cached and cached[0] > time.monotonic():
+        return cached[1]
+    return None
+
+def cache_query_response(cache_key, payload):
+    """Store a successful /api/pacs/query payload and return it as the response"""
+    now = time.monotonic()
+    with pacs_query_cache_lock:
+        if len(pacs_query_cache) >= PACS_QUERY_CACHE_SIZE:
+            for key in [key for key, (expires, _) in pacs_query_cache.items() if expires <= now]:
+                del pacs_query_cache[key]
+            while len(pacs_query_cache) >= PACS_QUERY_CACHE_SIZE:
+                del pacs_query_cache[next(iter(pacs_query_cache))]  # Oldest entry
+        pacs_query_cache[cache_key] = (now + PACS_QUERY_TTL, payload)
+    return jsonify(payload)
+
+def invalidate_query_cache(pacs_config_id):
+    """Drop the cached query responses of a PACS whose contents have changed"""
+    with pacs_query_cache_lock:
+        for key in [key for key in pacs_query_cache if key[0] == pacs_config_id]:
+            del pacs_query_cache[key]
+
 @app.route('/api/pacs/query', methods=['POST'])
 @login_required
 def query_pacs():
     """Comprehensive PACS query with multiple search criteria"""
-    import subprocess
-    from datetime import datetime, timedelta
-    
-    # Update user activity
-    update_user_activity()
     
     data = request.json
     pacs_config_id = data.get('pacs_config_id')
@@ -2465,21 +3117,9 @@ def query_pacs():
         max_results = 100
     
     # Get PACS configuration
-    if pacs_config_id:
-        pacs_config = pacs_manager.get_config(pacs_config_id)
-        if not pacs_config:
-            return jsonify({
-                'success': False,
-                'error': 'PACS configuration not found'
-            }), 404
-    else:
-        # Use default PACS config
-        pacs_config = pacs_manager.get_default_config()
-        if not pacs_config:
-            return jsonify({
-                'success': False,
-                'error': 'No PACS configuration available'
-            }), 400
+    pacs_config, error_response = resolve_pacs_config(pacs_config_id)
+    if error_response:
+        return error_response
     
     # Check environment access for PACS query
     environment = getattr(pacs_config, 'environment', 'test')
@@ -2489,50 +3129,23 @@ def query_pacs():
             'error': f'Insufficient permissions for {environment} environment read access'
         }), 403
     
-    # Build query parameters
-    search_params = []
-    
-    # Patient Name
-    patient_name = data.get('patient_name', '').strip()
-    if patient_name:
-        # Support wildcard matching
-        if '*' not in patient_name and '?' not in patient_name:
-            patient_name = f"*{patient_name}*"
-        search_params.extend(['-k', f'PatientName={patient_name}'])
-    
-    # Patient ID
-    patient_id = data.get('patient_id', '').strip()
-    if patient_id:
-        if '*' not in patient_id and '?' not in patient_id:
-            patient_id = f"*{patient_id}*"
-        search_params.extend(['-k', f'PatientID={patient_id}'])
-    
-    # Accession Number
-    accession = data.get('accession_number', '').strip()
-    if accession:
-        if '*' not in accession and '?' not in accession:
-            accession = f"*{accession}*"
-        search_params.extend(['-k', f'AccessionNumber={accession}'])
-    
-    # Study Instance UID
-    study_uid = data.get('study_uid', '').strip()
-    if study_uid:
-        search_params.extend(['-k', f'StudyInstanceUID={study_uid}'])
-    
-    # Series Instance UID  
+    search_keys = query_search_keys(data)
+    return_keys = QUERY_RETURN_KEYS
+    if data.get('include_counts'):
+        return_keys += QUERY_COUNT_KEYS
     series_uid = data.get('series_uid', '').strip()
-    if series_uid:
-        search_params.extend(['-k', f'SeriesInstanceUID={series_uid}'])
-    
-    # Date range
     days_ago = data.get('days_ago', 0)
-    if days_ago and days_ago > 0:
-        end_date = datetime.now()
-        start_date = end_date - timedelta(days=days_ago)
-        
-        # DICOM date format: YYYYMMDD
-        date_range = f"{start_date.strftime('%Y%m%d')}-{end_date.strftime('%Y%m%d')}"
-        search_params.extend(['-k', f'StudyDate={date_range}'])
+    
+    # Request values may be any JSON type, so the key holds them serialised.
+    # Keyed by the resolved config, so a query for the default PACS shares
+    # entries and invalidations with one naming it
+    cache_key = (pacs_config.id, json.dumps([
+        max_results, bool(data.get('include_counts')), days_ago,
+        [data.get(param, '') for param, _, _ in QUERY_SEARCH_FIELDS]
+    ]))
+    cached = cached_query_response(cache_key)
+    if cached:
+        return jsonify({**cached, 'cached': True})
     
     # Create query_params for REST API fallback
     query_params = {
@@ -2545,105 +3158,37 @@ def query_pacs():
         'max_results': max_results
     }
     
-    # If no search criteria provided, add a default wildcard search to ensure PACS returns results
-    if not search_params:
-        search_params.extend(['-k', 'PatientName=*'])
-    
-    # Default query fields to retrieve (only add if not already present as search criteria)
-    # Include more fields to match the local DICOM table display
-    default_fields = [
-        'PatientName',
-        'PatientID', 
-        'StudyDate',
-        'StudyTime',
-        'StudyDescription',
-        'AccessionNumber',
-        'StudyInstanceUID',
-        'Modality',
-        'SeriesInstanceUID',
-        'SeriesNumber',
-        'SeriesDescription',
-        'NumberOfStudyRelatedSeries',
-        'NumberOfStudyRelatedInstances'
-    ]
-    
-    # Check which fields are already present as search criteria
-    existing_params = ' '.join(search_params)
-    for field in default_fields:
-        # Only add as retrieval field if not already present with a value (search criteria)
-        if f'-k {field}=' not in existing_params:
-            search_params.extend(['-k', field])
-    
     try:
         # Determine query level based on search criteria
         query_level = 'STUDY'  # Default to study level
         if series_uid:
             query_level = 'SERIES'
         
-        # Add QueryRetrieveLevel parameter 
-        search_params.extend(['-k', f'QueryRetrieveLevel={query_level}'])
-        
-        # Build findscu command
-        cmd = [
-            'findscu',
-            '-aet', pacs_config.aet_find,
-            '-aec', pacs_config.aec,
-            pacs_config.host, str(pacs_config.port),
-        ]
-        
-        # Add --cancel parameter to limit results (supported by most PACS servers)
-        cmd.insert(3, '--cancel')
-        cmd.insert(4, str(max_results))
-        
-        # Add query level flag
-        if query_level == 'STUDY':
-            cmd.append('-S')  # Study level query flag
-        elif query_level == 'SERIES':
-            cmd.append('-P')  # Patient root information model for series-level queries
-        
-        cmd.extend(search_params)
-        
-        # Store command for logging
-        cmd_string = ' '.join(cmd)
-        print(f"DEBUG: Executing PACS query command: {cmd_string}")
-        print(f"DEBUG: Max results requested: {max_results}")
-        
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            timeout=30
-        )
-        
-        print(f"DEBUG: Command exit code: {result.returncode}")
-        print(f"DEBUG: Command stdout: {result.stdout[:1000]}...")
-        print(f"DEBUG: Command stderr: {result.stderr[:1000]}...")
-        
-        # Count actual results returned
-        stdout_lines = result.stdout.split('\n') if result.stdout else []
-        study_count = stdout_lines.count('# Dicom-Data-Set') if stdout_lines else 0
-        print(f"DEBUG: Actual studies returned: {study_count}")
+        logger.debug("Max results requested: %s", max_results)
+        if PYNETDICOM_AVAILABLE:
+            query_ok, studies, command_output = c_find_studies(pacs_config, search_keys, return_keys,
+                                                               query_level, max_results)
+        else:
+            query_ok, studies, command_output = findscu_studies(pacs_config, search_keys, return_keys,
+                                                                query_level, max_results)
         
-        if result.returncode == 0:
-            # Parse DICOM query results (findscu outputs to stderr)
-            studies = parse_dicom_query_output(result.stderr, query_level)
-            
-            print(f"DEBUG: Parsed {len(studies)} studies from PACS response")
+        if query_ok:
+            logger.debug("Parsed %s studies from PACS response", len(studies))
             
             # Apply application-side result limiting as fallback
             # This ensures we respect the max_results limit even if PACS doesn't support --cancel
             if len(studies) > max_results:
-                print(f"DEBUG: PACS returned {len(studies)} results, limiting to {max_results}")
+                logger.debug("PACS returned %s results, limiting to %s", len(studies), max_results)
                 studies = studies[:max_results]
             
             # If no results from C-FIND, try REST API fallback for Orthanc PACS
             if len(studies) == 0 and pacs_config.port in [4242, 4243, 4244, 4245]:
-                print(f"DEBUG: No C-FIND results, attempting REST API fallback for {pacs_config.name}")
+                logger.debug("No C-FIND results, attempting REST API fallback for %s", pacs_config.name)
                 rest_results = query_pacs_via_rest(pacs_config, data)
                 
                 if rest_results['success'] and len(rest_results['results']) > 0:
-                    print(f"DEBUG: REST API fallback successful, returned {len(rest_results['results'])} studies")
-                    return jsonify({
+                    logger.debug("REST API fallback successful, returned %s studies", len(rest_results['results']))
+                    return cache_query_response(cache_key, {
                         'success': True,
                         'results': rest_results['results'],
                         'query_info': {
@@ -2661,16 +3206,10 @@ def query_pacs():
                             },
                             'method': 'REST API (C-FIND fallback)'
                         },
-                        'command_output': {
-                            'command': cmd_string,
-                            'output': result.stdout,
-                            'stderr': result.stderr,
-                            'exit_code': result.returncode,
-                            'fallback_used': True
-                        }
+                        'command_output': {**command_output, 'fallback_used': True}
                     })
             
-            return jsonify({
+            return cache_query_response(cache_key, {
                 'success': True,
                 'results': studies,
                 'query_info': {
@@ -2687,21 +3226,16 @@ def query_pacs():
                         'days_ago': days_ago
                     }
                 },
-                'command_output': {
-                    'command': cmd_string,
-                    'output': result.stdout,
-                    'stderr': result.stderr,
-                    'exit_code': result.returncode
-                }
+                'command_output': command_output
             })
         else:
             # Try REST API fallback for Orthanc PACS servers
-            print(f"DEBUG: C-FIND failed, attempting REST API fallback for {pacs_config.name}")
+            logger.debug("C-FIND failed, attempting REST API fallback for %s", pacs_config.name)
             rest_results = query_pacs_via_rest(pacs_config, query_params)
             
             if rest_results['success']:
-                print(f"DEBUG: REST API fallback successful, returned {len(rest_results['results'])} studies")
-                return jsonify({
+                logger.debug("REST API fallback successful, returned %s studies", len(rest_results['results']))
+                return cache_query_response(cache_key, {
                     'success': True,
                     'results': rest_results['results'],
                     'query_info': {
@@ -2719,29 +3253,18 @@ def query_pacs():
                         },
                         'method': 'REST API (C-FIND fallback)'
                     },
-                    'command_output': {
-                        'command': cmd_string,
-                        'output': result.stdout,
-                        'stderr': result.stderr,
-                        'exit_code': result.returncode,
-                        'fallback_used': True
-                    }
+                    'command_output': {**command_output, 'fallback_used': True}
                 })
             else:
                 return jsonify({
                     'success': False,
                     'error': 'PACS query failed',
                 'details': {
-                    'stdout': result.stdout,
-                    'stderr': result.stderr,
-                    'return_code': result.returncode
+                    'stdout': command_output['output'],
+                    'stderr': command_output['stderr'],
+                    'return_code': command_output['exit_code']
                 },
-                'command_output': {
-                    'command': cmd_string,
-                    'output': result.stdout,
-                    'stderr': result.stderr,
-                    'exit_code': result.returncode
-                }
+                'command_output': command_output
             }), 500
             
     except subprocess.TimeoutExpired:
@@ -2755,103 +3278,262 @@ def query_pacs():
             'error': f'Error querying PACS: {str(e)}'
         }), 500
 
-def parse_dicom_query_output(output, query_level):
-    """Parse findscu output into structured data"""
-    results = []
-    current_study = {}
+def query_search_keys(data):
+    """(keyword, value) search keys of a PACS query request, in query order"""
+    search_keys = []
+    
+    for field_name, keyword, wildcard_wrap in QUERY_SEARCH_FIELDS:
+        value = data.get(field_name, '').strip()
+        if value:
+            # Support wildcard matching
+            if wildcard_wrap and '*' not in value and '?' not in value:
+                value = f"*{value}*"
+            search_keys.append((keyword, value))
     
-    lines = output.split('\n')
-    
-    for line in lines:
-        line = line.strip()
-        
-        # Skip empty lines and certain headers
-        if not line or line.startswith('E:'):
-            continue
-            
-        # Handle lines that start with 'I:' - remove the prefix
-        if line.startswith('I: '):
-            line = line[3:]  # Remove 'I: ' prefix
-            
-        # Look for DICOM tag patterns: (0010,0010) PN [RISPACSNEW^IMEDONENEW ] #  22, 1 PatientName
-        import re
-        
-        # More flexible regex that handles the actual findscu output format
-        tag_match = re.match(r'^\(([0-9a-fA-F]{4}),([0-9a-fA-F]{4})\)\s+(\w+)\s+\[([^\]]*)\]\s*#\s*\d+,\s*\d+\s*(.+)$', line)
-        
-        if tag_match:
-            group, element, vr, value, description = tag_match.groups()
-            tag_name = description.strip()
-            
-            # Map common DICOM tags
-            field_mapping = {
-                'PatientName': 'patient_name',
-                'PatientID': 'patient_id',
-                'PatientBirthDate': 'patient_birth_date',
-                'PatientSex': 'patient_sex',
-                'StudyDate': 'study_date',
-                'StudyTime': 'study_time',
-                'StudyDescription': 'study_description',
-                'AccessionNumber': 'accession_number',
-                'StudyInstanceUID': 'study_uid',
-                'SeriesInstanceUID': 'series_uid',
-                'SeriesNumber': 'series_number',
-                'SeriesDescription': 'series_description',
-                'Modality': 'modality',
-                'NumberOfStudyRelatedSeries': 'series_count',
-                'NumberOfStudyRelatedInstances': 'instance_count',
-                'ReferringPhysicianName': 'referring_physician',
-                'InstitutionName': 'institution_name'
-            }
-            
-            if tag_name in field_mapping:
-                field_name = field_mapping[tag_name]
-                current_study[field_name] = value.strip()
-                print(f"DEBUG: Parsed field {tag_name} = {value.strip()}")
-        
-        # Also look for lines that might have just the tag and value without full description
-        # Format: (0010,0010) PN [RISPACSNEW^IMEDONEW]
-        simple_tag_match = re.match(r'^\(([0-9a-fA-F]{4}),([0-9a-fA-F]{4})\)\s+(\w+)\s+\[([^\]]*)\]$', line)
+    # Date range
+    days_ago = data.get('days_ago', 0)
+    if days_ago and days_ago > 0:
+        end_date = datetime.now()
+        start_date = end_date - timedelta(days=days_ago)
         
-        if simple_tag_match:
-            group, element, vr, value = simple_tag_match.groups()
-            
-            # Try to infer the field name from the tag coordinates
-            tag_coords = f"({group},{element})"
-            tag_mapping = {
-                "(0010,0010)": "patient_name",      # PatientName
-                "(0010,0020)": "patient_id",        # PatientID
-                "(0008,0020)": "study_date",        # StudyDate
-                "(0008,0030)": "study_time",        # StudyTime
-                "(0008,1030)": "study_description", # StudyDescription
-                "(0008,0050)": "accession_number",  # AccessionNumber
-                "(0008,0060)": "modality",          # Modality
-                "(0020,000d)": "study_uid",         # StudyInstanceUID
-                "(0020,000e)": "series_uid",        # SeriesInstanceUID
-                "(0020,0011)": "series_number",     # SeriesNumber
-                "(0008,103e)": "series_description" # SeriesDescription
-            }
-            
-            if tag_coords in tag_mapping:
-                field_name = tag_mapping[tag_coords]
-                current_study[field_name] = value.strip()
-                print(f"DEBUG: Parsed simple field {field_name} = {value.strip()}")
-        
-        # End of a result set (look for separator or new study)
-        elif (line.startswith('--') or 'Find Response:' in line) and current_study:
-            # Format the study data
-            formatted_study = format_study_result(current_study)
-            if formatted_study:
-                results.append(formatted_study)
-            current_study = {}
+        # DICOM date format: YYYYMMDD
+        date_range = f"{start_date.strftime('%Y%m%d')}-{end_date.strftime('%Y%m%d')}"
+        search_keys.append(('StudyDate', date_range))
+    
+    # If no search criteria provided, add a default wildcard search to ensure PACS returns results
+    if not search_keys:
+        search_keys.append(('PatientName', '*'))
+    
+    return search_keys
+
+def c_find_studies(pacs_config, search_keys, return_keys, query_level, max_results):
+    """Query the PACS in-process with a pynetdicom C-FIND.
+    
+    Returns (success, studies, command_output) - command_output describes the
+    request in the same shape as for findscu_studies().
+    """
+    identifier = Dataset()
+    for keyword, value in search_keys:
+        setattr(identifier, keyword, value)
+    for keyword in return_keys:
+        if keyword not in identifier:
+            setattr(identifier, keyword, '')
+    identifier.QueryRetrieveLevel = query_level
+    
+    command = (f"C-FIND {pacs_config.aet_find} -> {pacs_config.aec}@{pacs_config.host}:{pacs_config.port} "
+               f"{format_command([f'{keyword}={value}' for keyword, value in search_keys])} "
+               f"QueryRetrieveLevel={query_level}")
+    logger.debug("Executing PACS query: %s", command)
     
-    # Handle last study if exists
-    if current_study:
-        formatted_study = format_study_result(current_study)
+    try:
+        matches = c_find(pacs_config, identifier, query_level, max_results)
+    except PacsRequestError as e:
+        logger.debug("C-FIND failed: %s", e)
+        return False, [], {'command': command, 'output': '', 'stderr': str(e), 'exit_code': 1}
+    
+    studies = []
+    for match in matches:
+        study = {}
+        for keyword, field_name in QUERY_RESULT_FIELDS.items():
+            value = match.get(keyword)
+            if value is not None and value != '':
+                study[field_name] = value_text(value).strip()
+        formatted_study = format_study_result(study)
         if formatted_study:
-            results.append(formatted_study)
+            studies.append(formatted_study)
     
-    return results
+    output = f"{len(matches)} matching response(s)"
+    return True, studies, {'command': command, 'output': output, 'stderr': '', 'exit_code': 0}
+
+def findscu_studies(pacs_config, search_keys, return_keys, query_level, max_results):
+    """Query the PACS by running DCMTK findscu and parsing its output.
+    
+    Returns (success, studies, command_output).
+    """
+    search_params = []
+    for keyword, value in search_keys:
+        search_params.extend(['-k', f'{keyword}={value}'])
+    
+    # Default query fields to retrieve (only add if not already present as search criteria)
+    searched = {keyword for keyword, _ in search_keys}
+    for field in return_keys:
+        if field not in searched:
+            search_params.extend(['-k', field])
+    
+    # Add QueryRetrieveLevel parameter 
+    search_params.extend(['-k', f'QueryRetrieveLevel={query_level}'])
+    
+    # Build findscu command
+    cmd = [
+        'findscu',
+        '-aet', pacs_config.aet_find,
+        '-aec', pacs_config.aec,
+        pacs_config.host, str(pacs_config.port),
+    ]
+    
+    # Add --cancel parameter to limit results (supported by most PACS servers)
+    cmd.insert(3, '--cancel')
+    cmd.insert(4, str(max_results))
+    
+    # Add query level flag
+    if query_level == 'STUDY':
+        cmd.append('-S')  # Study level query flag
+    elif query_level == 'SERIES':
+        cmd.append('-P')  # Patient root information model for series-level queries
+    
+    cmd.extend(search_params)
+    
+    # Store command for logging
+    cmd_string = format_command(cmd)
+    logger.debug("Executing PACS query command: %s", cmd_string)
+    
+    # findscu writes the responses to stderr - parse them as they arrive
+    parser = QueryOutputParser()
+    result = run_with_stderr_stream(cmd, 30, parser.feed)
+    
+    log_command_result("Command", result)
+    if logger.isEnabledFor(logging.DEBUG):
+        # Count actual results returned
+        study_count = result.stdout.count('# Dicom-Data-Set') if result.stdout else 0
+        logger.debug("Actual studies returned: %s", study_count)
+    
+    command_output = {
+        'command': cmd_string,
+        'output': result.stdout,
+        'stderr': result.stderr,
+        'exit_code': result.returncode
+    }
+    if result.returncode != 0:
+        return False, [], command_output
+    
+    return True, parser.close(), command_output
+
+# Lines of findscu output that QueryOutputParser uses, matched across
+# the whole output in one pass. Each is either an element line, optionally
+# logged with an "I: " prefix -
+#   (0010,0010) PN [RISPACSNEW^IMEDONENEW ] #  22, 1 PatientName
+# where the length / keyword description may be missing:
+#   (0010,0010) PN [RISPACSNEW^IMEDONEW]
+# - or a boundary between responses ("--..." separator or "Find Response:").
+# Error lines ("E: ...") never match.
+QUERY_RECORD_RE = re.compile(
+    r'^[^\S\n]*(?!E:)(?:I: )?(?:'
+    r'\((?P<group>[0-9a-fA-F]{4}),(?P<element>[0-9a-fA-F]{4})\)[^\S\n]+\w+[^\S\n]+\[(?P<value>[^\]\n]*)\]'
+    r'(?:[^\S\n]*#[^\S\n]*\d+,[^\S\n]*\d+[^\S\n]*(?P<keyword>.+))?[^\S\n]*$'
+    r'|(?P<sep>--|.*Find Response:))',
+    re.MULTILINE
+)
+
+# Result fields of element lines without a keyword, by tag coordinates as findscu prints them
+QUERY_TAG_FIELDS = MappingProxyType({
+    "(0010,0010)": "patient_name",      # PatientName
+    "(0010,0020)": "patient_id",        # PatientID
+    "(0008,0020)": "study_date",        # StudyDate
+    "(0008,0030)": "study_time",        # StudyTime
+    "(0008,1030)": "study_description", # StudyDescription
+    "(0008,0050)": "accession_number",  # AccessionNumber
+    "(0008,0060)": "modality",          # Modality
+    "(0020,000d)": "study_uid",         # StudyInstanceUID
+    "(0020,000e)": "series_uid",        # SeriesInstanceUID
+    "(0020,0011)": "series_number",     # SeriesNumber
+    "(0008,103e)": "series_description" # SeriesDescription
+})
+
+class QueryOutputParser:
+    """Incremental parser of findscu output into study results.
+    
+    Output can be fed in chunks as findscu writes it - only complete lines are
+    parsed, and a trailing partial line waits for the next chunk.
+    """
+    
+    def __init__(self):
+        self.results = []
+        self.current_study = {}
+        self.partial_line = ''
+    
+    def feed(self, text):
+        """Parse the complete lines of text, keeping any partial last line"""
+        text = self.partial_line + text
+        end = text.rfind('\n') + 1
+        self.partial_line = text[end:]
+        self.parse(text[:end])
+    
+    def close(self):
+        """Parse the remaining output and return the study results"""
+        self.parse(self.partial_line)
+        self.partial_line = ''
+        # Handle last study if exists
+        self.finish_study()
+        return self.results
+    
+    def finish_study(self):
+        if self.current_study:
+            formatted_study = format_study_result(self.current_study)
+            if formatted_study:
+                self.results.append(formatted_study)
+            self.current_study = {}
+    
+    def parse(self, output):
+        current_study = self.current_study
+        for record in QUERY_RECORD_RE.finditer(output):
+            if record.group('sep') is not None:
+                # End of a result set (separator or new response)
+                self.finish_study()
+                current_study = self.current_study
+                continue
+            
+            value = record.group('value').strip()
+            description = record.group('keyword')
+            if description:
+                # Map common DICOM tags
+                tag_name = description.strip()
+                if tag_name in QUERY_RESULT_FIELDS:
+                    current_study[QUERY_RESULT_FIELDS[tag_name]] = value
+                    logger.debug("Parsed field %s = %s", tag_name, value)
+            else:
+                # No description - infer the field name from the tag coordinates
+                field_name = QUERY_TAG_FIELDS.get(f"({record.group('group')},{record.group('element')})")
+                if field_name:
+                    current_study[field_name] = value
+                    logger.debug("Parsed simple field %s = %s", field_name, value)
+
+# Query responses repeat the same few dates and times across studies, so each
+# distinct value is parsed once rather than once per study. Plain digit
+# strings - nearly all values - are converted from their components, which is
+# much cheaper than strptime and accepts exactly the same strings
+@lru_cache(maxsize=4096)
+def format_dicom_date(value):
+    """A DICOM DA value (YYYYMMDD) as YYYY-MM-DD, or None if it isn't a valid date"""
+    try:
+        if value.isascii() and value.isdigit():
+            return datetime(int(value[:4]), int(value[4:6]), int(value[6:])).strftime('%Y-%m-%d')
+        return datetime.strptime(value, '%Y%m%d').strftime('%Y-%m-%d')
+    except ValueError:
+        return None
+
+@lru_cache(maxsize=4096)
+def format_dicom_time(value):
+    """A DICOM TM value (HHMMSS) as HH:MM:SS, or None if it isn't a valid time"""
+    try:
+        if value.isascii() and value.isdigit():
+            return datetime(1900, 1, 1, int(value[:2]), int(value[2:4]), int(value[4:])).strftime('%H:%M:%S')
+        return datetime.strptime(value, '%H%M%S').strftime('%H:%M:%S')
+    except ValueError:
+        return None
+
+# Modality codes looked for anywhere in a series description, in order of
+# precedence when several appear: code -> modality reported
+SERIES_DESCRIPTION_MODALITIES = {
+    'CT': 'CT',
+    'MR': 'MR',
+    'DX': 'DX',
+    'CR': 'DX',
+    'US': 'US'
+}
+
+# Finds every code in one scan. No code ends with a letter another starts
+# with, so matches never overlap and none are missed
+SERIES_MODALITY_RE = re.compile('|'.join(SERIES_DESCRIPTION_MODALITIES), re.IGNORECASE)
 
 def format_study_result(study_data):
     """Format and validate study result data"""
@@ -2861,26 +3543,21 @@ def format_study_result(study_data):
     # Format date if present
     study_date = study_data.get('study_date', '')
     if study_date and len(study_date) == 8:
-        try:
-            # Convert YYYYMMDD to readable format
-            date_obj = datetime.strptime(study_date, '%Y%m%d')
-            study_data['formatted_date'] = date_obj.strftime('%Y-%m-%d')
-        except:
-            study_data['formatted_date'] = study_date
+        # Convert YYYYMMDD to readable format
+        study_data['formatted_date'] = format_dicom_date(study_date) or study_date
     else:
         study_data['formatted_date'] = study_date
     
     # Format time if present
     study_time = study_data.get('study_time', '')
     if study_time and len(study_time) >= 6:
-        try:
-            # Convert HHMMSS to readable format
-            time_obj = datetime.strptime(study_time[:6], '%H%M%S')
-            formatted_time = time_obj.strftime('%H:%M:%S')
+        # Convert HHMMSS to readable format
+        formatted_time = format_dicom_time(study_time[:6])
+        if formatted_time:
             study_data['formatted_time'] = formatted_time
             # Replace the original time with formatted version for display
             study_data['study_time'] = formatted_time
-        except:
+        else:
             study_data['formatted_time'] = study_time
     else:
         study_data['formatted_time'] = study_time
@@ -2888,12 +3565,8 @@ def format_study_result(study_data):
     # Format patient birth date if present
     birth_date = study_data.get('patient_birth_date', '')
     if birth_date and len(birth_date) == 8:
-        try:
-            # Convert YYYYMMDD to readable format
-            date_obj = datetime.strptime(birth_date, '%Y%m%d')
-            study_data['patient_birth_date'] = date_obj.strftime('%Y-%m-%d')
-        except:
-            pass  # Keep original value if parsing fails
+        # Convert YYYYMMDD to readable format, keeping the original value if parsing fails
+        study_data['patient_birth_date'] = format_dicom_date(birth_date) or birth_date
     
     # Convert numeric fields
     for field in ['series_count', 'instance_count']:
@@ -2908,17 +3581,11 @@ def format_study_result(study_data):
         # Try to get modality from series if available
         if 'series_description' in study_data and study_data['series_description']:
             # Extract modality from series description if it contains modality info
-            series_desc = study_data['series_description'].upper()
-            if 'CT' in series_desc:
-                study_data['modality'] = 'CT'
-            elif 'MR' in series_desc:
-                study_data['modality'] = 'MR'
-            elif 'DX' in series_desc or 'CR' in series_desc:
-                study_data['modality'] = 'DX'
-            elif 'US' in series_desc:
-                study_data['modality'] = 'US'
-            else:
-                study_data['modality'] = 'Unknown'
+            found = {code.upper() for code in SERIES_MODALITY_RE.findall(study_data['series_description'])}
+            study_data['modality'] = next(
+                (modality for code, modality in SERIES_DESCRIPTION_MODALITIES.items() if code in found),
+                'Unknown'
+            )
         else:
             study_data['modality'] = 'Unknown'
     
@@ -2935,59 +3602,43 @@ def check_pacs_routing(source_pacs, destination_pacs):
     Pre-flight check to verify if destination PACS is reachable from source PACS.
     This helps detect routing issues before attempting C-MOVE operations.
     """
-    import subprocess
     
     try:
+        # The two probes are independent, so send them at the same time
         # Test 1: Check if destination PACS is reachable via DICOM echo
-        echo_cmd = [
-            'echoscu',
-            '-aet', 'DICOMFAB',
-            '-aec', destination_pacs.aec,
-            destination_pacs.host, str(destination_pacs.port)
-        ]
-        
-        echo_result = subprocess.run(
-            echo_cmd,
-            capture_output=True,
-            text=True,
-            timeout=10
+        echo_future = pacs_probe_executor.submit(
+            echo_pacs, 'DICOMFAB', destination_pacs.aec, destination_pacs.host, destination_pacs.port, timeout=10,
+            max_age=ROUTING_CHECK_TTL
+        )
+        # Test 2: Check if source PACS can reach destination PACS
+        # This simulates what the source PACS would need to do for C-MOVE
+        source_echo_future = pacs_probe_executor.submit(
+            echo_pacs, source_pacs.aec, destination_pacs.aec, destination_pacs.host, destination_pacs.port, timeout=10,
+            max_age=ROUTING_CHECK_TTL
         )
         
-        if echo_result.returncode != 0:
+        echo_ok, echo_command, echo_exit_code, echo_stderr = echo_future.result()
+        if not echo_ok:
+            source_echo_future.cancel()
             return {
                 'success': False,
                 'error': f'Destination PACS {destination_pacs.name} ({destination_pacs.aec}@{destination_pacs.host}:{destination_pacs.port}) is not reachable',
                 'details': {
-                    'echo_command': ' '.join(echo_cmd),
-                    'echo_exit_code': echo_result.returncode,
-                    'echo_stderr': echo_result.stderr
+                    'echo_command': echo_command,
+                    'echo_exit_code': echo_exit_code,
+                    'echo_stderr': echo_stderr
                 }
             }
         
-        # Test 2: Check if source PACS can reach destination PACS
-        # This simulates what the source PACS would need to do for C-MOVE
-        source_echo_cmd = [
-            'echoscu',
-            '-aet', source_pacs.aec,
-            '-aec', destination_pacs.aec,
-            destination_pacs.host, str(destination_pacs.port)
-        ]
-        
-        source_echo_result = subprocess.run(
-            source_echo_cmd,
-            capture_output=True,
-            text=True,
-            timeout=10
-        )
-        
-        if source_echo_result.returncode != 0:
+        source_echo_ok, source_echo_command, source_echo_exit_code, source_echo_stderr = source_echo_future.result()
+        if not source_echo_ok:
             return {
                 'success': False,
                 'error': f'Source PACS {source_pacs.name} cannot reach destination PACS {destination_pacs.name}. This indicates a routing configuration issue.',
                 'details': {
-                    'source_echo_command': ' '.join(source_echo_cmd),
-                    'source_echo_exit_code': source_echo_result.returncode,
-                    'source_echo_stderr': source_echo_result.stderr,
+                    'source_echo_command': source_echo_command,
+                    'source_echo_exit_code': source_echo_exit_code,
+                    'source_echo_stderr': source_echo_stderr,
                     'suggestion': 'The source PACS may not have the destination PACS configured in its routing table.'
                 }
             }
@@ -3073,35 +3724,18 @@ def configure_pacs_routing():
 
 def configure_orthanc_routing(source_pacs, destination_pacs):
     """Configure routing between Orthanc PACS servers"""
-    import requests
-    
-    # Orthanc credentials (from docker-compose.yml and default settings)
-    orthanc_credentials = {
-        'localhost:4242': ('test', 'test123'),
-        'localhost:4243': ('test2', 'test456'),
-        'localhost:4244': ('test', 'test123'),  # Assuming same credentials
-        'localhost:4245': ('orthanc', 'orthanc')   # Default Orthanc credentials
-    }
-    
     source_key = f"{source_pacs.host}:{source_pacs.port}"
     dest_key = f"{destination_pacs.host}:{destination_pacs.port}"
     
-    if source_key not in orthanc_credentials:
+    if source_key not in ORTHANC_CREDENTIALS:
         return {
             'success': False,
             'error': f'No credentials available for source PACS {source_pacs.name}',
             'details': {'source_pacs': source_key}
         }
     
-    username, password = orthanc_credentials[source_key]
-    # Orthanc web port mapping from docker-compose.yml
-    web_port_mapping = {
-        4242: 8042,  # orthanc-test-pacs
-        4243: 8043,  # orthanc-test-pacs-2
-        4244: 8044,  # testpacs-test
-        4245: 8045   # testpacs-prod
-    }
-    web_port = web_port_mapping.get(source_pacs.port, source_pacs.port + 8000)
+    username, password = ORTHANC_CREDENTIALS[source_key]
+    web_port = orthanc_web_port(source_pacs.port)
     
     try:
         # Add destination PACS to source PACS modalities
@@ -3111,7 +3745,7 @@ def configure_orthanc_routing(source_pacs, destination_pacs):
             'Port': destination_pacs.port
         }
         
-        response = requests.put(
+        response = orthanc_session.put(
             f'http://localhost:{web_port}/modalities/{destination_pacs.aec}',
             json=routing_data,
             auth=(username, password),
@@ -3151,11 +3785,167 @@ def configure_orthanc_routing(source_pacs, destination_pacs):
             'details': {'exception': str(e)}
         }
 
+# Final C-MOVE statuses and the error shown for them; 0xC000-0xCFFF are all
+# "unable to process"
+C_MOVE_SUCCESS_STATUSES = (0x0000, 0xB000)  # Success, or some sub-operations failed
+C_MOVE_STATUS_ERRORS = {
+    0xA801: 'C-MOVE failed: Destination PACS not found or not configured in source PACS routing table.',
+    0xA701: 'C-MOVE failed: Source PACS is out of resources and could not work out the instances to send.',
+    0xA702: 'C-MOVE failed: Source PACS ran out of resources while sending the study.',
+    0xAA00: 'C-MOVE failed: Source PACS does not support C-MOVE operations or is not properly configured.',
+}
+
+# Characters of movescu stdout / stderr returned in a C-MOVE response, kept
+# from the end where the final status and any errors are
+MOVESCU_OUTPUT_CHARS = 4096
+
+def c_move_pacs_study(source_pacs, move_ae, study_uid, patient_id, on_progress=None):
+    """Move a study in-process with a pynetdicom C-MOVE, reusing a pooled
+    association with the source PACS.
+    
+    on_progress, if given, is called with the remaining, completed, failed
+    and warning sub-operation counts of each pending response.
+    Returns (success, error_message, command_output) - command_output has the
+    same shape as for movescu_study().
+    """
+    identifier = Dataset()
+    identifier.QueryRetrieveLevel = 'STUDY'
+    identifier.StudyInstanceUID = study_uid
+    keys = [f'StudyInstanceUID={study_uid}']
+    if patient_id:
+        identifier.PatientID = patient_id
+        keys.append(f'PatientID={patient_id}')
+    
+    command = (f"C-MOVE {source_pacs.aet_find} -> {source_pacs.aec}@{source_pacs.host}:{source_pacs.port} "
+               f"{format_command(keys)} QueryRetrieveLevel=STUDY MoveDestination={move_ae}")
+    logger.debug("C-MOVE command: %s", command)
+    
+    def report_progress(status):
+        on_progress({
+            'remaining': status.get('NumberOfRemainingSuboperations'),
+            'completed': status.get('NumberOfCompletedSuboperations'),
+            'failed': status.get('NumberOfFailedSuboperations'),
+            'warning': status.get('NumberOfWarningSuboperations')
+        })
+    
+    try:
+        status = c_move(source_pacs, identifier, move_ae, report_progress if on_progress else None)
+    except AssociationError as e:
+        logger.debug("C-MOVE failed: %s", e)
+        return (False,
+                'C-MOVE failed: Cannot connect to source PACS. Check if the PACS server is running and accessible.',
+                {'command': command, 'output': '', 'stderr': str(e), 'exit_code': 1})
+    except PacsRequestError as e:
+        logger.debug("C-MOVE failed: %s", e)
+        return (False, 'C-MOVE operation failed - check command output for details',
+                {'command': command, 'output': '', 'stderr': str(e), 'exit_code': 1})
+    
+    output = (f"Status 0x{status.Status:04X}: "
+              f"{status.get('NumberOfCompletedSuboperations', 0)} completed, "
+              f"{status.get('NumberOfFailedSuboperations', 0)} failed, "
+              f"{status.get('NumberOfWarningSuboperations', 0)} warning sub-operation(s)")
+    logger.debug("C-MOVE result: %s", output)
+    
+    if status.Status in C_MOVE_SUCCESS_STATUSES:
+        return True, None, {'command': command, 'output': output, 'stderr': '', 'exit_code': 0}
+    
+    if 0xC000 <= status.Status <= 0xCFFF:
+        error_message = 'C-MOVE failed: Source PACS cannot process the move request. This usually means the source PACS is not configured to send to the destination PACS.'
+    else:
+        error_message = C_MOVE_STATUS_ERRORS.get(
+            status.Status, 'C-MOVE operation failed - check command output for details'
+        )
+    return False, error_message, {'command': command, 'output': output, 'stderr': '', 'exit_code': 1}
+
+def movescu_study(source_pacs, move_ae, study_uid, patient_id):
+    """Move a study by running DCMTK movescu.
+    
+    Returns (success, error_message, command_output).
+    """
+    # movescu connects to source PACS and requests it to send study to destination
+    cmd = [
+        'movescu',
+        '-v',  # Verbose output
+        '-aet', source_pacs.aet_find,  # Our AE title for C-FIND
+        '-aec', source_pacs.aec,  # Source PACS AE title
+        '-aem', move_ae,  # Destination AE title from routing table
+        source_pacs.host, str(source_pacs.port),  # Source PACS connection
+        '-k', f'StudyInstanceUID={study_uid}',  # Study to move
+        '-k', 'QueryRetrieveLevel=STUDY'  # Query/retrieve level
+    ]
+    
+    # Add patient ID if provided for additional filtering
+    if patient_id:
+        cmd.extend(['-k', f'PatientID={patient_id}'])
+    
+    # Store command for logging
+    cmd_string = format_command(cmd)
+    logger.debug("C-MOVE command: %s", cmd_string)
+    
+    # Execute the command
+    result = subprocess.run(
+        cmd,
+        capture_output=True,
+        text=True,
+        timeout=120  # 2 minute timeout for C-MOVE operations
+    )
+    
+    log_command_result("C-MOVE", result)
+    
+    # Check for success - movescu typically returns 0 on success
+    # Also look for success indicators in the output
+    success_indicators = [
+        'Move operation completed successfully',
+        'C-MOVE-RSP',
+        'Status: Success'
+    ]
+    
+    error_indicators = [
+        'Association Request Failed',
+        'No Move Destination',
+        'Move SCP Failed',
+        'Connection refused',
+        'Timeout'
+    ]
+    
+    output_text = (result.stdout + result.stderr).lower()
+    has_success = any(indicator.lower() in output_text for indicator in success_indicators)
+    has_error = any(indicator.lower() in output_text for indicator in error_indicators)
+    
+    # Determine success based on exit code and output content
+    is_success = (result.returncode == 0) or has_success
+    
+    if has_error:
+        is_success = False
+    
+    command_output = {
+        'command': cmd_string,
+        'output': result.stdout[-MOVESCU_OUTPUT_CHARS:],
+        'stderr': result.stderr[-MOVESCU_OUTPUT_CHARS:],
+        'exit_code': result.returncode
+    }
+    if is_success:
+        return True, None, command_output
+    
+    # Provide more helpful error messages based on common C-MOVE issues
+    error_message = 'C-MOVE operation failed - check command output for details'
+    
+    # Check for specific error patterns
+    if 'UnableToProcess' in result.stderr:
+        error_message = 'C-MOVE failed: Source PACS cannot process the move request. This usually means the source PACS is not configured to send to the destination PACS.'
+    elif 'Association Request Failed' in result.stderr:
+        error_message = 'C-MOVE failed: Cannot connect to source PACS. Check if the PACS server is running and accessible.'
+    elif 'No Move Destination' in result.stderr:
+        error_message = 'C-MOVE failed: Destination PACS not found or not configured in source PACS routing table.'
+    elif 'Move SCP Failed' in result.stderr:
+        error_message = 'C-MOVE failed: Source PACS does not support C-MOVE operations or is not properly configured.'
+    
+    return False, error_message, command_output
+
 @app.route('/api/pacs/c-move', methods=['POST'])
 @login_required
 def c_move_study():
     """Perform C-MOVE operation to transfer study between PACS servers"""
-    import subprocess
     
     data = request.json
     source_pacs_id = data.get('source_pacs_id')
@@ -3211,124 +4001,90 @@ def c_move_study():
             'suggestion': 'Configure the C-MOVE routing table or use C-STORE to directly send the study to the destination PACS.'
         }), 400
     
+    # Async mode: run the move on a background worker and let the client
+    # poll /api/pacs/c-move/<job_id> for progress and the result
+    if data.get('async'):
+        job_id = str(uuid.uuid4())
+        progress = {}
+        future = c_move_executor.submit(run_c_move, source_pacs, destination_pacs, move_ae, study_uid,
+                                        patient_id, progress.update)
+        track_job(c_move_jobs, job_id, (future, progress, session.get('user_id')), future)
+        return jsonify({'success': True, 'status': 'pending', 'job_id': job_id}), 202
+    
+    payload, status_code = run_c_move(source_pacs, destination_pacs, move_ae, study_uid, patient_id)
+    return jsonify(payload), status_code
+
+@app.route('/api/pacs/c-move/<job_id>', methods=['GET'])
+@login_required
+def get_c_move_job(job_id):
+    """Get the progress or result of a queued C-MOVE job"""
+    prune_finished_jobs(c_move_jobs)
+    job = c_move_jobs.get(job_id)
+    # Jobs are only visible to the user who submitted them
+    if job is None or job[2] != session.get('user_id'):
+        return jsonify({'success': False, 'error': 'C-MOVE job not found'}), 404
+    
+    future, progress, _ = job
+    if not future.done():
+        return jsonify({'success': True, 'status': 'pending', 'job_id': job_id, 'progress': dict(progress)})
+    
+    # Finished jobs are handed out once
+    discard_job(c_move_jobs, job_id)
+    payload, status_code = future.result()
+    return jsonify({**payload, 'status': 'completed' if payload['success'] else 'failed'}), status_code
+
+def run_c_move(source_pacs, destination_pacs, move_ae, study_uid, patient_id, on_progress=None):
+    """Move a study and build the C-MOVE API response.
+    
+    on_progress is called with the sub-operation counts while an in-process
+    move runs. Returns (payload, HTTP status code).
+    """
     try:
-        # Build movescu command for C-MOVE operation
-        # movescu connects to source PACS and requests it to send study to destination
-        cmd = [
-            'movescu',
-            '-v',  # Verbose output
-            '-aet', source_pacs.aet_find,  # Our AE title for C-FIND
-            '-aec', source_pacs.aec,  # Source PACS AE title
-            '-aem', move_ae,  # Destination AE title from routing table
-            source_pacs.host, str(source_pacs.port),  # Source PACS connection
-            '-k', f'StudyInstanceUID={study_uid}',  # Study to move
-            '-k', 'QueryRetrieveLevel=STUDY'  # Query/retrieve level
-        ]
-        
-        # Add patient ID if provided for additional filtering
-        if patient_id:
-            cmd.extend(['-k', f'PatientID={patient_id}'])
-        
-        print(f"DEBUG: C-MOVE command: {' '.join(cmd)}")
-        
-        # Execute the command
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            timeout=120  # 2 minute timeout for C-MOVE operations
-        )
-        
-        print(f"DEBUG: C-MOVE exit code: {result.returncode}")
-        print(f"DEBUG: C-MOVE stdout: {result.stdout[:1000]}...")
-        print(f"DEBUG: C-MOVE stderr: {result.stderr[:1000]}...")
-        
-        # Check for success - movescu typically returns 0 on success
-        # Also look for success indicators in the output
-        success_indicators = [
-            'Move operation completed successfully',
-            'C-MOVE-RSP',
-            'Status: Success'
-        ]
-        
-        error_indicators = [
-            'Association Request Failed',
-            'No Move Destination',
-            'Move SCP Failed',
-            'Connection refused',
-            'Timeout'
-        ]
-        
-        output_text = result.stdout + result.stderr
-        has_success = any(indicator.lower() in output_text.lower() for indicator in success_indicators)
-        has_error = any(indicator.lower() in output_text.lower() for indicator in error_indicators)
-        
-        # Determine success based on exit code and output content
-        is_success = (result.returncode == 0) or has_success
-        
-        if has_error:
-            is_success = False
+        if PYNETDICOM_AVAILABLE:
+            is_success, error_message, command_output = c_move_pacs_study(
+                source_pacs, move_ae, study_uid, patient_id, on_progress
+            )
+        else:
+            is_success, error_message, command_output = movescu_study(source_pacs, move_ae, study_uid, patient_id)
         
         if is_success:
-            return jsonify({
+            invalidate_query_cache(destination_pacs.id)
+            return {
                 'success': True,
                 'message': f'C-MOVE operation completed - study transferred from {source_pacs.name} to {destination_pacs.name}',
                 'source_pacs': source_pacs.name,
                 'destination_pacs': destination_pacs.name,
                 'study_uid': study_uid,
-                'command_output': {
-                    'command': ' '.join(cmd),
-                    'output': result.stdout,
-                    'stderr': result.stderr,
-                    'exit_code': result.returncode
-                }
-            })
+                'command_output': command_output
+            }, 200
         else:
-            # Provide more helpful error messages based on common C-MOVE issues
-            error_message = 'C-MOVE operation failed - check command output for details'
-            
-            # Check for specific error patterns
-            if 'UnableToProcess' in result.stderr:
-                error_message = 'C-MOVE failed: Source PACS cannot process the move request. This usually means the source PACS is not configured to send to the destination PACS.'
-            elif 'Association Request Failed' in result.stderr:
-                error_message = 'C-MOVE failed: Cannot connect to source PACS. Check if the PACS server is running and accessible.'
-            elif 'No Move Destination' in result.stderr:
-                error_message = 'C-MOVE failed: Destination PACS not found or not configured in source PACS routing table.'
-            elif 'Move SCP Failed' in result.stderr:
-                error_message = 'C-MOVE failed: Source PACS does not support C-MOVE operations or is not properly configured.'
-            
-            return jsonify({
+            return {
                 'success': False,
                 'error': error_message,
                 'details': {
-                    'stdout': result.stdout,
-                    'stderr': result.stderr,
-                    'return_code': result.returncode
-                },
-                'command_output': {
-                    'command': ' '.join(cmd),
-                    'output': result.stdout,
-                    'stderr': result.stderr,
-                    'exit_code': result.returncode
+                    'stdout': command_output['output'],
+                    'stderr': command_output['stderr'],
+                    'return_code': command_output['exit_code']
                 },
+                'command_output': command_output,
                 'suggestion': 'Consider using C-STORE to directly send the study to the destination PACS, or configure DICOM routing between the PACS servers.'
-            }), 500
+            }, 500
             
     except subprocess.TimeoutExpired:
-        return jsonify({
+        return {
             'success': False,
             'error': 'C-MOVE operation timeout - operation took too long to complete'
-        }), 500
+        }, 500
     except FileNotFoundError:
-        return jsonify({
+        return {
             'success': False,
             'error': 'movescu command not found - please install DCMTK tools'
-        }), 500
+        }, 500
     except Exception as e:
-        return jsonify({
+        return {
             'success': False,
             'error': f'Error executing C-MOVE: {str(e)}'
-        }), 500
+        }, 500
 
 @app.route('/api/pacs/reload-config', methods=['POST'])
 def reload_pacs_config():
@@ -3376,79 +4132,207 @@ def parse_orm_message():
             'error': f'Error parsing ORM message: {str(e)}'
         }), 500
 
+# Procedure name / code terms that imply a modality, checked in this order -
+# the first modality with a term anywhere in the text wins
+MODALITY_PATTERNS = {
+    'CT': (
+        'ct', 'computed tomography', 'cat scan', 'axial', 'spiral', 'helical',
+        'contrast ct', 'ct scan', 'cta', 'ct angiogram', 'ct head', 'ct chest',
+        'ct abdomen', 'ct pelvis', 'ct brain', 'ct spine'
+    ),
+    'MR': (
+        'mr', 'mri', 'magnetic resonance', 'nmr', 'flair', 't1', 't2', 'dwi',
+        'diffusion', 'gradient echo', 'spin echo', 'mr angiogram', 'mra',
+        'mr brain', 'mr spine', 'mr knee', 'mr shoulder'
+    ),
+    'US': (
+        'us', 'ultrasound', 'sonography', 'sono', 'echo', 'doppler', 
+        'obstetric', 'ob', 'fetal', 'echocardiogram', 'cardiac echo',
+        'abdominal us', 'pelvic us', 'renal us', 'thyroid us'
+    ),
+    'XA': (
+        'angio', 'angiography', 'angiogram', 'catheter', 'interventional',
+        'fluoroscopy', 'cath', 'cardiac cath', 'coronary', 'peripheral',
+        'cerebral angio', 'carotid', 'renal angio'
+    ),
+    'RF': (
+        'fluoroscopy', 'fluoro', 'barium', 'contrast study', 'upper gi',
+        'lower gi', 'small bowel', 'esophagram', 'swallow study',
+        'defecography', 'cystography', 'urethrography'
+    ),
+    'NM': (
+        'nuclear', 'scintigraphy', 'scan', 'bone scan', 'thyroid scan',
+        'liver scan', 'kidney scan', 'gallium', 'technetium', 'spect',
+        'myocardial perfusion', 'stress test', 'thallium'
+    ),
+    'PT': (
+        'pet', 'positron emission', 'fdg', 'glucose', 'pet scan',
+        'pet/ct', 'oncology', 'tumor', 'metabolic'
+    ),
+    'MG': (
+        'mammo', 'mammography', 'mammogram', 'breast', 'tomosynthesis',
+        'breast imaging', 'screening mammo', 'diagnostic mammo'
+    ),
+    'CR': (
+        'computed radiography', 'digital radiography', 'portable',
+        'bedside', 'mobile'
+    ),
+    'DX': (
+        'x-ray', 'xray', 'radiography', 'plain film', 'chest', 'abdomen',
+        'pelvis', 'extremity', 'spine', 'skull', 'rib', 'pa', 'ap', 'lateral',
+        'pa chest', 'ap chest', 'lat chest', 'cxr', 'kub', 'bone',
+        'joint', 'hand', 'foot', 'ankle', 'knee', 'shoulder', 'elbow'
+    )
+}
+
+# Two-letter abbreviations that are also common inside longer words
+# ("fraCTure", "lobe", "sPAce"), so they only match as whole words
+MODALITY_WORD_TERMS = frozenset({'ct', 'mr', 'us', 'ob', 'pa', 'ap'})
+
+def modality_term_pattern(term):
+    pattern = re.escape(term)
+    return rf'\b{pattern}\b' if term in MODALITY_WORD_TERMS else pattern
+
+# All terms in one pattern, with a named group per modality in precedence
+# order. It is a lookahead, so finditer tries every position of the text and
+# reports the highest-precedence modality with a term starting there
+MODALITY_PATTERN_RE = re.compile('(?=' + '|'.join(
+    f"(?P<{modality}>{'|'.join(map(modality_term_pattern, terms))})"
+    for modality, terms in MODALITY_PATTERNS.items()
+) + ')')
+
+# ORM messages tend to repeat the same few procedures, so each distinct
+# name / code pair is only scanned once
+@lru_cache(maxsize=4096)
 def infer_modality_from_procedure(procedure_name, procedure_code):
     """Infer DICOM modality from procedure name and code"""
     
     # Convert to lowercase for pattern matching
     text = f"{procedure_name} {procedure_code}".lower()
     
-    # Define modality inference patterns
-    modality_patterns = {
-        'CT': [
-            'ct', 'computed tomography', 'cat scan', 'axial', 'spiral', 'helical',
-            'contrast ct', 'ct scan', 'cta', 'ct angiogram', 'ct head', 'ct chest',
-            'ct abdomen', 'ct pelvis', 'ct brain', 'ct spine'
-        ],
-        'MR': [
-            'mr', 'mri', 'magnetic resonance', 'nmr', 'flair', 't1', 't2', 'dwi',
-            'diffusion', 'gradient echo', 'spin echo', 'mr angiogram', 'mra',
-            'mr brain', 'mr spine', 'mr knee', 'mr shoulder'
-        ],
-        'US': [
-            'us', 'ultrasound', 'sonography', 'sono', 'echo', 'doppler', 
-            'obstetric', 'ob', 'fetal', 'echocardiogram', 'cardiac echo',
-            'abdominal us', 'pelvic us', 'renal us', 'thyroid us'
-        ],
-        'XA': [
-            'angio', 'angiography', 'angiogram', 'catheter', 'interventional',
-            'fluoroscopy', 'cath', 'cardiac cath', 'coronary', 'peripheral',
-            'cerebral angio', 'carotid', 'renal angio'
-        ],
-        'RF': [
-            'fluoroscopy', 'fluoro', 'barium', 'contrast study', 'upper gi',
-            'lower gi', 'small bowel', 'esophagram', 'swallow study',
-            'defecography', 'cystography', 'urethrography'
-        ],
-        'NM': [
-            'nuclear', 'scintigraphy', 'scan', 'bone scan', 'thyroid scan',
-            'liver scan', 'kidney scan', 'gallium', 'technetium', 'spect',
-            'myocardial perfusion', 'stress test', 'thallium'
-        ],
-        'PT': [
-            'pet', 'positron emission', 'fdg', 'glucose', 'pet scan',
-            'pet/ct', 'oncology', 'tumor', 'metabolic'
-        ],
-        'MG': [
-            'mammo', 'mammography', 'mammogram', 'breast', 'tomosynthesis',
-            'breast imaging', 'screening mammo', 'diagnostic mammo'
-        ],
-        'CR': [
-            'computed radiography', 'digital radiography', 'portable',
-            'bedside', 'mobile'
-        ],
-        'DX': [
-            'x-ray', 'xray', 'radiography', 'plain film', 'chest', 'abdomen',
-            'pelvis', 'extremity', 'spine', 'skull', 'rib', 'pa', 'ap', 'lateral',
-            'pa chest', 'ap chest', 'lat chest', 'cxr', 'kub', 'bone',
-            'joint', 'hand', 'foot', 'ankle', 'knee', 'shoulder', 'elbow'
-        ]
-    }
-    
-    # Check each modality pattern
-    for modality, patterns in modality_patterns.items():
-        for pattern in patterns:
-            if pattern in text:
-                return modality
+    found = {match.lastgroup for match in MODALITY_PATTERN_RE.finditer(text)}
     
     # Default to DX if no pattern matches
-    return 'DX'
+    return next((modality for modality in MODALITY_PATTERNS if modality in found), 'DX')
+
+def read_pid_segment(fields, result, order):
+    """Patient identification segment"""
+    # PID|1||PatientID^^^System^Type|InternalID|LastName^FirstName||YYYYMMDD|Sex
+    field_count = len(fields)
+    
+    if field_count > 3 and fields[3]:
+        # Extract patient ID from PID-3 (Patient Identifier List)
+        result['patient_id'] = fields[3].partition('^^^')[0]
+    
+    if field_count > 5 and fields[5]:
+        # Extract patient name from PID-5 (Patient Name)
+        name_parts = fields[5].split('^', 2)
+        if len(name_parts) >= 2:
+            result['patient_name'] = f"{name_parts[0]}^{name_parts[1]}"
+        else:
+            result['patient_name'] = fields[5]
+    
+    if field_count > 7 and fields[7]:
+        # Extract birth date from PID-7 (Date/Time of Birth)
+        birth_date = fields[7]
+        # Convert YYYYMMDD to DICOM format if needed
+        if len(birth_date) >= 8:
+            result['birth_date'] = birth_date[:8]
+    
+    if field_count > 8 and fields[8]:
+        # Extract sex from PID-8 (Administrative Sex)
+        result['sex'] = fields[8]
+
+def read_orc_segment(fields, result, order):
+    """Order common segment"""
+    if len(fields) > 3 and fields[3]:
+        # Extract accession number from ORC-3 (Filler Order Number)
+        order['accession'] = fields[3]
+
+# HL7 escape sequences in text fields and the characters they stand for.
+# \S\ (component separator) has always been shown as a space, and line
+# breaks become spaces too, as the text ends up in single-line DICOM fields
+HL7_ESCAPES = {
+    'F': '|',
+    'S': ' ',
+    'T': '&',
+    'R': '~',
+    'E': '\\',
+    '.br': ' '
+}
+
+HL7_ESCAPE_RE = re.compile(r'\\(F|S|T|R|E|\.br)\\')
+
+def unescape_hl7(text):
+    """Replace the HL7 escape sequences of a text field in one pass"""
+    if '\\' not in text:
+        return text
+    return HL7_ESCAPE_RE.sub(lambda match: HL7_ESCAPES[match.group(1)], text)
+
+def read_obr_segment(fields, result, order):
+    """Order detail segment - each OBR becomes a separate study"""
+    
+    # Extract study accession from OBR-3 (Filler Order Number) 
+    study_accession = None
+    if len(fields) > 3 and fields[3]:
+        study_accession = fields[3]
+    else:
+        study_accession = order['accession']
+    
+    # Extract study date from OBR-7 (Observation Date/Time)
+    study_date = ''
+    if len(fields) > 7 and fields[7]:
+        observation_date = fields[7]
+        # Convert HL7 datetime (YYYYMMDDHHMMSS) to DICOM date format (YYYYMMDD)
+        if len(observation_date) >= 8:
+            study_date = observation_date[:8]
+    
+    if len(fields) > 4 and fields[4]:
+        # Extract procedure from OBR-4 (Universal Service Identifier)
+        procedure_field = fields[4]
+        procedure_parts = procedure_field.split('^', 2)
+        
+        procedure_code = procedure_parts[0] if procedure_parts else 'UNKNOWN'
+        procedure_name = procedure_parts[1] if len(procedure_parts) > 1 else procedure_code
+        
+        # Clean up procedure name - remove HL7 formatting
+        procedure_name = unescape_hl7(procedure_name)
+        
+        # Infer modality from procedure name/code
+        inferred_modality = infer_modality_from_procedure(procedure_name, procedure_code)
+        
+        # Create a study for this OBR
+        study_data = {
+            'accession_number': study_accession,
+            'study_date': study_date,
+            'study_description': procedure_name,
+            'procedure_code': procedure_code,
+            'procedure_name': procedure_name,
+            'modality': inferred_modality,
+            'series': [
+                {
+                    'images': 1,  # Default to 1 image per series
+                    'modality': inferred_modality,
+                    'series_description': procedure_name,
+                    'compression': 'uncompressed'
+                }
+            ]
+        }
+        
+        result['studies'].append(study_data)
+
+# Segments parse_hl7_orm reads: segment type -> (number of '|' splits needed
+# to reach the last field used, reader). The rest of a segment is left
+# unsplit, and other segments (MSH, PV1, ...) are skipped without being split
+ORM_SEGMENT_READERS = {
+    'PID': (9, read_pid_segment),  # Up to PID-8
+    'ORC': (4, read_orc_segment),  # Up to ORC-3
+    'OBR': (8, read_obr_segment)   # Up to OBR-7
+}
 
 def parse_hl7_orm(orm_message):
     """Parse HL7 ORM message and extract studies data (one study per OBR)"""
     
-    # Split message into segments
-    segments = [line.strip() for line in orm_message.split('\n') if line.strip()]
-    
     # Initialize data structure - changed to support multiple studies
     result = {
         'patient_name': '',
@@ -3458,104 +4342,20 @@ def parse_hl7_orm(orm_message):
         'studies': []  # Changed from 'series' to 'studies'
     }
     
-    current_accession = None
+    # State carried between segments - the accession of the last ORC
+    order = {'accession': None}
     
-    for segment in segments:
-        if not segment:
+    # Looked up once rather than for every segment
+    get_reader = ORM_SEGMENT_READERS.get
+    
+    for line in orm_message.split('\n'):
+        segment = line.strip()
+        reader = get_reader(segment[:3])
+        if reader is None or segment[3:4] not in ('|', ''):
             continue
-            
-        fields = segment.split('|')
-        segment_type = fields[0] if fields else ''
         
-        if segment_type == 'MSH':
-            # Message header - could extract sending facility, timestamp, etc.
-            pass
-            
-        elif segment_type == 'PID':
-            # Patient identification segment
-            if len(fields) > 5:
-                # PID|1||PatientID^^^System^Type|InternalID|LastName^FirstName||YYYYMMDD|Sex
-                if len(fields) > 3 and fields[3]:
-                    # Extract patient ID from PID-3 (Patient Identifier List)
-                    patient_id_field = fields[3].split('^^^')
-                    result['patient_id'] = patient_id_field[0] if patient_id_field else ''
-                
-                if len(fields) > 5 and fields[5]:
-                    # Extract patient name from PID-5 (Patient Name)
-                    name_parts = fields[5].split('^')
-                    if len(name_parts) >= 2:
-                        result['patient_name'] = f"{name_parts[0]}^{name_parts[1]}"
-                    else:
-                        result['patient_name'] = fields[5]
-                
-                if len(fields) > 7 and fields[7]:
-                    # Extract birth date from PID-7 (Date/Time of Birth)
-                    birth_date = fields[7]
-                    # Convert YYYYMMDD to DICOM format if needed
-                    if len(birth_date) >= 8:
-                        result['birth_date'] = birth_date[:8]
-                
-                if len(fields) > 8 and fields[8]:
-                    # Extract sex from PID-8 (Administrative Sex)
-                    result['sex'] = fields[8]
-        
-        elif segment_type == 'ORC':
-            # Order common segment
-            if len(fields) > 3 and fields[3]:
-                # Extract accession number from ORC-3 (Filler Order Number)
-                current_accession = fields[3]
-        
-        elif segment_type == 'OBR':
-            # Order detail segment - each OBR becomes a separate study
-            
-            # Extract study accession from OBR-3 (Filler Order Number) 
-            study_accession = None
-            if len(fields) > 3 and fields[3]:
-                study_accession = fields[3]
-            else:
-                study_accession = current_accession
-            
-            # Extract study date from OBR-7 (Observation Date/Time)
-            study_date = ''
-            if len(fields) > 7 and fields[7]:
-                observation_date = fields[7]
-                # Convert HL7 datetime (YYYYMMDDHHMMSS) to DICOM date format (YYYYMMDD)
-                if len(observation_date) >= 8:
-                    study_date = observation_date[:8]
-            
-            if len(fields) > 4 and fields[4]:
-                # Extract procedure from OBR-4 (Universal Service Identifier)
-                procedure_field = fields[4]
-                procedure_parts = procedure_field.split('^')
-                
-                procedure_code = procedure_parts[0] if procedure_parts else 'UNKNOWN'
-                procedure_name = procedure_parts[1] if len(procedure_parts) > 1 else procedure_code
-                
-                # Clean up procedure name - remove HL7 formatting
-                procedure_name = procedure_name.replace('\\S\\', ' ')
-                
-                # Infer modality from procedure name/code
-                inferred_modality = infer_modality_from_procedure(procedure_name, procedure_code)
-                
-                # Create a study for this OBR
-                study_data = {
-                    'accession_number': study_accession,
-                    'study_date': study_date,
-                    'study_description': procedure_name,
-                    'procedure_code': procedure_code,
-                    'procedure_name': procedure_name,
-                    'modality': inferred_modality,
-                    'series': [
-                        {
-                            'images': 1,  # Default to 1 image per series
-                            'modality': inferred_modality,
-                            'series_description': procedure_name,
-                            'compression': 'uncompressed'
-                        }
-                    ]
-                }
-                
-                result['studies'].append(study_data)
+        max_splits, read_segment = reader
+        read_segment(segment.split('|', max_splits), result, order)
     
     return result
 
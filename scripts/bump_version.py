@@ -13,12 +13,17 @@ Usage:
     major: 1.0.1 -> 2.0.0 (for breaking changes)
 """
 
+import mmap
 import os
 import sys
 import re
 from datetime import datetime
 from pathlib import Path
 
+# First version heading of the changelog ("## [1.2.3] - 2025-01-01"), where
+# new entries are inserted
+CHANGELOG_HEADING_RE = re.compile(r'^## \[.*\] - ', re.MULTILINE)
+
 def read_version():
     """Read current version from VERSION file"""
     version_file = Path("VERSION")
@@ -26,16 +31,11 @@ def read_version():
         print("❌ VERSION file not found!")
         sys.exit(1)
     
-    with open(version_file, 'r') as f:
-        version = f.read().strip()
-    
-    return version
+    return version_file.read_text().strip()
 
 def write_version(version):
     """Write new version to VERSION file"""
-    version_file = Path("VERSION")
-    with open(version_file, 'w') as f:
-        f.write(version + '\n')
+    Path("VERSION").write_text(version + '\n')
     print(f"✅ Updated VERSION file to {version}")
 
 def bump_version(current_version, bump_type="patch"):
@@ -94,25 +94,23 @@ def update_changelog(new_version, bump_type):
 
 """
     
-    # Insert new entry after the header
-    lines = content.split('\n')
-    insert_index = 0
-    
-    # Find where to insert (after the header section)
-    for i, line in enumerate(lines):
-        if line.startswith('## [') and '] - ' in line:
-            insert_index = i
-            break
-    
-    # Insert new entry
-    lines.insert(insert_index, new_entry)
+    # Insert new entry after the header, before the latest version
+    heading = CHANGELOG_HEADING_RE.search(content)
+    insert_at = heading.start() if heading else 0
     
     # Write updated changelog
     with open(changelog_file, 'w') as f:
-        f.write('\n'.join(lines))
+        f.write(content[:insert_at] + new_entry + '\n' + content[insert_at:])
     
     print(f"✅ Updated CHANGELOG.md with version {new_version}")
 
+def file_contains(file_obj, text):
+    """Whether a file contains text, searched in a memory map rather than read in"""
+    if file_obj.stat().st_size == 0:
+        return False  # Empty files can't be mapped
+    with open(file_obj, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        return mm.find(text.encode()) != -1
+
 def update_files_with_version(old_version, new_version):
     """Update version references in other files"""
     files_to_update = [
@@ -122,7 +120,8 @@ def update_files_with_version(old_version, new_version):
     
     for file_path in files_to_update:
         file_obj = Path(file_path)
-        if file_obj.exists():
+        # Most files don't mention the old version, so only those that do are read
+        if file_obj.exists() and file_contains(file_obj, old_version):
             with open(file_obj, 'r') as f:
                 content = f.read()
             
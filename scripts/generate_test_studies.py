@@ -7,7 +7,8 @@ import os
 import sys
 import json
 from datetime import datetime, timedelta
-import random
+
+import numpy as np
 
 # Add src directory to path
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
@@ -38,13 +39,14 @@ def generate_test_studies(num_studies=50):
         {"name": "MARTINEZ^CHRISTOPHER", "id": "PID100009"},
     ]
     
-    # Add patients to registry
-    for patient in test_patients:
-        if patient["id"] not in patient_registry.patients:
-            patient_registry.generate_patient(
-                patient_name=patient["name"],
-                patient_id=patient["id"]
-            )
+    # Add patients to registry, saving them once
+    with patient_registry.deferred_saves():
+        for patient in test_patients:
+            if patient["id"] not in patient_registry.patients:
+                patient_registry.generate_patient(
+                    patient_name=patient["name"],
+                    patient_id=patient["id"]
+                )
     
     # Generate studies over the last 30 days
     base_date = datetime.now() - timedelta(days=30)
@@ -65,65 +67,77 @@ def generate_test_studies(num_studies=50):
     
     generated_studies = []
     
-    for i in range(num_studies):
-        # Random date within last 30 days
-        study_date = base_date + timedelta(days=random.randint(0, 30))
-        study_time = datetime.now().replace(
-            hour=random.randint(8, 18),
-            minute=random.randint(0, 59),
-            second=random.randint(0, 59)
-        )
-        
-        # Random patient
-        patient = random.choice(test_patients)
-        
-        # Random modality and description
-        modality = random.choice(modalities)
-        description = random.choice(study_descriptions)
-        
-        # Generate unique accession number
-        accession = f"ACC{study_date.strftime('%Y%m%d')}{i+1:04d}"
-        
-        # Create study parameters
-        study_params = {
-            "patient_name": patient["name"],
-            "patient_id": patient["id"],
-            "study_date": study_date.strftime("%Y%m%d"),
-            "study_time": study_time.strftime("%H%M%S"),
-            "study_description": f"{description} - Test Study {i+1}",
-            "accession_number": accession,
-            "modality": modality,
-            "series_count": random.randint(1, 5),
-            "images_per_series": random.randint(1, 10)
-        }
-        
-        try:
-            # Generate the study
-            study_result = fabricator.create_dx_dicom_study(
-                patient_name=study_params["patient_name"],
-                patient_id=study_params["patient_id"],
-                accession=study_params["accession_number"],
-                study_desc=study_params["study_description"],
-                study_date=study_params["study_date"],
-                series_config=[{
-                    'images': study_params["images_per_series"],
-                    'procedure': f"{study_params['modality']}-{study_params['modality']}"
-                }] * study_params["series_count"]
-            )
-            study_uid = study_result['study_uid']
-            
-            generated_studies.append({
-                "study_uid": study_uid,
-                "accession": accession,
-                "patient": patient["name"],
+    # Draw the random choices of every study up front, one array per attribute
+    rng = np.random.default_rng()
+    day_offsets = rng.integers(0, 31, size=num_studies).tolist()  # Within the last 30 days
+    hours = rng.integers(8, 19, size=num_studies).tolist()
+    minutes = rng.integers(0, 60, size=num_studies).tolist()
+    seconds = rng.integers(0, 60, size=num_studies).tolist()
+    patient_indexes = rng.integers(0, len(test_patients), size=num_studies).tolist()
+    modality_indexes = rng.integers(0, len(modalities), size=num_studies).tolist()
+    description_indexes = rng.integers(0, len(study_descriptions), size=num_studies).tolist()
+    series_counts = rng.integers(1, 6, size=num_studies).tolist()
+    images_per_series = rng.integers(1, 11, size=num_studies).tolist()
+    
+    # Only 31 dates are possible, so format each once
+    study_dates = [(base_date + timedelta(days=offset)).strftime('%Y%m%d') for offset in range(31)]
+    
+    # Study counts are saved once at the end rather than after every study
+    with patient_registry.deferred_saves():
+        for i in range(num_studies):
+            study_date = study_dates[day_offsets[i]]
+            study_time = f"{hours[i]:02d}{minutes[i]:02d}{seconds[i]:02d}"
+
+            # Random patient
+            patient = test_patients[patient_indexes[i]]
+
+            # Random modality and description
+            modality = modalities[modality_indexes[i]]
+            description = study_descriptions[description_indexes[i]]
+
+            # Generate unique accession number
+            accession = f"ACC{study_date}{i+1:04d}"
+
+            # Create study parameters
+            study_params = {
+                "patient_name": patient["name"],
+                "patient_id": patient["id"],
+                "study_date": study_date,
+                "study_time": study_time,
+                "study_description": f"{description} - Test Study {i+1}",
+                "accession_number": accession,
                 "modality": modality,
-                "description": study_params["study_description"]
-            })
-            
-            print(f"Generated study {i+1}/{num_studies}: {accession} - {patient['name']} - {modality}")
-            
-        except Exception as e:
-            print(f"Error generating study {i+1}: {e}")
+                "series_count": series_counts[i],
+                "images_per_series": images_per_series[i]
+            }
+
+            try:
+                # Generate the study
+                study_result = fabricator.create_dx_dicom_study(
+                    patient_name=study_params["patient_name"],
+                    patient_id=study_params["patient_id"],
+                    accession=study_params["accession_number"],
+                    study_desc=study_params["study_description"],
+                    study_date=study_params["study_date"],
+                    series_config=[{
+                        'images': study_params["images_per_series"],
+                        'procedure': f"{study_params['modality']}-{study_params['modality']}"
+                    }] * study_params["series_count"]
+                )
+                study_uid = study_result['study_uid']
+
+                generated_studies.append({
+                    "study_uid": study_uid,
+                    "accession": accession,
+                    "patient": patient["name"],
+                    "modality": modality,
+                    "description": study_params["study_description"]
+                })
+
+                print(f"Generated study {i+1}/{num_studies}: {accession} - {patient['name']} - {modality}")
+
+            except Exception as e:
+                print(f"Error generating study {i+1}: {e}")
     
     print(f"\nSuccessfully generated {len(generated_studies)} studies")
     print("Studies are ready for PACS testing")
@@ -4,6 +4,7 @@ Migration script for PACS configurations to new AE title structure
 """
 
 import json
+import shutil
 import sys
 import os
 from pathlib import Path
@@ -31,10 +32,7 @@ def migrate_pacs_configs():
     
     # Create backup
     print(f"Creating backup: {backup_path}")
-    with open(config_path, 'r') as f:
-        backup_data = f.read()
-    with open(backup_path, 'w') as f:
-        f.write(backup_data)
+    shutil.copyfile(config_path, backup_path)
     
     # Load existing configurations
     print("Loading existing configurations...")
@@ -78,11 +76,10 @@ def migrate_pacs_configs():
     
     # Pre-populate routing tables
     print("Pre-populating routing tables...")
+    config_ids = list(migrated_configs)
     for source_id, source_config in migrated_configs.items():
-        for dest_id, dest_config in migrated_configs.items():
-            if source_id != dest_id:
-                # Add empty entry for manual configuration
-                source_config['move_routing'][dest_id] = ""
+        # Add an empty entry for each other PACS, for manual configuration
+        source_config['move_routing'] = {dest_id: "" for dest_id in config_ids if dest_id != source_id}
     
     # Save migrated configurations
     print(f"Saving migrated configurations to: {config_path}")
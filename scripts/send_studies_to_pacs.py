@@ -7,10 +7,43 @@ import os
 import sys
 import subprocess
 import json
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from itertools import islice
 from pathlib import Path
 
-def send_studies_to_pacs(pacs_host="localhost", pacs_port=4242, pacs_aec="ORTHANC", aet="DICOMFAB"):
-    """Send all studies from dicom_output directory to PACS"""
+def send_files(cmd_prefix, dicom_files):
+    """Send DICOM files with one storescu run, over a single association.
+    
+    Allows 30 seconds per file. Returns (files, success, message).
+    """
+    if len(dicom_files) == 1:
+        description = dicom_files[0].name
+    else:
+        description = f"{len(dicom_files)} files ({dicom_files[0].name} - {dicom_files[-1].name})"
+    try:
+        result = subprocess.run(
+            cmd_prefix + [str(dicom_file) for dicom_file in dicom_files],
+            capture_output=True,
+            text=True,
+            timeout=30 * len(dicom_files)
+        )
+        if result.returncode == 0:
+            return dicom_files, True, f"Successfully sent {description}"
+        return dicom_files, False, f"Failed to send {description}: {result.stderr}"
+    except subprocess.TimeoutExpired:
+        return dicom_files, False, f"Timeout sending {description}"
+    except Exception as e:
+        return dicom_files, False, f"Error sending {description}: {e}"
+
+def send_studies_to_pacs(pacs_host="localhost", pacs_port=4242, pacs_aec="ORTHANC", aet="DICOMFAB", workers=8,
+                         batch_size=50):
+    """Send all studies from dicom_output directory to PACS.
+    
+    Files are sent in batches of up to `batch_size` per storescu run, so each
+    batch shares one association. Sending is network bound, so up to
+    `workers` batches are sent at the same time. The directory is walked
+    while sending, so the first batch goes out as soon as it is found.
+    """
     
     print(f"Sending studies to PACS: {pacs_aec}@{pacs_host}:{pacs_port}")
     
@@ -20,56 +53,54 @@ def send_studies_to_pacs(pacs_host="localhost", pacs_port=4242, pacs_aec="ORTHAN
         print("Error: dicom_output directory not found")
         return False
     
-    # Find all .dcm files recursively
-    dicom_files = list(dicom_output_dir.rglob("*.dcm"))
-    
-    if not dicom_files:
-        print("No DICOM files found in dicom_output directory")
-        return False
-    
-    print(f"Found {len(dicom_files)} DICOM files to send")
+    # Find all .dcm files recursively, in batches
+    dicom_files = dicom_output_dir.rglob("*.dcm")
+    batch_size = max(1, batch_size)
+    batches = iter(lambda: list(islice(dicom_files, batch_size)), [])
     
     successful_sends = 0
     failed_sends = 0
     
-    for i, dicom_file in enumerate(dicom_files):
-        try:
-            # Use storescu to send the DICOM file
-            cmd = [
-                'storescu',
-                '-aet', aet,
-                '-aec', pacs_aec,
-                pacs_host, str(pacs_port),
-                str(dicom_file)
-            ]
-            
-            print(f"Sending {i+1}/{len(dicom_files)}: {dicom_file.name}...")
-            
-            result = subprocess.run(
-                cmd,
-                capture_output=True,
-                text=True,
-                timeout=30
-            )
-            
-            if result.returncode == 0:
-                successful_sends += 1
-                print(f"  ✓ Successfully sent {dicom_file.name}")
+    # Use storescu to send each DICOM file
+    cmd_prefix = [
+        'storescu',
+        '-aet', aet,
+        '-aec', pacs_aec,
+        pacs_host, str(pacs_port)
+    ]
+    
+    workers = max(1, workers)
+    pending = set()
+    
+    def collect(done):
+        nonlocal successful_sends, failed_sends
+        for future in done:
+            batch, success, message = future.result()
+            if success:
+                successful_sends += len(batch)
             else:
-                failed_sends += 1
-                print(f"  ✗ Failed to send {dicom_file.name}: {result.stderr}")
-                
-        except subprocess.TimeoutExpired:
-            failed_sends += 1
-            print(f"  ✗ Timeout sending {dicom_file.name}")
-        except Exception as e:
-            failed_sends += 1
-            print(f"  ✗ Error sending {dicom_file.name}: {e}")
+                failed_sends += len(batch)
+            print(f"Sent {successful_sends + failed_sends} files: {'✓' if success else '✗'} {message}")
+    
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for batch in batches:
+            # Keep only a couple of batches queued per worker, so the walk
+            # stays just ahead of the uploads rather than listing everything
+            if len(pending) >= 2 * workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+            pending.add(executor.submit(send_files, cmd_prefix, batch))
+        collect(as_completed(pending))
+    
+    total = successful_sends + failed_sends
+    if not total:
+        print("No DICOM files found in dicom_output directory")
+        return False
     
     print(f"\nSend operation completed:")
     print(f"  Successful: {successful_sends}")
     print(f"  Failed: {failed_sends}")
-    print(f"  Total: {len(dicom_files)}")
+    print(f"  Total: {total}")
     
     return successful_sends > 0
 
@@ -129,6 +160,8 @@ if __name__ == "__main__":
     parser.add_argument("--port", type=int, default=4242, help="PACS port (default: 4242)")
     parser.add_argument("--aec", default="ORTHANC", help="PACS AEC (default: ORTHANC)")
     parser.add_argument("--aet", default="DICOMFAB", help="Local AET (default: DICOMFAB)")
+    parser.add_argument("--workers", type=int, default=8, help="Batches sent in parallel (default: 8)")
+    parser.add_argument("--batch-size", type=int, default=50, help="Files sent per association (default: 50)")
     parser.add_argument("--send-only", action="store_true", help="Only send studies, don't test limits")
     parser.add_argument("--test-only", action="store_true", help="Only test limits, don't send studies")
     
@@ -136,7 +169,7 @@ if __name__ == "__main__":
     
     if not args.test_only:
         print("Step 1: Sending studies to PACS...")
-        success = send_studies_to_pacs(args.host, args.port, args.aec, args.aet)
+        success = send_studies_to_pacs(args.host, args.port, args.aec, args.aet, args.workers, args.batch_size)
         
         if not success:
             print("Failed to send studies to PACS")
@@ -5,7 +5,43 @@ Test script to verify max_results functionality in PACS queries
 
 import requests
 import json
-import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# HTTP session of each worker thread - requests.Session isn't thread-safe,
+# so the workers don't share one
+worker_sessions = threading.local()
+
+def worker_session():
+    """This thread's HTTP session, kept alive across the queries it runs"""
+    session = getattr(worker_sessions, 'session', None)
+    if session is None:
+        session = worker_sessions.session = requests.Session()
+    return session
+
+def query_pacs(base_url, limit):
+    """Run one PACS query with the given max_results, returning the response or the error raised"""
+    # Prepare query data
+    query_data = {
+        "pacs_config_id": None,  # Use default PACS
+        "max_results": limit,
+        "patient_name": "",  # Search all patients
+        "patient_id": "",
+        "accession_number": "",
+        "study_uid": "",
+        "series_uid": "",
+        "days_ago": 0
+    }
+    
+    try:
+        # Send query to PACS
+        return worker_session().post(
+            f"{base_url}/api/pacs/query",
+            json=query_data,
+            timeout=30
+        )
+    except requests.exceptions.RequestException as e:
+        return e
 
 def test_max_results():
     """Test PACS query with different max_results values"""
@@ -18,29 +54,19 @@ def test_max_results():
     print("Testing PACS query max_results functionality...")
     print("=" * 50)
     
-    for limit in test_limits:
+    # The queries are independent, so they all run at once and are reported
+    # in order afterwards
+    with ThreadPoolExecutor(max_workers=len(test_limits)) as executor:
+        responses = list(executor.map(lambda limit: query_pacs(base_url, limit), test_limits))
+    
+    for limit, response in zip(test_limits, responses):
         print(f"\nTesting with max_results = {limit}")
         
-        # Prepare query data
-        query_data = {
-            "pacs_config_id": None,  # Use default PACS
-            "max_results": limit,
-            "patient_name": "",  # Search all patients
-            "patient_id": "",
-            "accession_number": "",
-            "study_uid": "",
-            "series_uid": "",
-            "days_ago": 0
-        }
+        if isinstance(response, requests.exceptions.RequestException):
+            print(f"  ✗ Request failed: {response}")
+            continue
         
         try:
-            # Send query to PACS
-            response = requests.post(
-                f"{base_url}/api/pacs/query",
-                json=query_data,
-                timeout=30
-            )
-            
             if response.status_code == 200:
                 data = response.json()
                 
@@ -71,13 +97,8 @@ def test_max_results():
             else:
                 print(f"  ✗ HTTP error: {response.status_code}")
                 
-        except requests.exceptions.RequestException as e:
-            print(f"  ✗ Request failed: {e}")
         except Exception as e:
             print(f"  ✗ Error: {e}")
-        
-        # Small delay between tests
-        time.sleep(1)
     
     print("\n" + "=" * 50)
     print("Max results testing completed!")
@@ -394,63 +394,65 @@ class DICOMFabricator:
             'series': []
         }
         
-        # Generate each series
-        for series_idx, series_info in enumerate(series_config, 1):
-            series_uid = generate_uid()
-            series_folder = study_folder / f"Series{series_idx:03d}_{series_info['procedure']}"
-            series_folder.mkdir(exist_ok=True)
-            
-            # Generate consistent shapes/symbols for this entire series
-            available_shapes = ['triangle', 'star', 'circle', 'moon', 'square', 'pentagon', 'octagon']
-            available_letters = ['A', 'B', 'C', 'D', 'E', 'F', 'G', 'H', 'I', 'J']
-            available_numbers = ['0', '1', '2', '3', '4', '5', '6', '7', '8', '9']
-            
-            # Select exactly 6 random items total for this series
-            all_available = available_shapes + available_letters + available_numbers
-            series_shapes = random.sample(all_available, 6)
-            random.shuffle(series_shapes)
-            
-            # Create the shapes description for this series
-            shapes_text = ", ".join(series_shapes)
-            series_description_with_shapes = f"Image: {shapes_text}"
-            
-            series_files = []
-            
-            # Generate images for this series (all using the same shapes)
-            for image_idx in range(series_info['images']):
-                image_result = self.create_dx_dicom(
-                    patient_name=patient_name,
-                    patient_id=patient_id,
-                    accession=accession,  # Use study-level accession
-                    study_desc=study_desc,
-                    study_date=study_date,
-                    study_uid=study_uid,
-                    series_uid=series_uid,
-                    series_number=series_idx,
-                    instance_number=image_idx + 1,
-                    procedure_code=series_info['procedure'],
-                    modality=series_info.get('modality', 'DX'),
-                    series_description=series_info.get('series_description'),
-                    series_shapes=series_shapes,  # Pass consistent shapes
-                    series_description_with_shapes=series_description_with_shapes,  # Pass consistent description
-                    output_dir=str(series_folder)
-                )
-                
-                series_files.append({
-                    'filename': Path(image_result['filepath']).name,
-                    'filepath': image_result['filepath'],
-                    'instance_number': image_idx + 1
+        # Generate each series. Every image records a use of the patient, so
+        # registry saves are held until the whole study is written
+        with self.patient_registry.deferred_saves():
+            for series_idx, series_info in enumerate(series_config, 1):
+                series_uid = generate_uid()
+                series_folder = study_folder / f"Series{series_idx:03d}_{series_info['procedure']}"
+                series_folder.mkdir(exist_ok=True)
+
+                # Generate consistent shapes/symbols for this entire series
+                available_shapes = ['triangle', 'star', 'circle', 'moon', 'square', 'pentagon', 'octagon']
+                available_letters = ['A', 'B', 'C', 'D', 'E', 'F', 'G', 'H', 'I', 'J']
+                available_numbers = ['0', '1', '2', '3', '4', '5', '6', '7', '8', '9']
+
+                # Select exactly 6 random items total for this series
+                all_available = available_shapes + available_letters + available_numbers
+                series_shapes = random.sample(all_available, 6)
+                random.shuffle(series_shapes)
+
+                # Create the shapes description for this series
+                shapes_text = ", ".join(series_shapes)
+                series_description_with_shapes = f"Image: {shapes_text}"
+
+                series_files = []
+
+                # Generate images for this series (all using the same shapes)
+                for image_idx in range(series_info['images']):
+                    image_result = self.create_dx_dicom(
+                        patient_name=patient_name,
+                        patient_id=patient_id,
+                        accession=accession,  # Use study-level accession
+                        study_desc=study_desc,
+                        study_date=study_date,
+                        study_uid=study_uid,
+                        series_uid=series_uid,
+                        series_number=series_idx,
+                        instance_number=image_idx + 1,
+                        procedure_code=series_info['procedure'],
+                        modality=series_info.get('modality', 'DX'),
+                        series_description=series_info.get('series_description'),
+                        series_shapes=series_shapes,  # Pass consistent shapes
+                        series_description_with_shapes=series_description_with_shapes,  # Pass consistent description
+                        output_dir=str(series_folder)
+                    )
+
+                    series_files.append({
+                        'filename': Path(image_result['filepath']).name,
+                        'filepath': image_result['filepath'],
+                        'instance_number': image_idx + 1
+                    })
+
+                result['series'].append({
+                    'series_number': series_idx,
+                    'series_uid': series_uid,
+                    'procedure': series_info['procedure'],
+                    'modality': series_info.get('modality', 'DX'),
+                    'series_description': series_info.get('series_description', ''),
+                    'folder': str(series_folder),
+                    'files': series_files
                 })
-            
-            result['series'].append({
-                'series_number': series_idx,
-                'series_uid': series_uid,
-                'procedure': series_info['procedure'],
-                'modality': series_info.get('modality', 'DX'),
-                'series_description': series_info.get('series_description', ''),
-                'folder': str(series_folder),
-                'files': series_files
-            })
         
         return result
     
@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+"""
+In-memory index of generated DICOM files
+Copyright (c) 2025 Christopher Gentle <chris@flatmapit.com>
+"""
+
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import cached_property
+from itertools import repeat
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+from dataclasses import dataclass, field
+
+import pydicom
+from pydicom.datadict import tag_for_keyword
+from pydicom.tag import Tag
+
+
+# Header attributes kept for each file - everything the file, tree and study
+# listings display, so those endpoints never have to open the files themselves
+INDEX_KEYWORDS = (
+    'PatientName',
+    'PatientID',
+    'StudyDate',
+    'StudyTime',
+    'StudyDescription',
+    'SeriesDescription',
+    'SeriesNumber',
+    'InstanceNumber',
+    'Modality',
+    'AccessionNumber',
+    'StudyInstanceUID',
+    'SeriesInstanceUID',
+    'SOPInstanceUID',
+)
+
+
+def keyword_tags(keywords) -> Tuple[Tuple[str, Tag], ...]:
+    """Pair each DICOM keyword with its tag, for use with tag_values()"""
+    return tuple((keyword, Tag(tag_for_keyword(keyword))) for keyword in keywords)
+
+
+def tag_values(ds, pairs, default: Optional[str] = None) -> Dict[str, str]:
+    """String values of the given (keyword, tag) pairs in a dataset.
+    
+    Elements are looked up by tag, which skips the keyword resolution that
+    getattr() does on every access. Missing elements map to default, or are
+    left out when default is None.
+    """
+    values = {}
+    for keyword, tag in pairs:
+        elem = ds.get(tag)
+        if elem is not None:
+            values[keyword] = str(elem.value)
+        elif default is not None:
+            values[keyword] = default
+    return values
+
+
+INDEX_TAGS = keyword_tags(INDEX_KEYWORDS)
+
+# Threads used to read headers of new or modified files during a refresh
+READ_WORKERS = min(32, (os.cpu_count() or 4) * 4)
+
+
+@dataclass
+class DicomFileEntry:
+    """Header and file system metadata for a single DICOM file"""
+    path: Path
+    relative_path: Path
+    st_ctime: float
+    st_mtime: float
+    st_size: int
+    tags: Dict[str, str] = field(default_factory=dict)  # Only attributes present in the file
+    error: Optional[str] = None  # Set when the file could not be read as DICOM
+    
+    # Entries are reused until the file changes, so the display timestamps
+    # are formatted once per file rather than on every listing request
+    @cached_property
+    def created_iso(self) -> str:
+        return datetime.fromtimestamp(self.st_ctime).isoformat()
+    
+    @cached_property
+    def created_compact(self) -> str:
+        return datetime.fromtimestamp(self.st_ctime).strftime('%Y%m%d%H%M%S')
+    
+    @cached_property
+    def modified_iso(self) -> str:
+        return datetime.fromtimestamp(self.st_mtime).isoformat()
+
+
+def iter_dicom_files(root) -> Iterator[os.DirEntry]:
+    """Recursively yield directory entries for .dcm files under root.
+    
+    Files in a directory are yielded before its subdirectories are visited,
+    matching Path.rglob order. Symlinked directories are not followed.
+    """
+    subdirs = []
+    with os.scandir(root) as it:
+        for dir_entry in it:
+            if dir_entry.is_dir(follow_symlinks=False):
+                subdirs.append(dir_entry.path)
+            elif dir_entry.name.endswith('.dcm'):
+                yield dir_entry
+    for subdir in subdirs:
+        yield from iter_dicom_files(subdir)
+
+
+def read_index_entry(path: Path, root: Path, stat_result=None) -> DicomFileEntry:
+    """Read the indexed header attributes of one file.
+    
+    Only INDEX_KEYWORDS are parsed - pixel data and all other elements
+    (including sequences) are skipped.
+    """
+    stat_result = stat_result or path.stat()
+    entry = DicomFileEntry(
+        path=path,
+        relative_path=path.relative_to(root),
+        st_ctime=stat_result.st_ctime,
+        st_mtime=stat_result.st_mtime,
+        st_size=stat_result.st_size
+    )
+    try:
+        ds = pydicom.dcmread(str(path), stop_before_pixels=True, specific_tags=INDEX_KEYWORDS)
+        entry.tags = tag_values(ds, INDEX_TAGS)
+    except Exception as e:
+        entry.error = str(e)
+    return entry
+
+
+class DicomIndex:
+    """Keeps the header metadata of every .dcm file under a directory in memory.
+
+    A background thread rescans the directory periodically to pick up files
+    written by other processes; within the app, callers that add or remove
+    files call invalidate() so the next read refreshes immediately. A refresh
+    only stats unchanged files - headers are re-read for new or modified files,
+    in parallel when there is more than one.
+
+    When manifest_path is given the entries are saved there as JSON after each
+    refresh that changed them, and loaded back on startup, so a restart only
+    has to stat the existing files instead of parsing every header again.
+    """
+
+    def __init__(self, root: str, refresh_interval: int = 30, manifest_path: Optional[str] = None):
+        self.root = Path(root)
+        self.refresh_interval = refresh_interval
+        self.manifest_path = Path(manifest_path) if manifest_path else None
+        self._entries: Dict[Path, DicomFileEntry] = {}
+        self._by_name: Dict[str, List[Path]] = {}  # File name -> paths, in scan order
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._dirty = True
+        self._thread = None
+        self.load_manifest()
+
+    def load_manifest(self):
+        """Seed the index from the saved manifest, if there is one"""
+        if not self.manifest_path or not self.manifest_path.exists():
+            return
+        try:
+            with open(self.manifest_path, 'r') as f:
+                data = json.load(f)
+            if data.get('root') != str(self.root):
+                return  # Manifest belongs to a different output directory
+            entries = {}
+            for record in data.get('files', []):
+                entry = DicomFileEntry(
+                    path=Path(record['path']),
+                    relative_path=Path(record['relative_path']),
+                    st_ctime=record['st_ctime'],
+                    st_mtime=record['st_mtime'],
+                    st_size=record['st_size'],
+                    tags=record.get('tags', {}),
+                    error=record.get('error')
+                )
+                entries[entry.path] = entry
+            with self._lock:
+                self._entries = entries
+        except Exception as e:
+            print(f"Error loading DICOM index manifest: {e}")
+
+    def save_manifest(self):
+        """Write the current entries to the manifest file"""
+        if not self.manifest_path:
+            return
+        with self._lock:
+            entries = list(self._entries.values())
+        data = {
+            'root': str(self.root),
+            'files': [
+                {
+                    'path': str(entry.path),
+                    'relative_path': str(entry.relative_path),
+                    'st_ctime': entry.st_ctime,
+                    'st_mtime': entry.st_mtime,
+                    'st_size': entry.st_size,
+                    'tags': entry.tags,
+                    'error': entry.error
+                }
+                for entry in entries
+            ]
+        }
+        try:
+            self.manifest_path.parent.mkdir(parents=True, exist_ok=True)
+            # Write to a temporary file first so a crash never leaves a truncated manifest
+            tmp_path = self.manifest_path.with_suffix(self.manifest_path.suffix + '.tmp')
+            with open(tmp_path, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.manifest_path)
+        except Exception as e:
+            print(f"Error saving DICOM index manifest: {e}")
+
+    def start(self):
+        """Start the background refresh thread"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._refresh_loop, daemon=True)
+            self._thread.start()
+
+    def _refresh_loop(self):
+        while True:
+            time.sleep(self.refresh_interval)
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"Error refreshing DICOM index: {e}")
+
+    def invalidate(self):
+        """Mark the index stale so the next read rescans the directory"""
+        self._dirty = True
+
+    def refresh(self):
+        """Rescan the directory, re-reading only new or modified files"""
+        with self._refresh_lock:
+            self._dirty = False
+            with self._lock:
+                previous = self._entries
+
+            entries: Dict[Path, Optional[DicomFileEntry]] = {}
+            to_read = []
+            if self.root.exists():
+                for dir_entry in iter_dicom_files(self.root):
+                    path = Path(dir_entry.path)
+                    try:
+                        stat_result = dir_entry.stat()
+                    except OSError:
+                        continue  # Removed while scanning
+
+                    entry = previous.get(path)
+                    if (entry is None or entry.st_mtime != stat_result.st_mtime
+                            or entry.st_size != stat_result.st_size):
+                        entry = None
+                        to_read.append((path, stat_result))
+                    entries[path] = entry  # Placeholder keeps scan order
+
+            if len(to_read) > 1:
+                # Header reads are I/O bound, so a thread pool overlaps them
+                with ThreadPoolExecutor(max_workers=min(READ_WORKERS, len(to_read))) as executor:
+                    paths, stat_results = zip(*to_read)
+                    for entry in executor.map(read_index_entry, paths, repeat(self.root), stat_results):
+                        entries[entry.path] = entry
+            else:
+                for path, stat_result in to_read:
+                    entries[path] = read_index_entry(path, self.root, stat_result)
+
+            by_name: Dict[str, List[Path]] = {}
+            for path in entries:
+                by_name.setdefault(path.name, []).append(path)
+
+            with self._lock:
+                self._entries = entries
+                self._by_name = by_name
+
+            if to_read or len(entries) != len(previous):
+                self.save_manifest()
+
+    def find(self, name: str) -> Optional[Path]:
+        """Path of the first indexed file with the given file name, or None.
+        
+        A miss, or a hit on a file that has since been removed, triggers one
+        rescan so files written outside the app are still found.
+        """
+        if self._dirty:
+            self.refresh()
+        path = self._find(name)
+        if path is None or not path.exists():
+            self.refresh()
+            path = self._find(name)
+        return path
+
+    def _find(self, name: str) -> Optional[Path]:
+        with self._lock:
+            paths = self._by_name.get(name)
+            return paths[0] if paths else None
+
+    def entries(self) -> List[DicomFileEntry]:
+        """Snapshot of all indexed files, in directory scan order"""
+        if self._dirty:
+            self.refresh()
+        with self._lock:
+            return list(self._entries.values())
@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+"""
+In-process DICOM network client for configured PACS servers
+Copyright (c) 2025 Christopher Gentle <chris@flatmapit.com>
+"""
+
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+from pydicom.dataset import Dataset
+from pydicom.multival import MultiValue
+
+try:
+    from pynetdicom import AE
+    from pynetdicom.association import Association
+    from pynetdicom.sop_class import (
+        PatientRootQueryRetrieveInformationModelFind,
+        PatientRootQueryRetrieveInformationModelMove,
+        StudyRootQueryRetrieveInformationModelFind,
+        StudyRootQueryRetrieveInformationModelMove,
+        Verification,
+    )
+    from pynetdicom.pdu_primitives import SOPClassExtendedNegotiation
+    PYNETDICOM_AVAILABLE = True
+except ImportError:
+    PYNETDICOM_AVAILABLE = False
+    print("Warning: pynetdicom not installed. PACS requests will fall back to the DCMTK tools.")
+
+
+# Seconds to wait for association negotiation and for each DIMSE response
+PACS_TIMEOUT = 30
+
+# Seconds to wait for the TCP connection to a PACS
+PACS_CONNECT_TIMEOUT = 10
+
+# Seconds to wait for each response while a C-MOVE transfers a study
+MOVE_TIMEOUT = 120
+
+# Seconds an idle association is kept open for reuse. Shorter than pynetdicom's
+# network timeout, which aborts an association after 60s without traffic
+ASSOCIATION_LINGER = 30
+
+# C-FIND / C-MOVE statuses of a pending response, which carries one match or
+# reports progress
+PENDING_STATUSES = (0xFF00, 0xFF01)
+
+
+class PacsRequestError(Exception):
+    """A DICOM network request to a PACS failed"""
+
+
+class AssociationError(PacsRequestError):
+    """No association could be established with the PACS"""
+
+
+# Application entities by calling AE title - an AE only holds settings and
+# requested contexts, so one per title is shared by every association
+application_entities: Dict[str, 'AE'] = {}
+application_entities_lock = threading.Lock()
+
+# DIMSE message IDs, unique across the associations of this process
+message_ids = itertools.count(1)
+
+
+def application_entity(ae_title: str) -> 'AE':
+    """Shared AE for the given calling AE title, created on first use"""
+    with application_entities_lock:
+        ae = application_entities.get(ae_title)
+        if ae is None:
+            ae = AE(ae_title=ae_title)
+            for sop_class in (Verification,
+                              StudyRootQueryRetrieveInformationModelFind,
+                              PatientRootQueryRetrieveInformationModelFind,
+                              StudyRootQueryRetrieveInformationModelMove,
+                              PatientRootQueryRetrieveInformationModelMove):
+                ae.add_requested_context(sop_class)
+            ae.acse_timeout = PACS_TIMEOUT
+            ae.dimse_timeout = PACS_TIMEOUT
+            ae.connection_timeout = PACS_CONNECT_TIMEOUT
+            application_entities[ae_title] = ae
+        return ae
+
+
+def relational_query_negotiation() -> List['SOPClassExtendedNegotiation']:
+    """Extended negotiation items asking for relational C-FIND queries.
+
+    With relational queries a query at any level only needs the keys of that
+    level - a SERIES query by SeriesInstanceUID, or by StudyInstanceUID under
+    the Patient Root model, finds its matches in one C-FIND instead of first
+    querying the levels above for their unique keys. PACS that don't support
+    them just leave the items out of the association response.
+    """
+    items = []
+    for sop_class in (StudyRootQueryRetrieveInformationModelFind,
+                      PatientRootQueryRetrieveInformationModelFind):
+        item = SOPClassExtendedNegotiation()
+        item.sop_class_uid = sop_class
+        item.service_class_application_information = b'\x01'  # Relational queries supported
+        items.append(item)
+    return items
+
+
+def next_message_id() -> int:
+    """Message ID for a new DIMSE request (1-65535)"""
+    return next(message_ids) % 0xFFFF + 1
+
+
+class AssociationPool:
+    """Open associations kept for reuse between requests to the same PACS.
+
+    Associations are keyed by (calling AE title, called AE title, host, port).
+    A request takes an idle association or opens a new one, and hands it back
+    when done; it is released once it has been idle for the linger time. An
+    association is only ever used by one request at a time.
+
+    The pool also remembers when a request to each key last succeeded, as
+    reported by mark_success(), so callers can skip connectivity probes to a
+    PACS that just answered.
+    """
+
+    def __init__(self, linger: float = ASSOCIATION_LINGER):
+        self.linger = linger
+        self._idle: Dict[Tuple, list] = {}  # key -> [(association, expiry timer)]
+        self._last_success: Dict[Tuple, float] = {}  # key -> monotonic time
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def association(self, ae_title: str, called_ae_title: str, host: str, port: int, fresh: bool = False):
+        """Established association for the duration of a request.
+
+        The association goes back to the pool if the block completes, and is
+        aborted if it raises, since its state is then unknown. fresh skips
+        the idle associations and always opens a new one.
+        """
+        key = (ae_title, called_ae_title, host, int(port))
+        assoc = None if fresh else self._take_idle(key)
+        if assoc is None:
+            assoc = application_entity(ae_title).associate(host, int(port), ae_title=called_ae_title,
+                                                           ext_neg=relational_query_negotiation())
+            if not assoc.is_established:
+                raise AssociationError(
+                    f'Association with {called_ae_title}@{host}:{port} '
+                    f'was rejected, aborted or never connected'
+                )
+        try:
+            yield assoc
+        except BaseException:
+            if assoc.is_established:
+                assoc.abort()
+            raise
+        self._put_idle(key, assoc)
+
+    def mark_success(self, ae_title: str, called_ae_title: str, host: str, port: int):
+        """Note that a request over such an association just got a success status"""
+        self._last_success[(ae_title, called_ae_title, host, int(port))] = time.monotonic()
+
+    def recently_succeeded(self, ae_title: str, called_ae_title: str, host: str, port: int,
+                           max_age: float) -> bool:
+        """Whether a request over such an association completed within max_age seconds"""
+        last_success = self._last_success.get((ae_title, called_ae_title, host, int(port)))
+        return last_success is not None and time.monotonic() - last_success < max_age
+
+    def _take_idle(self, key):
+        with self._lock:
+            idle = self._idle.get(key)
+            while idle:
+                assoc, timer = idle.pop()
+                timer.cancel()
+                if assoc.is_established:  # The peer may have closed it meanwhile
+                    return assoc
+        return None
+
+    def _put_idle(self, key, assoc):
+        if not assoc.is_established:
+            return
+        timer = threading.Timer(self.linger, self._expire, args=(key, assoc))
+        timer.daemon = True
+        with self._lock:
+            self._idle.setdefault(key, []).append((assoc, timer))
+        timer.start()
+
+    def _expire(self, key, assoc):
+        with self._lock:
+            idle = self._idle.get(key, [])
+            for index, (idle_assoc, _) in enumerate(idle):
+                if idle_assoc is assoc:
+                    del idle[index]
+                    break
+            else:
+                return  # Taken by a request in the meantime
+        assoc.release()
+
+
+association_pool = AssociationPool()
+
+
+def value_text(value) -> str:
+    """A data element value as findscu would print it between brackets"""
+    if isinstance(value, MultiValue):
+        return '\\'.join(str(item) for item in value)
+    return str(value)
+
+
+def run_request(ae_title: str, called_ae_title: str, host: str, port: int,
+                request: Callable[['Association'], object]):
+    """Run request(assoc) over a pooled association and return its result.
+
+    pynetdicom raises RuntimeError when the association has died under the
+    request - a pooled one the peer dropped, say - and the request is then
+    retried once on a fresh association. A ValueError, raised when the PACS
+    accepted no presentation context for the request, becomes a
+    PacsRequestError like any other failure.
+    """
+    for fresh in (False, True):
+        try:
+            with association_pool.association(ae_title, called_ae_title, host, port, fresh=fresh) as assoc:
+                return request(assoc)
+        except RuntimeError as e:
+            if fresh:
+                raise PacsRequestError(f'Association with {called_ae_title}@{host}:{port} failed: {e}') from e
+        except ValueError as e:
+            raise PacsRequestError(str(e)) from e
+
+
+def accepts_context(assoc, sop_class) -> bool:
+    """Whether the PACS accepted a presentation context for sop_class"""
+    return any(context.abstract_syntax == sop_class for context in assoc.accepted_contexts)
+
+
+def c_echo(ae_title: str, called_ae_title: str, host: str, port: int) -> None:
+    """Send a C-ECHO to a PACS. Raises PacsRequestError if it isn't answered with success"""
+    status = run_request(ae_title, called_ae_title, host, port,
+                         lambda assoc: assoc.send_c_echo(msg_id=next_message_id()))
+    if not status:
+        raise PacsRequestError('C-ECHO timed out, was aborted or received an invalid response')
+    if status.Status != 0x0000:
+        raise PacsRequestError(f'C-ECHO failed with status 0x{status.Status:04X}')
+    association_pool.mark_success(ae_title, called_ae_title, host, port)
+
+
+def c_find(pacs_config, identifier: Dataset, query_level: str, max_results: int) -> List[Dataset]:
+    """Send a C-FIND to the PACS and return the matching identifiers.
+
+    Study level queries use the Study Root information model and series level
+    queries the Patient Root model, as findscu -S / -P do - or Study Root when
+    the PACS doesn't accept Patient Root queries. Once max_results matches
+    have arrived the query is cancelled, like findscu --cancel.
+    Raises PacsRequestError if the association or the query fails.
+    """
+    def find(assoc):
+        if query_level == 'SERIES' and accepts_context(assoc, PatientRootQueryRetrieveInformationModelFind):
+            query_model = PatientRootQueryRetrieveInformationModelFind
+        else:
+            query_model = StudyRootQueryRetrieveInformationModelFind
+
+        matches = []
+        cancelled = False
+        msg_id = next_message_id()
+        for status, match in assoc.send_c_find(identifier, query_model, msg_id=msg_id):
+            if not status:
+                raise PacsRequestError('C-FIND timed out, was aborted or received an invalid response')
+            if status.Status not in PENDING_STATUSES:
+                if status.Status not in (0x0000, 0xFE00):  # Success, or cancelled by us
+                    raise PacsRequestError(f'C-FIND failed with status 0x{status.Status:04X}')
+                break
+            # Matches still in flight after a cancel are read but dropped, so
+            # the association is clear for the next request
+            if match is not None and not cancelled:
+                matches.append(match)
+                if len(matches) >= max_results:
+                    assoc.send_c_cancel(msg_id, query_model=query_model)
+                    cancelled = True
+        return matches
+
+    matches = run_request(pacs_config.aet_find, pacs_config.aec, pacs_config.host, pacs_config.port, find)
+    association_pool.mark_success(pacs_config.aet_find, pacs_config.aec, pacs_config.host, pacs_config.port)
+    return matches
+
+
+def c_move(pacs_config, identifier: Dataset, move_aet: str,
+           on_pending: Optional[Callable[[Dataset], None]] = None) -> Dataset:
+    """Ask the PACS to send the identified instances to move_aet with a C-MOVE.
+
+    The Study Root model is used for study level moves and the Patient Root
+    model otherwise. on_pending is called with each pending response status,
+    whose sub-operation counts report progress. Returns the final response
+    status, whose counts describe the transfer. Raises PacsRequestError if
+    the association fails or no final status arrives.
+    """
+    if identifier.QueryRetrieveLevel == 'STUDY':
+        query_model = StudyRootQueryRetrieveInformationModelMove
+    else:
+        query_model = PatientRootQueryRetrieveInformationModelMove
+
+    def move(assoc):
+        # Sub-operations can take a while per instance, so allow longer than a query
+        assoc.dimse_timeout = MOVE_TIMEOUT
+        try:
+            for status, _ in assoc.send_c_move(identifier, move_aet, query_model, msg_id=next_message_id()):
+                if not status:
+                    raise PacsRequestError('C-MOVE timed out, was aborted or received an invalid response')
+                if status.Status not in PENDING_STATUSES:
+                    return status
+                if on_pending is not None:
+                    on_pending(status)
+        finally:
+            assoc.dimse_timeout = PACS_TIMEOUT
+        raise PacsRequestError('C-MOVE ended without a final response')
+
+    status = run_request(pacs_config.aet_find, pacs_config.aec, pacs_config.host, pacs_config.port, move)
+    if status.Status == 0x0000:
+        association_pool.mark_success(pacs_config.aet_find, pacs_config.aec, pacs_config.host, pacs_config.port)
+    return status
@@ -8,12 +8,23 @@ import json
 import string
 import random
 import re
+import threading
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Set
 from dataclasses import dataclass
 from datetime import datetime
 
 
+# Separators used when splitting names, IDs and addresses into search tokens
+_TOKEN_SPLIT_RE = re.compile(r'[\s^,]+')
+
+
+def _tokenize(text: str) -> List[str]:
+    """Split text into lowercase search tokens"""
+    return [token for token in _TOKEN_SPLIT_RE.split(text.lower()) if token]
+
+
 @dataclass
 class PatientRecord:
     """Represents a generated patient record"""
@@ -90,6 +101,12 @@ class PatientRegistry:
     def __init__(self, registry_path: str = "./data/patient_registry.json"):
         self.registry_path = Path(registry_path)
         self.patients: Dict[str, PatientRecord] = {}
+        self._name_index: Dict[str, Set[str]] = {}
+        # deferred_saves() state is per thread, so a bulk generation only
+        # holds back its own saves - edits made meanwhile by request threads
+        # are still written straight away
+        self._deferral = threading.local()
+        self._save_lock = threading.Lock()  # Serialises writes of the registry file
         self.config = self._load_default_config()
         self.id_generator = PatientIDGenerator(self.config['id_generation'])
         self.load_registry()
@@ -151,11 +168,50 @@ class PatientRegistry:
                 data = json.load(f)
                 for pid, record_dict in data.items():
                     self.patients[pid] = PatientRecord(**record_dict)
+        self._rebuild_index()
+        
+    def _rebuild_index(self):
+        """Rebuild the token -> patient key index used by search_patients"""
+        index: Dict[str, Set[str]] = {}
+        for pid, record in self.patients.items():
+            self._index_record(index, pid, record)
+        self._name_index = index
+        
+    @staticmethod
+    def _index_record(index: Dict[str, Set[str]], pid: str, record: PatientRecord):
+        """Add the search tokens of one record to an index"""
+        text = f"{pid} {record.patient_id} {record.patient_name} {record.address}"
+        for token in _tokenize(text):
+            index.setdefault(token, set()).add(pid)
                     
+    @contextmanager
+    def deferred_saves(self):
+        """Hold back registry saves until the block exits, then save once.
+        
+        For bulk generation, where every new patient and every study would
+        otherwise rewrite the whole registry file. Only saves made by the
+        calling thread are deferred. The save happens even if the block
+        raises, so the records created before the error are kept.
+        """
+        deferral = self._deferral
+        deferral.depth = getattr(deferral, 'depth', 0) + 1
+        try:
+            yield self
+        finally:
+            deferral.depth -= 1
+            if not deferral.depth and getattr(deferral, 'pending', False):
+                self.save_registry()
+                
     def save_registry(self):
         """Save patient registry to disk"""
+        deferral = self._deferral
+        if getattr(deferral, 'depth', 0):
+            deferral.pending = True
+            return
+        deferral.pending = False
+        
         data = {}
-        for pid, record in self.patients.items():
+        for pid, record in list(self.patients.items()):
             data[pid] = {
                 'patient_id': record.patient_id,
                 'patient_name': record.patient_name,
@@ -168,8 +224,12 @@ class PatientRegistry:
                 'study_count': record.study_count
             }
         
-        with open(self.registry_path, 'w') as f:
+        with self._save_lock, open(self.registry_path, 'w') as f:
             json.dump(data, f, indent=2)
+        
+        # Records may have been added, edited in place or removed since the
+        # last save, so refresh the search index alongside the file
+        self._rebuild_index()
             
     def _generate_phone(self) -> str:
         """Generate phone number based on pattern"""
@@ -239,8 +299,10 @@ class PatientRegistry:
             study_count=0
         )
         
-        # Store and save
+        # Store and save. The record is indexed right away, since the save
+        # that rebuilds the index may be deferred
         self.patients[patient_id] = record
+        self._index_record(self._name_index, patient_id, record)
         self.save_registry()
         
         return record
@@ -268,16 +330,26 @@ class PatientRegistry:
         
     def search_patients(self, query: str) -> List[PatientRecord]:
         """Search patients by ID, name, or other fields"""
-        query = query.lower()
-        matches = []
+        tokens = _tokenize(query)
+        if not tokens:
+            return list(self.patients.values())
         
-        for record in self.patients.values():
-            if (query in record.patient_id.lower() or 
-                query in record.patient_name.lower() or
-                query in record.address.lower()):
-                matches.append(record)
-                
-        return matches
+        matching_sets = []
+        for token in tokens:
+            ids = self._name_index.get(token)
+            if ids is None:
+                # Partial word - fall back to a substring scan of the
+                # vocabulary, which is much smaller than the registry
+                ids = set()
+                for word, word_ids in self._name_index.items():
+                    if token in word:
+                        ids |= word_ids
+            if not ids:
+                return []
+            matching_sets.append(ids)
+        
+        ids = set.intersection(*matching_sets)
+        return [self.patients[pid] for pid in sorted(ids) if pid in self.patients]
         
     def delete_patient(self, patient_id: str) -> bool:
         """Delete a patient record"""